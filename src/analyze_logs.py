@@ -6,6 +6,8 @@ import re
 import pytz
 from datetime import datetime
 from lib.LogAnalyzer import LogAnalyzer
+from lib.stage_timings import STAGES
+from lib.represent_statistics import REPORT_FORMATS
 from lib.detect_running_components import parse_date_time
 from lib.util import open_log_file
 
@@ -49,6 +51,17 @@ if __name__ == "__main__":
     parser.add_argument("-o", "--out",
                         type=str,
                         help='Directs the output to the file')
+    parser.add_argument('--report_format',
+                        choices=REPORT_FORMATS,
+                        default='text',
+                        help='Format of the output and of "_frequent": ' +
+                        'aligned text or JSON lines, CSV, TSV. ' +
+                        'Default: text')
+    parser.add_argument('--export',
+                        action='store_true',
+                        help='Save the shown messages, the VM timelines ' +
+                        'and the engine commands as Parquet files (with ' +
+                        'pyarrow, .npz files of numpy otherwise)')
     parser.add_argument("-d", "--output_dir",
                         type=str,
                         help='Specify directory to save program output')
@@ -86,10 +99,53 @@ if __name__ == "__main__":
                         action='store_true',
                         help='Print parser warnings about different log ' +
                         'lines format')
+    parser.add_argument('--warn_samples',
+                        type=int,
+                        default=10,
+                        help='Number of sample lines printed with --warn ' +
+                        'for every kind of warning and logfile. Default: 10')
     parser.add_argument('--progressbar',
                         action='store_true',
                         help='Show full-screen progress bar for parsing ' +
                              'process')
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        help='Number of worker processes. Default: number ' +
+                        'of CPUs')
+    parser.add_argument('--lookbehind',
+                        type=int,
+                        default=1024,
+                        help='Kilobytes of a logfile before the time range ' +
+                        'that are searched for VMs and hosts. Default: 1024')
+    parser.add_argument('--timings',
+                        action='store_true',
+                        help='Save wall and CPU time, read bytes and lines ' +
+                        'and found records of every stage and file to ' +
+                        '"_timings.json"')
+    parser.add_argument('--profile',
+                        choices=STAGES,
+                        help='Profile the stage with cProfile in the main ' +
+                        'process and in the workers (pstats files in the ' +
+                        'output directory)')
+    parser.add_argument('--memory_limit',
+                        type=int,
+                        help='Megabytes the analysis should fit in: fewer ' +
+                        'files are parsed at once and the messages are ' +
+                        'merged in low memory mode when the limit would be ' +
+                        'exceeded')
+    parser.add_argument('--trace_memory',
+                        action='store_true',
+                        help='Trace the peak memory of every stage and file ' +
+                        'with tracemalloc (saved with --timings)')
+    parser.add_argument('--out_of_core',
+                        action='store_true',
+                        help='Keep the messages in files on disk instead ' +
+                        'of memory (chosen with --memory_limit when the ' +
+                        'logfiles do not fit in it)')
+    parser.add_argument('--spill_dir',
+                        type=str,
+                        help='Directory of the files of --out_of_core. ' +
+                        'Default: the temporary directory of the system')
     parser.add_argument('--additive',
                         action='store_true',
                         help='Search for messages that contain user-defined' +
@@ -236,91 +292,111 @@ if __name__ == "__main__":
                        host_info,
                        format_file,
                        args.additive,
-                       output_directory)
-    output_descriptor.write('Reading file\'s time range...\n')
-    logs.read_time_ranges(args.reload)
-    output_descriptor.write('Searching for running VMs and hosts...\n')
-    logs.find_vms_and_hosts(args.reload)
-    if args.list_vm_host:
-        output_descriptor.write('------- List of files\' time ranges (UTC) ' +
-                                '-------\n')
-        for log in sorted(logs.total_time_ranges.keys()):
-            output_descriptor.write(('%s: %s %s\n') % (log,
-                                    datetime.utcfromtimestamp(
-                                      logs.total_time_ranges[log][0]).strftime(
-                                        "%Y-%m-%dT%H:%M:%S,%f")[:-3],
-                                    datetime.utcfromtimestamp(
-                                      logs.total_time_ranges[log][1]).strftime(
-                                        "%Y-%m-%dT%H:%M:%S,%f")[:-3]))
-        if (logs.found_logs != []):
-            output_descriptor.write('____________________\n')
-            max_time = max([t for l in logs.total_time_ranges.keys()
-                            for t in logs.total_time_ranges[l]])
-            min_time = min([t for l in logs.total_time_ranges.keys()
-                            for t in logs.total_time_ranges[l]])
-            output_descriptor.write(('Total: %s %s\n') %
-                                    (datetime.utcfromtimestamp(
-                                        min_time).strftime(
+                       output_directory,
+                       args.jobs,
+                       args.lookbehind*1024,
+                       args.timings,
+                       args.profile,
+                       None if args.memory_limit is None
+                       else args.memory_limit*1024*1024,
+                       args.trace_memory,
+                       args.out_of_core,
+                       args.spill_dir,
+                       args.report_format)
+    # every way out (the listing of VMs and hosts, no matches or an error
+    # in a stage) removes the spill directory and writes the timings
+    try:
+        output_descriptor.write('Reading file\'s time range...\n')
+        logs.read_time_ranges(args.reload)
+        output_descriptor.write('Searching for running VMs and hosts...\n')
+        logs.find_vms_and_hosts(args.reload)
+        if args.list_vm_host:
+            output_descriptor.write('------- List of files\' time ranges ' +
+                                    '(UTC) -------\n')
+            for log in sorted(logs.total_time_ranges.keys()):
+                output_descriptor.write(('%s: %s %s\n') % (log,
+                                        datetime.utcfromtimestamp(
+                                            logs.total_time_ranges[log][0]
+                                        ).strftime(
                                             "%Y-%m-%dT%H:%M:%S,%f")[:-3],
-                                     datetime.utcfromtimestamp(
-                                        max_time).strftime(
+                                        datetime.utcfromtimestamp(
+                                            logs.total_time_ranges[log][1]
+                                        ).strftime(
                                             "%Y-%m-%dT%H:%M:%S,%f")[:-3]))
-            output_descriptor.write('\n')
-        output_descriptor.write('------- List of VMs -------\n')
-        for vm in sorted(logs.all_vms.keys()):
-            output_descriptor.write('Name: %s\n' % vm)
-            output_descriptor.write('IDs:')
-            for vmid in sorted(list(logs.all_vms[vm]['id'])):
-                output_descriptor.write(' %s' % vmid)
-            output_descriptor.write('\n')
-            output_descriptor.write('Found on hosts:')
-            for hid in sorted(list(logs.all_vms[vm]['hostids'])):
-                output_descriptor.write(' %s' % hid)
-            output_descriptor.write('\n')
-            output_descriptor.write('\n')
-        if logs.not_running_vms != []:
-            output_descriptor.write('------------------------\n')
-            output_descriptor.write('Created but not running VMs:')
-            for vname in logs.not_running_vms:
-                output_descriptor.write(' %s' % vname)
-            output_descriptor.write('\n')
-        if logs.not_found_vmnames != []:
-            output_descriptor.write('VMs with not found names:')
-            for vid in logs.not_found_vmnames:
-                output_descriptor.write(' %s' % vid)
-            output_descriptor.write('\n')
+            if (logs.found_logs != []):
+                output_descriptor.write('____________________\n')
+                max_time = max([t for l in logs.total_time_ranges.keys()
+                                for t in logs.total_time_ranges[l]])
+                min_time = min([t for l in logs.total_time_ranges.keys()
+                                for t in logs.total_time_ranges[l]])
+                output_descriptor.write(('Total: %s %s\n') %
+                                        (datetime.utcfromtimestamp(
+                                            min_time).strftime(
+                                                "%Y-%m-%dT%H:%M:%S,%f")[:-3],
+                                         datetime.utcfromtimestamp(
+                                            max_time).strftime(
+                                                "%Y-%m-%dT%H:%M:%S,%f")[:-3]))
+                output_descriptor.write('\n')
+            output_descriptor.write('------- List of VMs -------\n')
+            for vm in sorted(logs.all_vms.keys()):
+                output_descriptor.write('Name: %s\n' % vm)
+                output_descriptor.write('IDs:')
+                for vmid in sorted(list(logs.all_vms[vm]['id'])):
+                    output_descriptor.write(' %s' % vmid)
+                output_descriptor.write('\n')
+                output_descriptor.write('Found on hosts:')
+                for hid in sorted(list(logs.all_vms[vm]['hostids'])):
+                    output_descriptor.write(' %s' % hid)
+                output_descriptor.write('\n')
+                output_descriptor.write('\n')
+            if logs.not_running_vms != []:
+                output_descriptor.write('------------------------\n')
+                output_descriptor.write('Created but not running VMs:')
+                for vname in logs.not_running_vms:
+                    output_descriptor.write(' %s' % vname)
+                output_descriptor.write('\n')
+            if logs.not_found_vmnames != []:
+                output_descriptor.write('VMs with not found names:')
+                for vid in logs.not_found_vmnames:
+                    output_descriptor.write(' %s' % vid)
+                output_descriptor.write('\n')
+                output_descriptor.write('------------------------\n')
+            output_descriptor.write('------- List of Hosts -------\n')
+            for host in sorted(logs.all_hosts.keys()):
+                output_descriptor.write('Name: %s\n' % host)
+                output_descriptor.write('IDs:')
+                for hostid in sorted(list(logs.all_hosts[host]['id'])):
+                    output_descriptor.write(' %s' % hostid)
+                output_descriptor.write('\n')
+                output_descriptor.write('Running VMs:')
+                for vid in sorted(list(logs.all_hosts[host]['vmids'])):
+                    output_descriptor.write(' %s' % vid)
+                output_descriptor.write('\n')
+                output_descriptor.write('\n')
             output_descriptor.write('------------------------\n')
-        output_descriptor.write('------- List of Hosts -------\n')
-        for host in sorted(logs.all_hosts.keys()):
-            output_descriptor.write('Name: %s\n' % host)
-            output_descriptor.write('IDs:')
-            for hostid in sorted(list(logs.all_hosts[host]['id'])):
-                output_descriptor.write(' %s' % hostid)
-            output_descriptor.write('\n')
-            output_descriptor.write('Running VMs:')
-            for vid in sorted(list(logs.all_hosts[host]['vmids'])):
-                output_descriptor.write(' %s' % vid)
-            output_descriptor.write('\n')
-            output_descriptor.write('\n')
-        output_descriptor.write('------------------------\n')
-        if logs.not_found_hostnames != []:
-            output_descriptor.write('Hosts with not found names:')
-            for hid in logs.not_found_hostnames:
-                output_descriptor.write(' %s' % hid)
-            output_descriptor.write('\n')
-        exit()
-    output_descriptor.write('Searching for VM tasks...\n')
-    logs.find_vm_tasks(args.reload)
-    logs.find_real_line_num()
-    output_descriptor.write('Loading data...\n')
-    logs.load_data(args.warn, args.progressbar)
-    output_descriptor.write('Analyzing the messages...\n')
-    logs.merge_all_messages()
-    messages, new_fields = logs.find_important_events()
-    output_descriptor.write('Printing messages...\n')
-    # Output file
-    if args.out is not None:
-        output_file = open(os.path.join(output_directory, args.out), 'w')
-    else:
-        output_file = sys.stdout
-    logs.print_errors(messages, new_fields, output_file)
+            if logs.not_found_hostnames != []:
+                output_descriptor.write('Hosts with not found names:')
+                for hid in logs.not_found_hostnames:
+                    output_descriptor.write(' %s' % hid)
+                output_descriptor.write('\n')
+            exit()
+        output_descriptor.write('Searching for VM tasks...\n')
+        logs.find_vm_tasks(args.reload)
+        logs.find_real_line_num()
+        output_descriptor.write('Loading data...\n')
+        if not logs.load_data(args.warn, args.progressbar, args.warn_samples):
+            exit()
+        output_descriptor.write('Analyzing the messages...\n')
+        logs.merge_all_messages()
+        messages, new_fields = logs.find_important_events()
+        output_descriptor.write('Printing messages...\n')
+        # Output file
+        if args.out is not None:
+            output_file = open(os.path.join(output_directory, args.out), 'w')
+        else:
+            output_file = sys.stdout
+        logs.print_errors(messages, new_fields, output_file)
+        if args.export:
+            logs.export_columns(messages, new_fields)
+    finally:
+        logs.close()
@@ -0,0 +1,310 @@
+"""Time, throughput and peak memory of every stage of LogAnalyzer and of its
+hot functions on synthetic logs (generate_logs) of several sizes
+
+The results are written as JSON and can be compared with the JSON of an
+earlier run (the baseline): stages that became slower than the tolerance
+are reported and the exit code is 1.
+
+Run from the src directory:
+python3 benchmarks/analyzer_stages.py [--sizes 5 20] [--output FILE]
+[--baseline FILE]
+
+benchmarks/baseline.json is the stored baseline, regenerated with:
+python3 benchmarks/analyzer_stages.py -j 4 --repeat 3
+--output benchmarks/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from lib.util import open_log_file  # noqa: E402
+from lib.LogAnalyzer import LogAnalyzer  # noqa: E402
+from lib.create_error_definition import find_date_time, \
+    check_constraints  # noqa: E402
+from lib import detect_running_components  # noqa: E402
+from benchmarks import generate_logs  # noqa: E402
+
+
+STAGES = ['read_time_ranges', 'find_vms_and_hosts', 'find_vm_tasks',
+          'find_real_line_num', 'load_data', 'merge_all_messages',
+          'find_important_events', 'print_errors']
+# stages after load_data work on the loaded messages, not on the files
+ROWS_STAGES = ['merge_all_messages', 'find_important_events', 'print_errors']
+TIME_ZONE = '+0000'
+
+
+def generate_corpus(directory, size, seed):
+    args = argparse.Namespace(output_dir=directory, hosts=3, vms=20,
+                              migrations=10, command_rate=6,
+                              traceback_rate=2, error_storms=2, duration=60,
+                              size=size, rotations=1, compress='gz',
+                              start=generate_logs.START, seed=seed)
+    generate_logs.generate(args)
+
+
+def find_logs(directory):
+    # the files analyze_logs.py finds in a directory without --filenames
+    logs = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for name in filenames:
+            if '.log' in name and not name.endswith('.json'):
+                logs += [os.path.join(dirpath, name)]
+    return sorted(logs)
+
+
+def corpus_stats(logs):
+    lines = 0
+    size = 0
+    for log in logs:
+        f = open_log_file(log)
+        for line in f:
+            lines += 1
+            size += len(line)
+        f.close()
+    return {'files': len(logs), 'lines': lines, 'bytes': size}
+
+
+def reset_peak_rss(pids):
+    # Linux resets the peak resident set size (VmHWM) of a process when 5 is
+    # written to its clear_refs
+    for pid in pids:
+        try:
+            with open('/proc/%d/clear_refs' % pid, 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def peak_rss(pid):
+    # Peak resident set size of a process in bytes
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    if pid == os.getpid():
+        # kilobytes on Linux, never reset
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+    return 0
+
+
+def run_stages(directory, output_dir, jobs):
+    # Runs all the stages of analyze_logs.py and returns
+    # {stage: (seconds, peak RSS of the parent, peak RSS of the workers)}
+    # and the number of loaded messages
+    shutil.rmtree(os.path.join(directory, 'log_analyzer_cache'),
+                  ignore_errors=True)
+    devnull = open(os.devnull, "w")
+    logs = LogAnalyzer(devnull, directory, find_logs(directory),
+                       dict([(log, TIME_ZONE)
+                             for log in find_logs(directory)]),
+                       ['All'], [], [], [], [],
+                       os.path.join(os.path.dirname(
+                           os.path.abspath(__file__)), '..',
+                           'format_templates.txt'),
+                       False, output_dir, jobs)
+    # the pids of the pool's workers (they live through all the stages)
+    workers = [process.pid for process in logs.executor.pool._pool]
+    state = {}
+
+    def load_data():
+        logs.load_data(False, False, 10)
+        state['rows'] = sum([len(logs.all_errors[log])
+                             for log in logs.all_errors.keys()])
+
+    def find_important_events():
+        state['messages'], state['new_fields'] = logs.find_important_events()
+
+    calls = {'read_time_ranges': lambda: logs.read_time_ranges(True),
+             'find_vms_and_hosts': lambda: logs.find_vms_and_hosts(True),
+             'find_vm_tasks': lambda: logs.find_vm_tasks(True),
+             'find_real_line_num': logs.find_real_line_num,
+             'load_data': load_data,
+             'merge_all_messages': logs.merge_all_messages,
+             'find_important_events': find_important_events,
+             'print_errors': lambda: logs.print_errors(state['messages'],
+                                                       state['new_fields'],
+                                                       devnull)}
+    results = {}
+    for stage in STAGES:
+        reset_peak_rss([os.getpid()] + workers)
+        start = time.time()
+        calls[stage]()
+        elapsed = time.time() - start
+        results[stage] = (elapsed, peak_rss(os.getpid()),
+                          max([peak_rss(pid) for pid in workers]))
+    hot_state = {'user_events': logs.user_events,
+                 'user_hosts': logs.user_hosts, 'user_vms': logs.user_vms,
+                 'needed_lines': logs.needed_lines,
+                 'subtasks': logs.subtasks, 'vm_timeline': logs.vm_timeline,
+                 'flow_ids': [mes['flow_id'] for l in logs.vm_tasks.keys()
+                              for t in logs.vm_tasks[l].keys()
+                              for mes in logs.vm_tasks[l][t]
+                              if mes.get('flow_id', '') != '']}
+    logs.close()
+    devnull.close()
+    return results, state['rows'], hot_state
+
+
+def engine_lines(directory):
+    f = open_log_file(os.path.join(directory, 'engine.log'))
+    lines = [line for line in f]
+    f.close()
+    return lines
+
+
+def run_functions(directory, hot_state):
+    # {function: (seconds, calls)} of the hot functions of parsing over the
+    # lines of engine.log
+    lines = engine_lines(directory)
+    results = {}
+    start = time.time()
+    date_times = [find_date_time(line, TIME_ZONE) for line in lines]
+    results['parse_date_time'] = (time.time() - start, len(lines))
+    start = time.time()
+    for line in lines:
+        detect_running_components.parse_date_time(line, TIME_ZONE)
+    results['detect_running_components.parse_date_time'] = \
+        (time.time() - start, len(lines))
+    checked = [(line, dt) for line, dt in zip(lines, date_times)
+               if dt is not None]
+    start = time.time()
+    for line_num, (line, dt) in enumerate(checked):
+        check_constraints(line, hot_state['user_events'],
+                          hot_state['user_hosts'], hot_state['user_vms'],
+                          False, dt, hot_state['needed_lines'], line_num,
+                          hot_state['flow_ids'], hot_state['subtasks'],
+                          hot_state['vm_timeline'])
+    results['check_constraints'] = (time.time() - start, len(checked))
+    return results
+
+
+def measure(directory, output_dir, jobs, repeat):
+    # The best time of every stage and function of several runs
+    corpus = corpus_stats(find_logs(directory))
+    stages = {}
+    functions = {}
+    for num in range(repeat):
+        results, rows, hot_state = run_stages(directory, output_dir, jobs)
+        for stage, (elapsed, parent_rss, workers_rss) in results.items():
+            scope = rows if stage in ROWS_STAGES else corpus['lines']
+            best = stages.get(stage)
+            if best is not None and best['seconds'] <= elapsed:
+                continue
+            stages[stage] = {
+                'seconds': elapsed,
+                'mb_per_s': corpus['bytes']/max(elapsed, 1e-6)/1024/1024,
+                'lines_per_s': scope/max(elapsed, 1e-6),
+                'peak_rss_mb': parent_rss/1024/1024,
+                'workers_peak_rss_mb': workers_rss/1024/1024}
+            if stage in ROWS_STAGES:
+                stages[stage]['rows'] = rows
+        # clusterize_messages is the whole find_important_events stage
+        functions['clusterize_messages'] = {
+            'seconds': stages['find_important_events']['seconds'],
+            'calls_per_s': stages['find_important_events']['lines_per_s']}
+        for name, (elapsed, calls) in run_functions(directory,
+                                                    hot_state).items():
+            best = functions.get(name)
+            if best is not None and best['seconds'] <= elapsed:
+                continue
+            functions[name] = {'seconds': elapsed,
+                               'calls_per_s': calls/max(elapsed, 1e-6)}
+    return {'corpus': corpus, 'stages': stages, 'functions': functions}
+
+
+def compare(report, baseline, tolerance):
+    # Prints the ratio of the times to the baseline, returns the number of
+    # stages and functions slower than 1 + tolerance times the baseline
+    regressions = 0
+    for size in sorted(report['sizes'].keys(), key=float):
+        if size not in baseline['sizes'].keys():
+            print('%s MB: no baseline' % size)
+            continue
+        for group in ['stages', 'functions']:
+            current = report['sizes'][size][group]
+            base = baseline['sizes'][size][group]
+            for name in current.keys():
+                if name not in base.keys():
+                    continue
+                ratio = current[name]['seconds'] / \
+                    max(base[name]['seconds'], 1e-6)
+                slower = ratio > 1 + tolerance
+                regressions += slower
+                print('%s MB %s: %.3fs (baseline %.3fs, x%.2f)%s' %
+                      (size, name, current[name]['seconds'],
+                       base[name]['seconds'], ratio,
+                       ' REGRESSION' if slower else ''))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Time every stage of the analysis on synthetic logs ' +
+                    'and compare with a baseline')
+    parser.add_argument('--sizes',
+                        type=float,
+                        nargs='+',
+                        default=[5, 20],
+                        help='Sizes of the generated logs in MB')
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=1,
+                        help='Runs of every size, the best times are kept')
+    parser.add_argument('--work_dir',
+                        type=str,
+                        help='Directory of the generated logs and outputs ' +
+                             '(a temporary one is removed at the end)')
+    parser.add_argument('--output',
+                        type=str,
+                        help='JSON file of the results (stdout otherwise)')
+    parser.add_argument('--baseline',
+                        type=str,
+                        help='JSON file of an earlier run to compare with')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=0.2,
+                        help='Share a stage may be slower than the baseline')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0)
+    args = parser.parse_args()
+    work_dir = args.work_dir
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='analyzer_stages_')
+    report = {'python': platform.python_version(), 'jobs': args.jobs,
+              'sizes': {}}
+    for size in args.sizes:
+        directory = os.path.join(work_dir, 'logs_%g' % size) + os.sep
+        output_dir = os.path.join(work_dir, 'output_%g' % size)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(output_dir, exist_ok=True)
+        generate_corpus(directory, size, args.seed)
+        report['sizes']['%g' % size] = measure(directory, output_dir,
+                                               args.jobs, args.repeat)
+    if args.work_dir is None:
+        shutil.rmtree(work_dir)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=4, sort_keys=True))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance) != 0:
+            exit(1)
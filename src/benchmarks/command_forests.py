@@ -0,0 +1,96 @@
+"""Benchmark of linking engine commands into trees (link_commands) on
+synthetic forests of commands
+
+Run from the src directory: python3 benchmarks/command_forests.py
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from lib.detect_running_components import link_commands  # noqa: E402
+
+
+def command_forest(size, max_children, max_depth, seed):
+    # Commands with 'childs' lists as find_vm_tasks_engine collects them,
+    # some of them have a task and some children are not found in the log
+    rng = random.Random(seed)
+    commands = {}
+    parents = []
+    for num in range(size):
+        command_id = '%08x-%04x' % (rng.getrandbits(32), num)
+        commands[command_id] = {'thread': 'default task-%d' % (num % 64),
+                                'flow_id': '%08x' % rng.getrandbits(32),
+                                'log': 'engine.log',
+                                'first_line_num': num + 1,
+                                'name': 'Command%d' % (num % 50)}
+        if rng.random() < 0.1:
+            commands[command_id]['ztasks'] = [{'id': 'task-%d' % num,
+                                               'log': 'engine.log'}]
+        parent = None
+        while parents != [] and parent is None:
+            candidate, depth = parents[-1]
+            if (len(commands[candidate]['childs']) >= max_children
+                    or rng.random() < 0.3):
+                parents.pop()
+                continue
+            parent = candidate
+        if parent is not None:
+            commands[parent]['childs'] += [{'child_id': command_id,
+                                            'child_name': 'Command'}]
+            if rng.random() < 0.01:
+                commands[parent]['childs'] += [{'child_id': 'missing-%d' % num,
+                                                'child_name': 'Command'}]
+        depth = depth + 1 if parent is not None else 1
+        if depth < max_depth and rng.random() < 0.5:
+            commands[command_id]['childs'] = []
+            parents += [(command_id, depth)]
+    for command_id in commands.keys():
+        if commands[command_id].get('childs') == []:
+            commands[command_id].pop('childs')
+    return commands
+
+
+def count_commands(trees):
+    count = 0
+    stack = list(trees.values())
+    while stack != []:
+        com = stack.pop()
+        count += 1
+        stack += com.get('zchildren', [])
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Time linking synthetic forests of engine commands')
+    parser.add_argument('--sizes',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='Numbers of commands in the forests')
+    parser.add_argument('--max_children',
+                        type=int,
+                        default=8,
+                        help='Maximal number of children of a command')
+    parser.add_argument('--max_depth',
+                        type=int,
+                        default=5,
+                        help='Maximal depth of the trees')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0)
+    args = parser.parse_args()
+    for size in args.sizes:
+        commands = command_forest(size, args.max_children, args.max_depth,
+                                  args.seed)
+        start = time.time()
+        trees, command_lvl = link_commands(None, commands)
+        elapsed = time.time() - start
+        print('%d commands: %d trees, %d linked, %d levels, %.3fs' %
+              (size, len(trees), count_commands(trees),
+               max(command_lvl.values()) if command_lvl != {} else 0,
+               elapsed))
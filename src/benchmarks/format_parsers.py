@@ -0,0 +1,103 @@
+"""Equivalence and throughput of the split-based parsers of format_parsers
+against the regexps of the templates on logfiles
+
+Run from the src directory:
+python3 benchmarks/format_parsers.py LOGFILE [LOGFILE ...]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from lib.util import open_log_file  # noqa: E402
+from lib.log_formats import read_templates, detect_file_format  # noqa: E402
+from lib.format_parsers import FIELDS_PARSERS, re_date_time  # noqa: E402
+
+
+def regexp_fields(template, names, line):
+    fields = template.search(line)
+    if fields is None:
+        return None
+    fields = fields.groupdict()
+    return tuple([fields[name] for name in names])
+
+
+def compare_file(log, formats_templates, max_mismatches):
+    # Returns (template name, lines, bytes, regexp time, parser time,
+    # lines parsed without the regexp, mismatches) or None
+    regexps = detect_file_format(log, formats_templates)
+    if regexps is None or regexps == [] or \
+            regexps[0] not in FIELDS_PARSERS.keys():
+        return None
+    fmt = [fmt for fmt in formats_templates if fmt['regexp'] == regexps[0]][0]
+    template = fmt['compiled']
+    parser = FIELDS_PARSERS[regexps[0]]
+    names = tuple(sorted([name for name in template.groupindex.keys()
+                          if name != 'date_time']))
+    f = open_log_file(log)
+    # only the lines with a date_time are matched with the template
+    lines = [line.strip() for line in f if re_date_time.match(line)]
+    f.close()
+    start = time.time()
+    expected = [regexp_fields(template, names, line) for line in lines]
+    regexp_time = time.time() - start
+    start = time.time()
+    # the parser falls back to the regexp when it returns None
+    parsed = [parser(line) for line in lines]
+    parsed = [regexp_fields(template, names, line) if fields is None
+              else fields for line, fields in zip(lines, parsed)]
+    parser_time = time.time() - start
+    fast = len([fields for fields in map(parser, lines)
+                if fields is not None])
+    mismatches = 0
+    for line, fields, expected_fields in zip(lines, parsed, expected):
+        if fields == expected_fields:
+            continue
+        mismatches += 1
+        if mismatches <= max_mismatches:
+            print('Mismatch in %s:\n    %s\n    regexp: %s\n    parser: %s' %
+                  (log, line, expected_fields, fields))
+    return fmt['name'], len(lines), sum([len(line) for line in lines]), \
+        regexp_time, parser_time, fast, mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Compare the split-based parsers of engine, vdsm and ' +
+                    'libvirtd lines with the template regexps')
+    parser.add_argument('logfiles',
+                        type=str,
+                        nargs='+',
+                        help='Logfiles to parse')
+    parser.add_argument('--format_file',
+                        type=str,
+                        default=os.path.join(os.path.dirname(
+                            os.path.abspath(__file__)), '..',
+                            'format_templates.txt'),
+                        help='Filename with formats of log files')
+    parser.add_argument('--mismatches',
+                        type=int,
+                        default=10,
+                        help='Number of printed mismatching lines per file')
+    args = parser.parse_args()
+    formats_templates = read_templates(sys.stdout, args.format_file)
+    all_mismatches = 0
+    for log in args.logfiles:
+        result = compare_file(log, formats_templates, args.mismatches)
+        if result is None:
+            print('%s: no split-based parser' % log)
+            continue
+        name, lines, size, regexp_time, parser_time, fast, mismatches = \
+            result
+        all_mismatches += mismatches
+        print('%s (%s): %d lines, %d split without regexp, %d mismatches' %
+              (log, name, lines, fast, mismatches))
+        for label, elapsed in [('regexp', regexp_time),
+                               ('parser', parser_time)]:
+            print('    %s: %.3fs, %.0f lines/s, %.1f MB/s' %
+                  (label, elapsed, lines/max(elapsed, 1e-6),
+                   size/max(elapsed, 1e-6)/1024/1024))
+    if all_mismatches != 0:
+        exit(1)
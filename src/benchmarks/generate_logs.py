@@ -0,0 +1,824 @@
+"""Synthetic oVirt logs for benchmarks: engine.log and for every host
+vdsm.log, libvirtd.log, sanlock.log and qemu logs of its VMs
+
+The logs contain the lines that the analyzer recognizes: VMs and hosts,
+VM starts, stops, suspends and migrations, engine commands with async tasks,
+libvirtd jobs and qemu monitor calls, tracebacks, multiline messages, lines
+that do not match the format and storms of errors. Ordinary lines are added
+until the logs reach the target size. The older parts of the logs can be
+written as compressed rotations.
+
+Run from the src directory: python3 benchmarks/generate_logs.py OUTPUT_DIR
+"""
+import os
+import gzip
+import lzma
+import heapq
+import random
+import argparse
+from datetime import datetime
+
+
+# time zone of the engine, vdsm and sanlock logs
+LOCAL_OFFSET = -4*3600
+START = '2017-05-12T07:00:00'
+STORM_LENGTH = 30
+# share of the ordinary lines written to every kind of logs
+FILLER_WEIGHTS = {'engine': 0.45, 'vdsm': 0.35, 'libvirtd': 0.18,
+                  'sanlock': 0.02}
+
+
+def engine_time(t):
+    local = datetime.utcfromtimestamp(t + LOCAL_OFFSET)
+    return local.strftime('%Y-%m-%d %H:%M:%S') + \
+        ',%03d-04' % (local.microsecond//1000)
+
+
+def vdsm_time(t):
+    local = datetime.utcfromtimestamp(t + LOCAL_OFFSET)
+    return local.strftime('%Y-%m-%d %H:%M:%S') + \
+        ',%03d-0400' % (local.microsecond//1000)
+
+
+def libvirtd_time(t):
+    utc = datetime.utcfromtimestamp(t)
+    return utc.strftime('%Y-%m-%d %H:%M:%S') + \
+        '.%03d+0000:' % (utc.microsecond//1000)
+
+
+def qemu_time(t):
+    return datetime.utcfromtimestamp(t).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def sanlock_time(t):
+    local = datetime.utcfromtimestamp(t + LOCAL_OFFSET)
+    return local.strftime('%Y-%m-%d %H:%M:%S') + '-0400'
+
+
+class LogStream:
+    # One logfile and its rotations. Lines are scheduled with their time and
+    # written in the order of time when the clock passes them, so lines of
+    # operations that last for a while can be scheduled at once
+    def __init__(self, path, time_format, start, duration, rotations,
+                 compress):
+        self.path = path
+        self.time_format = time_format
+        self.start = start
+        self.duration = duration
+        self.rotations = rotations
+        self.compress = compress
+        self.pending = []
+        self.seq = 0
+        self.last = start
+        self.part = None
+        self.f = None
+        self.files = []
+        self.written = 0
+        self.lines = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def schedule(self, t, line, continuation=()):
+        # continuation - lines without date_time after the line
+        self.seq += 1
+        heapq.heappush(self.pending, (t, self.seq, line, continuation))
+        return len(line) + 30 + sum([len(cont) + 1 for cont in continuation])
+
+    def advance(self, now):
+        while self.pending != [] and self.pending[0][0] <= now:
+            t, seq, line, continuation = heapq.heappop(self.pending)
+            self.write(t, line, continuation)
+
+    def open_part(self, t):
+        # the parts of the rotations are numbered back from the current one
+        part = min(int((t - self.start)*(self.rotations + 1)/self.duration),
+                   self.rotations)
+        if part == self.part:
+            return
+        if self.f is not None:
+            self.f.close()
+        self.part = part
+        back = self.rotations - part
+        if back == 0:
+            name = self.path
+            self.f = open(name, 'w')
+        elif self.compress == 'xz':
+            name = '%s.%d.xz' % (self.path, back)
+            self.f = lzma.open(name, 'wt')
+        elif self.compress == 'gz':
+            name = '%s.%d.gz' % (self.path, back)
+            self.f = gzip.open(name, 'wt')
+        else:
+            name = '%s.%d' % (self.path, back)
+            self.f = open(name, 'w')
+        self.files += [name]
+
+    def write(self, t, line, continuation):
+        t = max(t, self.last)
+        self.last = t
+        self.open_part(t)
+        text = '%s %s\n' % (self.time_format(t), line)
+        if continuation != ():
+            text += '\n'.join(continuation) + '\n'
+        self.f.write(text)
+        self.written += len(text)
+        self.lines += 1 + len(continuation)
+
+    def close(self):
+        self.advance(float('inf'))
+        if self.f is not None:
+            self.f.close()
+
+
+class Cluster:
+    # Hosts and VMs of the engine and the logs they write to
+    def __init__(self, args, rng, start):
+        self.rng = rng
+        self.start = start
+        duration = args.duration*60
+        self.hosts = ['host%02d' % num for num in range(args.hosts)]
+        self.host_ids = dict([(host, self.uuid()) for host in self.hosts])
+        self.vms = ['vm%03d' % num for num in range(args.vms)]
+        self.vm_ids = dict([(vm, self.uuid()) for vm in self.vms])
+        self.vm_host = dict([(vm, None) for vm in self.vms])
+        self.storage_id = self.uuid()
+        self.engine = LogStream(os.path.join(args.output_dir, 'engine.log'),
+                                engine_time, start, duration, args.rotations,
+                                args.compress)
+        self.vdsm = {}
+        self.libvirtd = {}
+        self.sanlock = {}
+        self.qemu = {}
+        for host in self.hosts:
+            host_dir = os.path.join(args.output_dir, host)
+            self.vdsm[host] = LogStream(os.path.join(host_dir, 'vdsm.log'),
+                                        vdsm_time, start, duration,
+                                        args.rotations, args.compress)
+            self.libvirtd[host] = LogStream(
+                os.path.join(host_dir, 'libvirtd.log'), libvirtd_time, start,
+                duration, args.rotations, args.compress)
+            self.sanlock[host] = LogStream(
+                os.path.join(host_dir, 'sanlock.log'), sanlock_time, start,
+                duration, 0, None)
+            for vm in self.vms:
+                self.qemu[(host, vm)] = LogStream(
+                    os.path.join(host_dir, 'qemu', vm + '.log'), qemu_time,
+                    start, duration, 0, None)
+        self.log_id = 0
+        self.monitor_id = 0
+        self.task = 0
+
+    def streams(self):
+        return [self.engine] + list(self.vdsm.values()) + \
+            list(self.libvirtd.values()) + list(self.sanlock.values()) + \
+            list(self.qemu.values())
+
+    def uuid(self):
+        bits = '%032x' % self.rng.getrandbits(128)
+        return '-'.join([bits[:8], bits[8:12], bits[12:16], bits[16:20],
+                         bits[20:]])
+
+    def flow(self):
+        return '%08x' % self.rng.getrandbits(32)
+
+    def engine_line(self, t, level, logger, thread, flow, message,
+                    continuation=()):
+        return self.engine.schedule(t, '%-5s [%s] (%s) [%s] %s' %
+                                    (level, logger, thread, flow, message),
+                                    continuation)
+
+    def vdsm_line(self, t, host, level, thread, sender, message, source,
+                  continuation=()):
+        return self.vdsm[host].schedule(t, '%-5s (%s) [%s] %s (%s)' %
+                                        (level, thread, sender, message,
+                                         source), continuation)
+
+    def libvirtd_line(self, t, host, level, function, message):
+        return self.libvirtd[host].schedule(
+            t, '%d: %s : %s : %s' % (self.rng.randint(2000, 2400), level,
+                                     function, message))
+
+    def vds_command(self, t, thread, flow, name, host, params, result,
+                    duration):
+        # START and FINISH of a VDS command, returns the time of FINISH
+        self.log_id += 1
+        size = self.engine_line(
+            t, 'INFO', 'org.ovirt.engine.core.vdsbroker.vdsbroker.%sCommand' %
+            name, thread, flow, 'START, %sCommand(HostName = %s, %sCommand'
+            'Parameters:{hostId=\'%s\'%s}), log id: %x' %
+            (name, host, name, self.host_ids[host], params, self.log_id))
+        size += self.engine_line(
+            t + duration, 'INFO',
+            'org.ovirt.engine.core.vdsbroker.vdsbroker.%sCommand' % name,
+            thread, flow, 'FINISH, %sCommand, return: %s, log id: %x' %
+            (name, result, self.log_id))
+        return size
+
+    def libvirtd_job(self, t, host, job, duration):
+        thread = self.rng.randint(2000, 2400)
+        size = self.libvirtd_line(
+            t, host, 'debug', 'virThreadJobSet:96',
+            'Thread %d (virNetServerHandleJob) is now running job %s' %
+            (thread, job))
+        size += self.libvirtd_line(
+            t + duration, host, 'debug', 'virThreadJobClear:121',
+            'Thread %d (virNetServerHandleJob) finished job %s with ret=0' %
+            (thread, job))
+        return size
+
+    def monitor_call(self, t, host, command, duration):
+        self.monitor_id += 1
+        mon = '0x7f%08x' % (hash(host) & 0xffffffff)
+        size = self.libvirtd_line(
+            t, host, 'info', 'qemuMonitorIOWrite:534',
+            'QEMU_MONITOR_IO_WRITE: mon=%s buf={"execute":"%s",'
+            '"id":"libvirt-%d"}' % (mon, command, self.monitor_id))
+        size += self.libvirtd_line(
+            t + duration, host, 'info', 'qemuMonitorJSONIOProcessLine:211',
+            'QEMU_MONITOR_RECV_REPLY: mon=%s buf={"return": {}, '
+            '"id": "libvirt-%d"}' % (mon, self.monitor_id))
+        return size
+
+    def domain_xml(self, t, host, vm):
+        # vdsm dumps the XML of the domain in a multiline message, the
+        # name and the uuid are logged on separate lines too
+        vm_id = self.vm_ids[vm]
+        thread = 'vm/%s' % vm_id[:8]
+        size = self.vdsm_line(
+            t, host, 'INFO', thread, 'virt.vm',
+            "(vmId='%s') <name>%s</name>" % (vm_id, vm), 'vm:2200')
+        size += self.vdsm_line(
+            t + 0.001, host, 'INFO', thread, 'virt.vm',
+            "(vmId='%s') <uuid>%s</uuid>" % (vm_id, vm_id), 'vm:2200')
+        size += self.vdsm[host].schedule(
+            t + 0.002, "INFO  (%s) [virt.vm] (vmId='%s') <?xml version='1.0'"
+            " encoding='utf-8'?>" % (thread, vm_id),
+            ['<domain xmlns:ovirt="http://ovirt.org/vm/tune/1.0" '
+             'type="kvm">', '    <name>%s</name>' % vm,
+             '    <uuid>%s</uuid>' % vm_id,
+             '    <memory>1048576</memory>', '</domain> (vm:2205)'])
+        # libvirtd logs the definition of the domain line by line
+        for offset, tag, value in [(0.01, 'name', vm), (0.011, 'uuid', vm_id),
+                                   (0.012, 'hostname', host),
+                                   (0.013, 'hostuuid', self.host_ids[host])]:
+            size += self.libvirtd_line(t + offset, host, 'debug',
+                                       'virDomainDefParseXML:17055',
+                                       '<%s>%s</%s>' % (tag, value, tag))
+        return size
+
+    def qemu_start(self, t, host, vm):
+        return self.qemu[(host, vm)].schedule(
+            t, 'starting up libvirt version: 2.0.0, package: 10.el7, qemu '
+            'version: 2.6.0 (qemu-kvm-rhev-2.6.0-28.el7), hostname: %s' % host,
+            ['LC_ALL=C PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin '
+             'QEMU_AUDIO_DRV=spice /usr/libexec/qemu-kvm -name guest=%s,'
+             'debug-threads=on -uuid %s' % (vm, self.vm_ids[vm])])
+
+    def qemu_stop(self, t, host, vm):
+        return self.qemu[(host, vm)].schedule(
+            t, 'qemu-kvm: terminating on signal 15 from pid %d' %
+            self.rng.randint(2000, 2400))
+
+    # operations, every one returns the number of written bytes
+
+    def run_vm(self, t, vm, host):
+        rng = self.rng
+        vm_id = self.vm_ids[vm]
+        thread = 'default task-%d' % rng.randint(1, 30)
+        flow = self.flow()
+        logger = 'org.ovirt.engine.core.bll.RunVmCommand'
+        size = self.engine_line(
+            t, 'INFO', logger, thread, flow,
+            "Lock Acquired to object 'EngineLock:{exclusiveLocks='[%s=VM]', "
+            "sharedLocks=''}'" % vm)
+        size += self.engine_line(
+            t + 0.01, 'INFO', logger, thread, flow,
+            'Running command: RunVmCommand internal: false. Entities '
+            'affected :  ID: %s Type: VMAction group RUN_VM with role type '
+            'USER' % vm_id)
+        # a few creations take long
+        duration = rng.choice([0.05, 0.1, 0.2, 0.3, 6.5])
+        size += self.vds_command(
+            t + 0.02, thread, flow, 'CreateVDS', host,
+            ", vmId='%s', vm='VM [%s]'" % (vm_id, vm), 'WaitForLaunch',
+            duration)
+        size += self.vdsm_line(
+            t + 0.03, host, 'INFO', 'jsonrpc/%d' % rng.randint(0, 7),
+            'api.virt', "START create(vmParams={'vmId': '%s', 'vmName': "
+            "'%s', 'memSize': 1024}) from=::ffff:10.35.0.1,53140" %
+            (vm_id, vm), 'api:46')
+        size += self.vdsm_line(
+            t + 0.04, host, 'INFO', 'vm/%s' % vm_id[:8], 'virt.vm',
+            "(vmId='%s') {'vmName': u'%s', 'memSize': 1024, 'smp': '1'}" %
+            (vm_id, vm), 'vm:1993')
+        size += self.domain_xml(t + 0.05, host, vm)
+        size += self.libvirtd_job(t + 0.06, host,
+                                  'remoteDispatchDomainCreateXML',
+                                  duration - 0.01)
+        size += self.monitor_call(t + 0.07, host, 'qmp_capabilities',
+                                  rng.choice([0.01, 0.02, 1.5]))
+        size += self.qemu_start(t + 0.07, host, vm)
+        size += self.engine_line(
+            t + duration + 0.5, 'INFO',
+            'org.ovirt.engine.core.vdsbroker.monitoring.VmAnalyzer',
+            'ForkJoinPool-1-worker-%d' % rng.randint(1, 9), '',
+            "VM '%s'(%s) moved from 'WaitForLaunch' --> 'PoweringUp'" %
+            (vm_id, vm))
+        size += self.engine_line(
+            t + duration + 0.6, 'INFO',
+            'org.ovirt.engine.core.dal.dbbroker.auditloghandling.'
+            'AuditLogDirector', thread, flow,
+            'EVENT_ID: USER_RUN_VM(32), Correlation ID: %s, Job ID: %s, '
+            'VM %s started on Host %s' % (flow, self.uuid(), vm, host))
+        size += self.engine_line(
+            t + duration + 0.7, 'INFO', logger, thread, flow,
+            "Ending command 'org.ovirt.engine.core.bll.RunVmCommand' "
+            "successfully.")
+        self.vm_host[vm] = host
+        return size
+
+    def stop_vm(self, t, vm):
+        host = self.vm_host[vm]
+        vm_id = self.vm_ids[vm]
+        thread = 'default task-%d' % self.rng.randint(1, 30)
+        flow = self.flow()
+        logger = 'org.ovirt.engine.core.bll.StopVmCommand'
+        size = self.engine_line(
+            t, 'INFO', logger, thread, flow,
+            'Running command: StopVmCommand internal: false. Entities '
+            'affected :  ID: %s Type: VMAction group STOP_VM with role type '
+            'USER' % vm_id)
+        size += self.vds_command(t + 0.01, thread, flow, 'DestroyVDS', host,
+                                 ", vmId='%s'" % vm_id, '', 0.2)
+        size += self.vdsm_line(
+            t + 0.02, host, 'INFO', 'jsonrpc/%d' % self.rng.randint(0, 7),
+            'api.virt', "START destroy(gracefulAttempts=1) from=::ffff:"
+            "10.35.0.1,53140, vmId='%s'" % vm_id, 'api:46')
+        size += self.libvirtd_job(t + 0.03, host,
+                                  'remoteDispatchDomainDestroyFlags', 0.1)
+        size += self.libvirtd_line(
+            t + 0.15, host, 'debug', 'virDomainObjEndAPI:2811',
+            'release domain 0x7f3c%08x %s %s' %
+            (self.rng.getrandbits(32), vm, vm_id))
+        size += self.qemu_stop(t + 0.1, host, vm)
+        size += self.engine_line(
+            t + 0.3, 'INFO',
+            'org.ovirt.engine.core.dal.dbbroker.auditloghandling.'
+            'AuditLogDirector', thread, flow,
+            'EVENT_ID: USER_STOP_VM(33), VM %s is down. Exit message: '
+            'User shut down from within the guest' % vm)
+        size += self.engine_line(
+            t + 0.4, 'INFO', logger, thread, flow,
+            "Ending command 'org.ovirt.engine.core.bll.StopVmCommand' "
+            "successfully.")
+        self.vm_host[vm] = None
+        return size
+
+    def suspend_vm(self, t, vm):
+        host = self.vm_host[vm]
+        thread = 'default task-%d' % self.rng.randint(1, 30)
+        flow = self.flow()
+        size = self.engine_line(
+            t, 'INFO', 'org.ovirt.engine.core.bll.HibernateVmCommand',
+            thread, flow, 'Running command: HibernateVmCommand internal: '
+            'false. Entities affected :  ID: %s Type: VMAction' %
+            self.vm_ids[vm])
+        size += self.monitor_call(t + 0.1, host, 'stop', 0.05)
+        size += self.engine_line(
+            t + 2, 'INFO',
+            'org.ovirt.engine.core.dal.dbbroker.auditloghandling.'
+            'AuditLogDirector', thread, flow,
+            'EVENT_ID: USER_SUSPEND_VM_OK(503), VM %s on Host %s is '
+            'suspended.' % (vm, host))
+        return size
+
+    def migrate_vm(self, t, vm, destination):
+        rng = self.rng
+        source = self.vm_host[vm]
+        vm_id = self.vm_ids[vm]
+        thread = 'default task-%d' % rng.randint(1, 30)
+        flow = self.flow()
+        logger = 'org.ovirt.engine.core.bll.MigrateVmToServerCommand'
+        duration = rng.randint(5, 40)
+        size = self.engine_line(
+            t, 'INFO', logger, thread, flow,
+            'Running command: MigrateVmToServerCommand internal: false. '
+            'Entities affected :  ID: %s Type: VMAction group MIGRATE_VM '
+            'with role type USER' % vm_id)
+        size += self.vds_command(
+            t + 0.01, thread, flow, 'MigrateVDS', source,
+            ", vmId='%s', srcHost='%s', dstVdsId='%s'" %
+            (vm_id, source, self.host_ids[destination]), 'MigratingFrom',
+            0.1)
+        size += self.engine_line(
+            t + 0.2, 'INFO',
+            'org.ovirt.engine.core.dal.dbbroker.auditloghandling.'
+            'AuditLogDirector', thread, flow,
+            'EVENT_ID: VM_MIGRATION_START(62), Correlation ID: %s, Migration '
+            'started (VM: %s, Source: %s, Destination: %s, User: '
+            'admin@internal-authz).' % (flow, vm, source, destination))
+        size += self.vdsm_line(
+            t + 0.05, source, 'INFO', 'jsonrpc/%d' % rng.randint(0, 7),
+            'api.virt', "START migrate(params={'dstqemu': '10.35.0.2', "
+            "'vmId': '%s', 'dst': '%s:54321'})" % (vm_id, destination),
+            'api:46')
+        size += self.libvirtd_job(t + 0.1, source,
+                                  'remoteDispatchDomainMigratePerform3Params',
+                                  duration)
+        size += self.monitor_call(t + 0.2, source, 'query-migrate',
+                                  rng.choice([0.01, 2.5]))
+        size += self.domain_xml(t + 0.3, destination, vm)
+        size += self.qemu_start(t + 0.3, destination, vm)
+        size += self.vdsm_line(
+            t + duration, source, 'INFO', 'migsrc/%s' % vm_id[:8], 'virt.vm',
+            "(vmId='%s') migration took %d seconds to complete" %
+            (vm_id, duration), 'migration:455')
+        size += self.qemu_stop(t + duration + 0.1, source, vm)
+        size += self.engine_line(
+            t + duration + 1, 'INFO',
+            'org.ovirt.engine.core.dal.dbbroker.auditloghandling.'
+            'AuditLogDirector', 'ForkJoinPool-1-worker-%d' %
+            rng.randint(1, 9), '', 'EVENT_ID: VM_MIGRATION_DONE(63), '
+            'Correlation ID: %s, Migration completed (VM: %s, Source: %s, '
+            'Destination: %s, Duration: %d seconds, Total: %d seconds, '
+            'Actual downtime: (N/A))' % (flow, vm, source, destination,
+                                         duration, duration + 1))
+        self.vm_host[vm] = destination
+        return size
+
+    def add_disk(self, t):
+        # a command with a child command and an async task on the SPM
+        rng = self.rng
+        thread = 'default task-%d' % rng.randint(1, 30)
+        flow = self.flow()
+        command_id = self.uuid()
+        child_id = self.uuid()
+        self.task += 1
+        task_id = self.uuid()
+        vm = rng.choice(self.vms)
+        host = rng.choice(self.hosts)
+        duration = rng.choice([2, 5, 10, 90])
+        logger = 'org.ovirt.engine.core.bll.storage.disk.AddDiskCommand'
+        size = self.engine_line(
+            t, 'INFO', logger, thread, flow,
+            'Running command: AddDiskCommand internal: false. Entities '
+            'affected :  ID: %s Type: VMAction group CONFIGURE_VM_STORAGE '
+            'with role type USER' % self.vm_ids[vm])
+        size += self.engine_line(
+            t + 0.01, 'INFO', 'org.ovirt.engine.core.bll.storage.disk.image.'
+            'AddImageFromScratchCommand', thread, flow,
+            'Running command: AddImageFromScratchCommand internal: true. '
+            'Entities affected :  ID: %s Type: Storage' % self.storage_id)
+        size += self.vds_command(
+            t + 0.02, thread, flow, 'CreateImageVDS', host,
+            ", storageDomainId='%s'" % self.storage_id, task_id, 0.3)
+        size += self.engine_line(
+            t + 0.4, 'INFO', 'org.ovirt.engine.core.bll.tasks.'
+            'CommandAsyncTask', thread, flow, 'CommandAsyncTask::Adding '
+            "CommandMultiAsyncTasks object for command '%s'" % command_id)
+        size += self.engine_line(
+            t + 0.41, 'INFO', 'org.ovirt.engine.core.bll.'
+            'CommandMultiAsyncTasks', thread, flow,
+            "CommandMultiAsyncTasks::attachTask: Attaching task '%s' to "
+            "command '%s'." % (task_id, command_id))
+        size += self.engine_line(
+            t + 0.42, 'INFO', 'org.ovirt.engine.core.bll.tasks.'
+            'AsyncTaskManager', thread, flow,
+            "Adding task '%s' (Parent Command 'AddImageFromScratch', "
+            "Parameters Type 'org.ovirt.engine.core.common.asynctasks."
+            "AsyncTaskParameters'), polling hasn't started yet.." % task_id)
+        poll_thread = 'DefaultQuartzScheduler%d' % rng.randint(1, 10)
+        for wait in range(10, duration, 10):
+            size += self.engine_line(
+                t + wait, 'INFO', 'org.ovirt.engine.core.bll.'
+                'ConcurrentChildCommandsExecutionCallback', poll_thread, flow,
+                "Command 'AddDisk' (id: '%s') waiting on child command id: "
+                "'%s' type:'AddImageFromScratch' to complete" %
+                (command_id, child_id))
+        size += self.engine_line(
+            t + duration, 'INFO', 'org.ovirt.engine.core.bll.tasks.'
+            'SPMAsyncTask', poll_thread, flow, "BaseAsyncTask::"
+            "removeTaskFromDB: Removed task '%s' from DataBase" % task_id)
+        size += self.engine_line(
+            t + duration + 0.1, 'INFO', logger, poll_thread, flow,
+            "Ending command 'org.ovirt.engine.core.bll.storage.disk."
+            "AddDiskCommand' successfully.")
+        size += self.vdsm_line(
+            t + 0.1, host, 'INFO', 'jsonrpc/%d' % rng.randint(0, 7),
+            'vdsm.api', "START createVolume(sdUUID=u'%s', spUUID=u'%s') "
+            "from=::ffff:10.35.0.1,53140, task_id=%s" %
+            (self.storage_id, self.uuid(), task_id), 'api:46')
+        return size
+
+    def engine_traceback(self, t):
+        rng = self.rng
+        host = rng.choice(self.hosts)
+        frames = ['\tat org.ovirt.engine.core.vdsbroker.vdsbroker.'
+                  'VdsBrokerCommand.executeCommand(VdsBrokerCommand.java:%d) '
+                  '[vdsbroker.jar:]' % rng.randint(50, 500)
+                  for num in range(rng.randint(3, 30))]
+        return self.engine_line(
+            t, 'ERROR', 'org.ovirt.engine.core.vdsbroker.vdsbroker.'
+            'GetStatsVDSCommand', 'DefaultQuartzScheduler%d' %
+            rng.randint(1, 10), '', "Command 'GetStatsVDSCommand(HostName = "
+            "%s, VdsIdAndVdsVDSCommandParametersBase:{hostId='%s'})' "
+            "execution failed: VDSGenericException: VDSNetworkException: "
+            "Heartbeat exceeded" % (host, self.host_ids[host]),
+            frames +
+            ['Caused by: java.net.SocketTimeoutException: Read timed out',
+             '\t... %d more' % rng.randint(5, 40)])
+
+    def vdsm_traceback(self, t):
+        rng = self.rng
+        host = rng.choice(self.hosts)
+        vm = rng.choice(self.vms)
+        return self.vdsm_line(
+            t, host, 'ERROR', 'vm/%s' % self.vm_ids[vm][:8], 'virt.vm',
+            "(vmId='%s') The vm start process failed" % self.vm_ids[vm],
+            'vm:631',
+            ['Traceback (most recent call last):',
+             '  File "/usr/lib/python2.7/site-packages/vdsm/virt/vm.py", '
+             'line 562, in _startUnderlyingVm',
+             '    self._run()',
+             '  File "/usr/lib/python2.7/site-packages/vdsm/virt/vm.py", '
+             'line 2021, in _run',
+             '    self._connection.createXML(domxml, flags),',
+             'libvirtError: internal error: process exited while connecting '
+             'to monitor'])
+
+    def error_storm_second(self, t, host):
+        # a host stops responding: errors in all the logs for a while
+        rng = self.rng
+        size = 0
+        for num in range(rng.randint(3, 8)):
+            size += self.engine_line(
+                t + num*0.1, 'ERROR', 'org.ovirt.engine.core.dal.dbbroker.'
+                'auditloghandling.AuditLogDirector',
+                'DefaultQuartzScheduler%d' % rng.randint(1, 10), '',
+                'EVENT_ID: VDS_BROKER_COMMAND_FAILURE(10,802), VDSM %s '
+                'command GetStatsVDS failed: Heartbeat exceeded' % host)
+            size += self.vdsm_line(
+                t + num*0.1, host, 'ERROR', 'jsonrpc/%d' % rng.randint(0, 7),
+                'storage.TaskManager.Task', "(Task='%s') Unexpected error" %
+                self.uuid(), 'task:870')
+        size += self.engine_line(
+            t + 0.9, 'WARN', 'org.ovirt.engine.core.vdsbroker.'
+            'VdsManager', 'DefaultQuartzScheduler%d' % rng.randint(1, 10), '',
+            "Host '%s' is not responding. It will stay in Connecting state "
+            "for a grace period of 60 seconds and after that an attempt to "
+            "fence the host will be issued." % host)
+        size += self.sanlock[host].schedule(
+            t + 0.5, '%d [%d]: s1 renewal error -202 delta_length 10 '
+            'last_success %d' % (rng.randint(1000, 1100),
+                                 rng.randint(2000, 2400),
+                                 rng.randint(10000, 20000)))
+        return size
+
+    def filler(self, t, kind):
+        # ordinary lines, some of them mention VMs and hosts
+        rng = self.rng
+        host = rng.choice(self.hosts)
+        vm = rng.choice(self.vms)
+        vm_id = self.vm_ids[vm]
+        choice = rng.random()
+        if kind == 'engine':
+            if choice < 0.3:
+                return self.vds_command(
+                    t, 'DefaultQuartzScheduler%d' % rng.randint(1, 10),
+                    self.flow(), 'GetAllVmStatsVDS', host, '', '', 0.01)
+            if choice < 0.5:
+                return self.engine_line(
+                    t, 'INFO', 'org.ovirt.engine.core.vdsbroker.monitoring.'
+                    'VmsStatisticsFetcher', 'DefaultQuartzScheduler%d' %
+                    rng.randint(1, 10), '', "Fetched %d VMs from VDS '%s'" %
+                    (rng.randint(0, len(self.vms)), self.host_ids[host]))
+            if choice < 0.6:
+                return self.engine_line(
+                    t, 'INFO', 'org.ovirt.engine.core.bll.lock.'
+                    'InMemoryLockManager', 'default task-%d' %
+                    rng.randint(1, 30), self.flow(),
+                    "Lock freed to object 'EngineLock:{exclusiveLocks="
+                    "'[%s=VM_NAME]', sharedLocks=''}'" % vm)
+            if choice < 0.7:
+                return self.engine_line(
+                    t, 'INFO', 'org.ovirt.engine.core.vdsbroker.monitoring.'
+                    'VmAnalyzer', 'ForkJoinPool-1-worker-%d' %
+                    rng.randint(1, 9), '', "VM '%s'(%s) was unexpectedly "
+                    "detected as 'Up' on VDS '%s'(%s)" %
+                    (vm_id, vm, self.host_ids[host], host))
+            if choice < 0.75:
+                return self.engine_line(
+                    t, 'INFO', 'org.ovirt.engine.core.bll.UpdateVmCommand',
+                    'default task-%d' % rng.randint(1, 30), self.flow(),
+                    "Updating VM vmId='%s', vmName=%s, hostId='%s', "
+                    "HostName=%s, status=Up" %
+                    (vm_id, vm, self.host_ids[host], host))
+            if choice < 0.8:
+                return self.engine_line(
+                    t, 'INFO', 'org.ovirt.engine.core.vdsbroker.'
+                    'VdsBrokerObjectsBuilder', 'EE-ManagedThreadFactory-'
+                    'engineScheduled-Thread-%d' % rng.randint(1, 50), '',
+                    "Received stats {'vmId': u'%s', 'vmName': u'%s'}" %
+                    (vm_id, vm))
+            if choice < 0.81:
+                # a line that does not match the format
+                return self.engine.schedule(t, '=' * 20 + ' engine '
+                                            'heartbeat ' + '=' * 20)
+            return self.engine_line(
+                t, 'INFO', 'org.ovirt.engine.core.sso.utils.'
+                'AuthenticationUtils', 'default task-%d' % rng.randint(1, 30),
+                '', "User admin@internal successfully logged in with scopes: "
+                "ovirt-app-api ovirt-ext=token-info:authz-search")
+        if kind == 'vdsm':
+            if choice < 0.5:
+                return self.vdsm_line(
+                    t, host, 'INFO', 'jsonrpc/%d' % rng.randint(0, 7),
+                    'jsonrpc.JsonRpcServer', 'RPC call Host.getStats '
+                    'succeeded in 0.%02d seconds' % rng.randint(0, 99),
+                    '__init__:515')
+            if choice < 0.8:
+                return self.vdsm_line(
+                    t, host, 'INFO', 'jsonrpc/%d' % rng.randint(0, 7),
+                    'api.host', "FINISH getAllVmStats return={'status': "
+                    "{'message': 'Done', 'code': 0}, 'statsList': "
+                    "(suppressed)} from=::1,41620", 'api:52')
+            return self.vdsm_line(
+                t, host, 'INFO', 'periodic/%d' % rng.randint(0, 3),
+                'vdsm.api', "START repoStats(options=None) from=internal, "
+                "task_id=%s" % self.uuid(), 'api:46')
+        if kind == 'libvirtd':
+            if choice < 0.3:
+                return self.libvirtd_job(
+                    t, host, 'remoteDispatchConnectGetAllDomainStats', 0.002)
+            if choice < 0.5:
+                return self.monitor_call(t, host, 'query-blockstats', 0.001)
+            if choice < 0.7:
+                return self.libvirtd_line(
+                    t, host, 'info', 'virObjectRef:296',
+                    'OBJECT_REF: obj=0x7f3c%08x' % rng.getrandbits(32))
+            return self.libvirtd_line(
+                t, host, 'debug', 'virDomainGetInfo:2414',
+                'dom=0x7f3c%08x, (VM: name=%s, uuid=%s), info=0x7f3c%08x' %
+                (rng.getrandbits(32), vm, vm_id, rng.getrandbits(32)))
+        return self.sanlock[host].schedule(
+            t, '%d [%d]: s1:r%d resource %s:SDM:/rhev/data-center/mnt/'
+            'blockSD/%s/dom_md/leases:1048576 for 2,9,%d' %
+            (rng.randint(1000, 1100), rng.randint(2000, 2400),
+             rng.randint(1, 50), self.storage_id, self.storage_id,
+             rng.randint(2000, 2400)))
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    start = (datetime.strptime(args.start, '%Y-%m-%dT%H:%M:%S') -
+             datetime(1970, 1, 1)).total_seconds()
+    duration = args.duration*60
+    cluster = Cluster(args, rng, start)
+    target = args.size*1024*1024
+    size = 0
+    for host in cluster.hosts:
+        # every part of the rotations tells the host of vdsm
+        for part in range(args.rotations + 1):
+            size += cluster.vdsm_line(
+                start + part*duration/(args.rotations + 1), host, 'INFO',
+                'MainThread', 'vds', 'I am the actual vdsm 4.19.10.1-1.el7 '
+                '%s (3.10.0-514.el7.x86_64)' % host, 'vdsm:145')
+        size += cluster.sanlock[host].schedule(
+            start, '%d [%d]: s1 lockspace %s:1:/rhev/data-center/mnt/blockSD/'
+            '%s/dom_md/ids:0' % (rng.randint(1000, 1100),
+                                 rng.randint(2000, 2400), cluster.storage_id,
+                                 cluster.storage_id))
+    # the VMs are started during the first minutes
+    starts = {int(rng.uniform(1, min(duration, 300))): vm
+              for vm in cluster.vms}
+    migrations = sorted([rng.uniform(60, duration)
+                         for num in range(args.migrations)])
+    storms = {}
+    for num in range(args.error_storms):
+        first = int(rng.uniform(0, max(duration - STORM_LENGTH, 1)))
+        host = rng.choice(cluster.hosts)
+        for second in range(first, first + STORM_LENGTH):
+            storms[second] = host
+    streams = cluster.streams()
+    for second in range(duration):
+        now = start + second
+        for stream in streams:
+            stream.advance(now)
+        if second in starts.keys() and \
+                cluster.vm_host[starts[second]] is None:
+            size += cluster.run_vm(now + rng.random(), starts[second],
+                                   rng.choice(cluster.hosts))
+        while migrations != [] and migrations[0] < second + 1:
+            migrations.pop(0)
+            running = [vm for vm in cluster.vms
+                       if cluster.vm_host[vm] is not None]
+            if running == [] or len(cluster.hosts) < 2:
+                continue
+            vm = rng.choice(running)
+            destination = rng.choice([host for host in cluster.hosts
+                                      if host != cluster.vm_host[vm]])
+            size += cluster.migrate_vm(now + rng.random(), vm, destination)
+        if rng.random() < args.command_rate/60:
+            vm = rng.choice(cluster.vms)
+            choice = rng.random()
+            if cluster.vm_host[vm] is None:
+                size += cluster.run_vm(now + rng.random(), vm,
+                                       rng.choice(cluster.hosts))
+            elif choice < 0.4:
+                size += cluster.add_disk(now + rng.random())
+            elif choice < 0.7:
+                size += cluster.stop_vm(now + rng.random(), vm)
+            else:
+                size += cluster.suspend_vm(now + rng.random(), vm)
+        if rng.random() < args.traceback_rate/60:
+            if rng.random() < 0.5:
+                size += cluster.engine_traceback(now + rng.random())
+            else:
+                size += cluster.vdsm_traceback(now + rng.random())
+        if second in storms.keys():
+            size += cluster.error_storm_second(now + rng.random(),
+                                               storms[second])
+        # ordinary lines up to the target size
+        times = []
+        while size + len(times)*150 < target*(second + 1)/duration:
+            times += [now + rng.random()]
+            if len(times) > 100000:
+                break
+        kinds = list(FILLER_WEIGHTS.keys())
+        weights = [FILLER_WEIGHTS[kind] for kind in kinds]
+        for t in sorted(times):
+            size += cluster.filler(t, rng.choices(kinds, weights)[0])
+    for stream in streams:
+        stream.close()
+    return streams
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic engine, vdsm, libvirtd, sanlock and '
+                    'qemu logs')
+    parser.add_argument('output_dir',
+                        type=str,
+                        help='Directory of the logs (created if missing)')
+    parser.add_argument('--hosts',
+                        type=int,
+                        default=3,
+                        help='Number of hosts')
+    parser.add_argument('--vms',
+                        type=int,
+                        default=20,
+                        help='Number of VMs')
+    parser.add_argument('--migrations',
+                        type=int,
+                        default=10,
+                        help='Number of VM migrations')
+    parser.add_argument('--command_rate',
+                        type=float,
+                        default=6,
+                        help='Engine commands (run, stop, suspend VM, add '
+                             'disk) per minute')
+    parser.add_argument('--traceback_rate',
+                        type=float,
+                        default=2,
+                        help='Tracebacks per minute in engine and vdsm logs')
+    parser.add_argument('--error_storms',
+                        type=int,
+                        default=2,
+                        help='Number of %d seconds long storms of errors of '
+                             'a host' % STORM_LENGTH)
+    parser.add_argument('--duration',
+                        type=int,
+                        default=60,
+                        help='Minutes covered by the logs')
+    parser.add_argument('--size',
+                        type=float,
+                        default=20,
+                        help='Approximate size of all the logs in MB')
+    parser.add_argument('--rotations',
+                        type=int,
+                        default=0,
+                        help='Number of rotated parts of engine, vdsm and '
+                             'libvirtd logs (the older lines)')
+    parser.add_argument('--compress',
+                        choices=['gz', 'xz', 'none'],
+                        default='gz',
+                        help='Compression of the rotated parts')
+    parser.add_argument('--start',
+                        type=str,
+                        default=START,
+                        help='UTC time of the first lines')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0)
+    args = parser.parse_args()
+    if args.compress == 'none':
+        args.compress = None
+    streams = generate(args)
+    total = 0
+    for stream in streams:
+        if stream.lines == 0:
+            continue
+        total += stream.written
+        print('%s: %d lines, %.1f MB in %d files' %
+              (os.path.relpath(stream.path, args.output_dir), stream.lines,
+               stream.written/1024/1024, len(stream.files)))
+    print('Total: %.1f MB' % (total/1024/1024))
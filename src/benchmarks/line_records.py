@@ -0,0 +1,84 @@
+"""Throughput and memory of parsing the lines of logfiles into records
+(loop_over_lines) over the whole files
+
+Run from the src directory:
+python3 benchmarks/line_records.py LOGFILE [LOGFILE ...]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from lib.log_formats import read_templates, detect_file_format, \
+                            FormatDispatcher  # noqa: E402
+from lib.parser_warnings import WarningCollector  # noqa: E402
+from lib.progress import ProgressReporter  # noqa: E402
+from lib.create_error_definition import loop_over_lines  # noqa: E402
+
+
+def parse_records(log, dispatcher, size, warnings, show_warnings):
+    # All lines of the file in one time range, every message is saved
+    records, fields_names = loop_over_lines(
+        os.path.dirname(log), os.path.basename(log), dispatcher, '+0000',
+        [[0, size]], warnings, ProgressReporter(0), True, [], [],
+        [[0, float('inf')]], [], {}, {}, set(), [0], [], show_warnings)
+    return records
+
+
+def parse_file(log, formats_templates, show_warnings):
+    # Returns (template name, records, lines, bytes, time, peak memory) or
+    # None if no template matches the file
+    regexps = detect_file_format(log, formats_templates)
+    if regexps is None or regexps == []:
+        return None
+    dispatcher = FormatDispatcher(formats_templates, regexps)
+    warnings = WarningCollector(log, dispatcher.name, 10)
+    with open(log, 'rb') as f:
+        lines = sum([1 for line in f])
+    size = os.path.getsize(log)
+    # the file is parsed twice: the time is measured without tracing
+    start = time.time()
+    records = parse_records(log, dispatcher, size, warnings, show_warnings)
+    elapsed = time.time() - start
+    tracemalloc.start()
+    parse_records(log, dispatcher, size, warnings, show_warnings)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dispatcher.name, len(records), lines, size, elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Time parsing logfiles into records and trace the peak ' +
+                    'memory of parsing')
+    parser.add_argument('logfiles',
+                        type=str,
+                        nargs='+',
+                        help='Logfiles to parse')
+    parser.add_argument('--format_file',
+                        type=str,
+                        default=os.path.join(os.path.dirname(
+                            os.path.abspath(__file__)), '..',
+                            'format_templates.txt'),
+                        help='Filename with formats of log files')
+    parser.add_argument('-w', '--warn',
+                        action='store_true',
+                        help='Collect parser warnings')
+    args = parser.parse_args()
+    formats_templates = read_templates(sys.stdout, args.format_file)
+    for log in args.logfiles:
+        result = parse_file(os.path.abspath(log), formats_templates,
+                            args.warn)
+        if result is None:
+            print('%s: unknown format' % log)
+            continue
+        name, records, lines, size, elapsed, peak = result
+        print('%s (%s): %d lines, %d records, %.3fs, %.0f lines/s, ' %
+              (log, name, lines, records, elapsed,
+               lines/max(elapsed, 1e-6)) +
+              '%.1f MB/s, peak %.1f MB (%.0f bytes per record)' %
+              (size/max(elapsed, 1e-6)/1024/1024, peak/1024/1024,
+               peak/max(records, 1)))
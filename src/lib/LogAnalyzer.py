@@ -1,21 +1,45 @@
 import os
-import re
-import progressbar
+import json
+import shutil
 import pickle
-import multiprocessing
-from multiprocessing import Manager, Pool
-from lib.create_error_definition import loop_over_lines
+import tempfile
+import tracemalloc
+from datetime import datetime
+from lib.create_error_definition import loop_over_lines, DATE_TIME
 from lib.errors_statistics import merge_all_errors_by_time, \
-                                  clusterize_messages
+                                  clusterize_messages, \
+                                  merge_spilled_errors_by_time, \
+                                  clusterize_spilled_messages
 from lib.represent_statistics import print_only_dt_message
-from lib.detect_running_components import find_vm_tasks_engine, \
-                                          find_vm_tasks_libvirtd, \
+from lib.detect_running_components import find_file_vm_tasks, \
+                                          find_file_vm_host, \
                                           find_all_vm_host, \
+                                          find_file_vm_timeline, \
+                                          merge_vm_timelines, \
+                                          merge_pattern_stats, \
+                                          find_file_time_range, \
                                           find_time_range, \
-                                          find_needed_linenum
-from lib.ProgressPool import ProgressPool
-from progressbar import ProgressBar
-from lib.util import open_log_file
+                                          find_file_needed_linenum, \
+                                          find_needed_linenum, \
+                                          merge_time_ranges, \
+                                          time_range_tags
+from lib.shared_rows import store_rows, SharedRows
+from lib.spill import write_run, stored_values, SpilledRows
+from lib.parser_warnings import WarningCollector, print_warnings
+from lib.progress import ProgressReporter
+from lib.executor import Executor, report_utilisation
+from lib.stage_timings import StageTimings, timed_stage
+from lib.memory_usage import MemoryBudget, rows_size
+from lib.columnar_export import export_tables, message_rows, \
+    messages_columns, timeline_rows, command_rows, TIMELINE_COLUMNS, \
+    COMMANDS_COLUMNS
+from lib.file_index import FileIndex, find_file_line_numbers, \
+    NEWLINE_CHECKPOINT
+from lib.log_formats import read_templates, templates_key, \
+    detect_file_format, FormatDispatcher
+
+
+LOOKBEHIND = 1024*1024
 
 
 class LogAnalyzer:
@@ -31,11 +55,22 @@ class LogAnalyzer:
     # format_fields{'log1':...}
     def __init__(self, out_descr, directory, filenames, tz, criterias,
                  time_ranges, user_vms, user_events, user_hosts,
-                 templates_filename, additive_link, output_dir):
+                 templates_filename, additive_link, output_dir, jobs=None,
+                 lookbehind=LOOKBEHIND, timings=False, profile_stage=None,
+                 memory_limit=None, trace_memory=False, out_of_core=False,
+                 spill_dir=None, report_format='text'):
         self.out_descr = out_descr
+        if jobs is None:
+            jobs = os.cpu_count()
+        self.jobs = max(jobs, 1)
+        # bytes scanned before a time range when searching for VMs and hosts
+        self.lookbehind = lookbehind
         self.directory = directory
         self.output_dir = output_dir
-        self.time_ranges = time_ranges
+        # the user time ranges are merged into the windows of the logfiles
+        # that all the stages read
+        self.user_time_ranges = time_ranges
+        self.time_ranges = merge_time_ranges(time_ranges)
         self.user_vms = user_vms
         self.user_events = user_events
         self.user_hosts = user_hosts
@@ -49,25 +84,9 @@ class LogAnalyzer:
         else:
             self.criterias = criterias
         # parse formats file
-        formats = open(templates_filename, 'r').read().split('\n')
-        self.formats_templates = []
-        format_num = 0
-        for line in formats:
-            if line[0] == '@':
-                format_name = line[1:]
-            elif line[0:2] == 'r^' and format_name != '':
-                try:
-                    re.compile(line[1:])
-                except:
-                    self.out_descr.write("Wrong format of regexp: %s\n" %
-                                         line[1:])
-                    exit()
-                self.formats_templates += [{'name': format_name,
-                                            'regexp': line[1:]}]
-                format_name = ''
-                format_num += 1
-            else:
-                self.out_descr.write("Wrong format of template: %s\n" % line)
+        self.formats_templates = read_templates(self.out_descr,
+                                                templates_filename)
+        self.file_index = FileIndex(self.directory)
         self.found_logs = []
         self.log_files_format = {}
         self.time_zones = []
@@ -78,26 +97,55 @@ class LogAnalyzer:
                 continue
             # save log's time zome
             self.time_zones += [tz[log]]
-            # find format of a log
-            f = open_log_file(log)
-            if f is None:
-                self.out_descr.write("Unknown file extension: %s" % log)
-                continue
-            line = f.readline()
-            f.close()
+            # find format of a log, the templates found for an unchanged
+            # file are taken from the file index
+            key = ('format', templates_key(self.formats_templates))
+            regexps = self.file_index.get(log, key)
+            if regexps is None:
+                regexps = detect_file_format(log, self.formats_templates)
+                if regexps is None:
+                    self.out_descr.write("Unknown file extension: %s" % log)
+                    continue
+                self.file_index.set(log, key, regexps)
             # save name of actually opened logfile
             self.found_logs += [log]
-            for file_format_num in range(len(self.formats_templates)):
-                prog = re.compile(self.formats_templates[file_format_num][
-                                                    'regexp'])
-                result = prog.search(line)
-                if result is not None:
-                    self.log_files_format[log] = prog
-                    break
+            if regexps != []:
+                self.log_files_format[log] = FormatDispatcher(
+                    self.formats_templates, regexps)
         if (self.found_logs == []):
             out_descr.write('No logfiles found.\n')
             exit()
+        # worker processes are started once and serve all the stages
+        self.executor = Executor(self.jobs, len(filenames))
+        # the report of the stages is written on close
+        self.save_timings = timings
+        self.timings = StageTimings(
+            self.executor, profile_stage,
+            os.path.join(self.output_dir, self.directory.split('/')[-2] +
+                         '_' + str(profile_stage)))
+        # memory_limit - bytes the analysis should fit in, None for no limit
+        self.memory = MemoryBudget(self.out_descr, memory_limit)
+        self.executor.trace_memory = trace_memory
+        if trace_memory:
+            tracemalloc.start()
+        # out_of_core - the messages are kept in run files in a temporary
+        # directory in spill_dir (the system one by default)
+        self.out_of_core = out_of_core
+        self.spill_root = spill_dir
+        self.spill_dir = None
+        # format of the output and of _frequent (see ReportWriter)
+        self.report_format = report_format
+
+    def close(self):
+        self.executor.close()
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+        if self.save_timings:
+            self.timings.save(os.path.join(self.output_dir,
+                                           self.directory.split('/')[-2] +
+                                           '_timings.json'))
 
+    @timed_stage
     def read_time_ranges(self, re_load):
         if (not re_load and os.path.isdir(
                 os.path.join(self.directory, 'log_analyzer_cache'))
@@ -119,15 +167,36 @@ class LogAnalyzer:
         if not os.path.isdir(os.path.join(self.directory,
                                           'log_analyzer_cache')):
             os.mkdir(os.path.join(self.directory, 'log_analyzer_cache'))
+        # time spans of unchanged files are taken from the file index
+        files_ranges = [self.file_index.get(log, ('time_range',
+                                                  self.time_zones[idx]))
+                        for idx, log in enumerate(self.found_logs)]
+        missing = [idx for idx in range(len(self.found_logs))
+                   if files_ranges[idx] is None]
+        found_ranges = self.executor.map_files(
+            'find_time_range', find_file_time_range,
+            [[self.directory, self.found_logs[idx], self.time_zones[idx]]
+             for idx in missing],
+            [os.path.getsize(self.found_logs[idx]) for idx in missing],
+            names=[self.found_logs[idx] for idx in missing])
+        for idx, file_range in zip(missing, found_ranges):
+            files_ranges[idx] = file_range
+            if file_range is not None:
+                self.file_index.set(self.found_logs[idx],
+                                    ('time_range', self.time_zones[idx]),
+                                    file_range)
+        self.file_index.save()
         self.total_time_ranges, self.found_logs = \
-            find_time_range(self.out_descr, self.directory,
-                            self.found_logs, self.time_zones,
+            find_time_range(self.out_descr, self.found_logs, files_ranges,
                             self.time_ranges)
-        self.positions = find_needed_linenum(self.out_descr,
-                                             self.directory,
-                                             self.found_logs,
-                                             self.time_zones,
-                                             self.time_ranges)
+        files_positions = self.executor.map_files(
+            'find_needed_linenum', find_file_needed_linenum,
+            [[self.directory, log, self.time_zones[idx], self.time_ranges]
+             for idx, log in enumerate(self.found_logs)],
+            [os.path.getsize(log) for log in self.found_logs],
+            names=self.found_logs)
+        self.positions = find_needed_linenum(self.out_descr, self.found_logs,
+                                             files_positions)
         if (self.found_logs != [] and self.time_ranges == []):
             max_time = max([t for l in self.total_time_ranges.keys()
                             for t in self.total_time_ranges[l]])
@@ -139,6 +208,7 @@ class LogAnalyzer:
             pickle.dump([self.positions, self.total_time_ranges,
                          self.time_ranges, self.found_logs], f)
 
+    @timed_stage
     def find_vms_and_hosts(self, re_load):
         if (not re_load and os.path.isdir(
                 os.path.join(self.directory, 'log_analyzer_cache'))
@@ -154,15 +224,49 @@ class LogAnalyzer:
         if not os.path.isdir(os.path.join(self.directory,
                                           'log_analyzer_cache')):
             os.mkdir(os.path.join(self.directory, 'log_analyzer_cache'))
+        # every file is scanned by a worker, the partial inventories are
+        # merged in the order of the files
+        inventories = self.executor.map_files(
+            'find_vms_and_hosts', find_file_vm_host,
+            [[self.directory, log, self.positions[log], self.time_zones[idx],
+              self.time_ranges, self.lookbehind, idx]
+             for idx, log in enumerate(self.found_logs)],
+            # the look-behind margin is cut at the beginning of the file
+            [sum([max(p[1] - max(p[0] - self.lookbehind, 0), 0)
+                  for p in self.positions[log]])
+             for log in self.found_logs], names=self.found_logs,
+            label='Discovery: ',
+            count=lambda inventory: len(inventory[0]) + len(inventory[1]))
+        engine_logs = [idx for idx, log in enumerate(self.found_logs)
+                       if 'engine' in log]
         self.all_vms, self.all_hosts, self.not_running_vms, \
             self.not_found_vmnames, self.not_found_hostnames, \
-            self.positions, vm_timeline = find_all_vm_host(self.positions,
-                                                           self.out_descr,
-                                                           self.output_dir,
-                                                           self.directory,
-                                                           self.found_logs,
-                                                           self.time_zones,
-                                                           self.time_ranges)
+            first_lines = find_all_vm_host(self.out_descr, self.found_logs,
+                                           inventories)
+        timelines = self.executor.map_files(
+            'vm_timeline', find_file_vm_timeline,
+            [[self.directory, self.found_logs[idx],
+              self.positions[self.found_logs[idx]], self.time_zones[idx],
+              self.all_vms, self.all_hosts] for idx in engine_logs],
+            [os.path.getsize(self.found_logs[idx]) for idx in engine_logs],
+            names=[self.found_logs[idx] for idx in engine_logs],
+            count=lambda timeline: sum([len(vms) for vms in timeline[0]]))
+        vm_timeline = merge_vm_timelines(self.out_descr, self.output_dir,
+                                         [self.found_logs[idx]
+                                          for idx in engine_logs],
+                                         timelines)
+        self.positions = first_lines
+        # how often the engine regexps were tried and matched
+        json.dump({'find_vms_and_hosts': merge_pattern_stats(
+                       [inventory[4] for inventory in inventories
+                        if inventory is not None]),
+                   'vm_timeline': merge_pattern_stats(
+                       [timeline[1] for timeline in timelines
+                        if timeline is not None])},
+                  open(os.path.join(self.output_dir,
+                                    self.directory.split('/')[-2] +
+                                    '_pattern_stats.json'), 'w'),
+                  indent=4, sort_keys=True)
 
         if self.user_vms == []:
             for k in self.all_vms.keys():
@@ -218,6 +322,7 @@ class LogAnalyzer:
                          self.positions, self.user_vms, self.user_hosts,
                          self.vm_timeline], f)
 
+    @timed_stage
     def find_vm_tasks(self, re_load):
         if (not re_load and os.path.isdir(
                 os.path.join(self.directory, 'log_analyzer_cache'))
@@ -235,178 +340,224 @@ class LogAnalyzer:
             os.mkdir(os.path.join(self.directory, 'log_analyzer_cache'))
         self.needed_lines = set()
         self.reasons = {}
-        engine_formats = [fmt['regexp'] for fmt in self.formats_templates if
-                          'engine' in fmt['name']]
-        libvirtd_formats = [fmt['regexp'] for fmt in self.formats_templates if
-                            'libvirt' in fmt['name']]
+        # engine logs are parsed only with engine formats, libvirtd logs with
+        # libvirt ones
+        tasks_formats = {}
+        for log in self.found_logs:
+            kind = 'engine' if 'engine' in log.lower() else 'libvirt'
+            if (log in self.log_files_format.keys()
+                    and kind in self.log_files_format[log].name):
+                tasks_formats[log] = self.log_files_format[log]
         self.vm_tasks = {}
         self.long_tasks = {}
         self.subtasks = {}
         self.stuctured_commands = {}
-        for idx, log in enumerate(self.found_logs):
-            if 'engine' in log.lower():
-                tasks_file, long_tasks_file, self.stuctured_commands[log], \
-                    subtasks, cur_needed_lines, \
-                    cur_reasons = find_vm_tasks_engine(self.positions[log],
-                                                       self.out_descr,
-                                                       self.directory,
-                                                       log,
-                                                       engine_formats,
-                                                       self.time_zones[idx],
-                                                       self.time_ranges,
-                                                       self.output_dir,
-                                                       self.needed_lines,
-                                                       self.reasons,
-                                                       self.criterias)
-                self.vm_tasks[log] = tasks_file
-                self.long_tasks[log] = long_tasks_file
-                self.subtasks.update(subtasks)
-                self.needed_lines = self.needed_lines.union(cur_needed_lines)
-                self.reasons.update(cur_reasons)
-            elif 'libvirt' in log.lower():
-                tasks_file, long_tasks_file, cur_needed_lines, \
-                    cur_reasons = find_vm_tasks_libvirtd(self.positions[log],
-                                                         self.out_descr,
-                                                         self.directory,
-                                                         log,
-                                                         libvirtd_formats,
-                                                         self.time_zones[idx],
-                                                         self.time_ranges,
-                                                         self.output_dir,
-                                                         self.needed_lines,
-                                                         self.reasons,
-                                                         self.criterias)
-                self.vm_tasks[log] = tasks_file
-                self.long_tasks[log] = long_tasks_file
-                self.needed_lines = self.needed_lines.union(cur_needed_lines)
-                self.reasons.update(cur_reasons)
+        # engine and libvirtd logs are processed by workers, the results are
+        # merged and the json files are written in the order of the files
+        tasks_logs = [idx for idx, log in enumerate(self.found_logs)
+                      if 'engine' in log.lower() or 'libvirt' in log.lower()]
+        results = self.executor.map_files(
+            'find_vm_tasks', find_file_vm_tasks,
+            [[self.positions[self.found_logs[idx]], self.found_logs[idx],
+              tasks_formats.get(self.found_logs[idx]), self.time_zones[idx],
+              self.time_ranges, self.criterias, idx] for idx in tasks_logs],
+            [sum([p[1] - p[0] for p in self.positions[self.found_logs[idx]]])
+             for idx in tasks_logs],
+            names=[self.found_logs[idx] for idx in tasks_logs],
+            label='Tasks: ',
+            count=lambda tasks: sum([len(tasks[0][thread])
+                                     for thread in tasks[0].keys()]))
+        for idx, result in zip(tasks_logs, results):
+            log = self.found_logs[idx]
+            if result is None:
+                self.out_descr.write("Unknown file extension: %s" % log)
+                continue
+            tasks_file, long_tasks_file, stuctured_commands, subtasks, \
+                cur_needed_lines, cur_reasons, outputs = result
+            self.vm_tasks[log] = tasks_file
+            self.long_tasks[log] = long_tasks_file
+            if stuctured_commands is not None:
+                self.stuctured_commands[log] = stuctured_commands
+            self.subtasks.update(subtasks)
+            self.needed_lines = self.needed_lines.union(cur_needed_lines)
+            self.reasons.update(cur_reasons)
+            for suffix in outputs.keys():
+                json.dump(outputs[suffix],
+                          open(os.path.join(self.output_dir,
+                                            self.directory.split('/')[-2] +
+                                            suffix), 'w'),
+                          indent=4, sort_keys=True)
+        report_utilisation(self.out_descr, 'find_vm_tasks',
+                           *self.executor.utilisation['find_vm_tasks'],
+                           files_times=[(self.found_logs[idx], elapsed)
+                                        for idx, elapsed in
+                                        zip(tasks_logs, self.executor.
+                                            files_times['find_vm_tasks'])])
         with open(os.path.join(self.directory, 'log_analyzer_cache',
                                'vm_tasks.pckl'), 'wb') as f:
             pickle.dump([self.needed_lines, self.reasons, self.vm_tasks,
                          self.long_tasks, self.subtasks,
                          self.stuctured_commands], f)
 
+    @timed_stage
     def find_real_line_num(self):
         self.real_line_num = {}
         if self.time_ranges == {}:
             for log in self.found_logs:
                 self.real_line_num[log] = [0]
             return
-        for log in self.found_logs:
-            f = open_log_file(log)
-            line_num = 0
-            self.real_line_num[log] = []
-            for pos in self.positions[log]:
-                while f.tell() < pos[0]:
-                    f.readline()
-                    line_num += 1
-                self.real_line_num[log] += [line_num]
-            f.close()
+        # positions are converted with the newline indexes of the files,
+        # the missing indexes are built by the workers
+        checkpoints = [self.file_index.get(log, ('newlines',
+                                                 NEWLINE_CHECKPOINT))
+                       for log in self.found_logs]
+        files_lines = self.executor.map_files(
+            'find_real_line_num', find_file_line_numbers,
+            [[log, [pos[0] for pos in self.positions[log]], checkpoints[idx]]
+             for idx, log in enumerate(self.found_logs)],
+            [os.path.getsize(log) if checkpoints[idx] is None else 0
+             for idx, log in enumerate(self.found_logs)],
+            names=self.found_logs)
+        for idx, log in enumerate(self.found_logs):
+            self.real_line_num[log], file_checkpoints = files_lines[idx]
+            if checkpoints[idx] is None:
+                self.file_index.set(log, ('newlines', NEWLINE_CHECKPOINT),
+                                    file_checkpoints)
+        self.file_index.save()
 
-    def load_data(self, show_warnings, show_progressbar):
+    @timed_stage
+    def load_data(self, show_warnings, show_progressbar, warn_samples):
+        # returns False if no message matched, the caller stops then (the
+        # spill directory is removed on close)
         self.all_errors = {}
         self.format_fields = {}
-        m = Manager()
-        q = m.Queue()
-        q_bar = Manager().Queue()
+        format_names = {fmt['regexp']: fmt['name']
+                        for fmt in self.formats_templates}
         idxs = range(len(self.found_logs))
-        if show_progressbar:
-            result = ProgressPool([(process_files,
-                                    "{}".format(self.found_logs[i]),
-                                    [i, self.found_logs,
-                                     self.log_files_format,
-                                     self.directory,
-                                     self.time_zones,
-                                     self.positions,
-                                     q,
-                                     q_bar,
-                                     self.additive_link,
-                                     self.user_events,
-                                     self.user_hosts,
-                                     self.time_ranges,
-                                     self.user_vms,
-                                     self.vm_timeline,
-                                     self.subtasks,
-                                     self.needed_lines,
-                                     self.real_line_num,
-                                     [mes['flow_id']
-                                      for l in self.vm_tasks.keys()
-                                      for t in self.vm_tasks[l].keys()
-                                      for mes in (self.vm_tasks)[l][t]
-                                      if ('flow_id' in mes.keys()
-                                          and mes['flow_id'] != '')],
-                                     show_warnings])
-                                   for i in idxs], processes=4)
-        else:
-            result = []
-            run_args = [[i, self.found_logs,
-                         self.log_files_format,
-                         self.directory,
-                         self.time_zones,
-                         self.positions,
-                         q,
-                         q_bar,
-                         self.additive_link,
-                         self.user_events,
-                         self.user_hosts,
-                         self.time_ranges,
-                         self.user_vms,
-                         self.vm_timeline,
-                         self.subtasks,
-                         self.needed_lines,
-                         self.real_line_num,
-                         [mes['flow_id'] for l in self.vm_tasks.keys()
-                          for t in self.vm_tasks[l].keys()
-                          for mes in (self.vm_tasks)[l][t] if ('flow_id'
-                          in mes.keys() and mes['flow_id'] != '')],
-                         show_warnings] for i in idxs]
-            widget_style = ['Load: ', progressbar.Percentage(), ' (',
-                            progressbar.SimpleProgress(), ')', ' ',
-                            progressbar.Bar(), ' ', progressbar.Timer(), ' ',
-                            progressbar.AdaptiveETA()]
-            sum_lines = []
-            for log in self.found_logs:
-                sum_lines += [p[1] - p[0] for p in self.positions[log]]
-            sum_lines = sum(sum_lines)
-            bar = ProgressBar(widgets=widget_style, max_value=sum_lines)
-            pos = 0
-            with Pool(processes=4) as pool:
-                worker = pool.imap(star, run_args)
-                while True:
-                    try:
-                        try:
-                            while True:
-                                result += [worker.next(0)]
-                        except multiprocessing.TimeoutError:
-                            pass
-                        while not q_bar.empty():
-                            pos_tmp, name = q_bar.get()
-                            pos += pos_tmp
-                            bar.update(pos)
-                    except StopIteration:
-                        break
-            bar.finish()
+        flow_ids = [mes['flow_id'] for l in self.vm_tasks.keys()
+                    for t in self.vm_tasks[l].keys()
+                    for mes in (self.vm_tasks)[l][t] if ('flow_id'
+                    in mes.keys() and mes['flow_id'] != '')]
+        # bytes to read from every file
+        sizes = [sum([p[1] - p[0] for p in self.positions[log]])
+                 for log in self.found_logs]
+        if not self.out_of_core:
+            self.out_of_core = self.memory.choose_spill(sizes)
+        if self.out_of_core:
+            self.spill_dir = tempfile.mkdtemp(prefix='log_analyzer_',
+                                              dir=self.spill_root)
+            self.out_descr.write('Keeping the messages in %s\n' %
+                                 self.spill_dir)
+        run_args = [[i, self.found_logs,
+                     self.log_files_format,
+                     self.directory,
+                     self.time_zones,
+                     self.positions,
+                     format_names[self.log_files_format[
+                         self.found_logs[i]].pattern],
+                     i,
+                     self.additive_link,
+                     self.user_events,
+                     self.user_hosts,
+                     self.time_ranges,
+                     self.user_time_ranges,
+                     self.user_vms,
+                     self.vm_timeline,
+                     self.subtasks,
+                     self.needed_lines,
+                     self.real_line_num,
+                     flow_ids,
+                     show_warnings,
+                     warn_samples,
+                     self.spill_dir] for i in idxs]
+        # the biggest files first, small files are parsed in batches
+        result = self.executor.map_files(
+            'load_data', process_files, run_args, sizes,
+            names=self.found_logs, label='Load: ',
+            full_screen=show_progressbar,
+            count=lambda rows: rows[0]['rows'],
+            parallel=self.memory.parallel_files(sizes, self.jobs))
+        report_utilisation(self.out_descr, 'load_data',
+                           *self.executor.utilisation['load_data'])
         for idx, log in enumerate(self.found_logs):
-            self.all_errors[log] = result[idx][0]
+            # rows stay in the worker's shared memory segment or run file
+            if self.spill_dir is not None:
+                self.all_errors[log] = SpilledRows(result[idx][0])
+            else:
+                self.all_errors[log] = SharedRows(result[idx][0])
             # saving logfile format fields names
-            self.format_fields[log] = result[idx][1]
-        while not q.empty():
-            warn = q.get()
-            self.out_descr.write(warn)
-        if (self.all_errors == {} or all([self.all_errors[l] == []
+            self.format_fields[log] = result[idx][0]['fields']
+        if show_warnings:
+            print_warnings(self.out_descr, [r[1] for r in result])
+        if len(self.user_time_ranges) > 1:
+            self.out_descr.write('------- Messages per time range -------\n')
+            for tr_idx, time_range in enumerate(self.user_time_ranges):
+                self.out_descr.write('%s %s: %d\n' % (
+                    datetime.utcfromtimestamp(time_range[0]).strftime(
+                        "%Y-%m-%dT%H:%M:%S,%f")[:-3],
+                    datetime.utcfromtimestamp(time_range[1]).strftime(
+                        "%Y-%m-%dT%H:%M:%S,%f")[:-3],
+                    sum([r[2][tr_idx] for r in result])))
+        if (self.all_errors == {} or all([len(self.all_errors[l]) == 0
                                           for l in self.all_errors.keys()])):
+            self.release_data()
             self.out_descr.write('No matches.\n')
-            exit()
+            return False
+        self.timings.hold('load_data', {'all_errors': self.stored_bytes()})
+        return True
 
+    def stored_bytes(self):
+        # size of the shared memory segments (or of the run files) of the
+        # loaded messages
+        if self.spill_dir is not None:
+            return sum([self.all_errors[log].size()
+                        for log in self.all_errors.keys()])
+        return sum([self.all_errors[log].shm.size
+                    for log in self.all_errors.keys()
+                    if self.all_errors[log].shm is not None])
+
+    def release_data(self):
+        for log in self.all_errors.keys():
+            self.all_errors[log].close()
+
+    @timed_stage
     def merge_all_messages(self):
+        if self.spill_dir is not None:
+            self.timeline, self.merged_errors, self.all_fields = \
+                merge_spilled_errors_by_time(self.all_errors,
+                                             self.format_fields,
+                                             self.spill_dir)
+            self.timings.count('merge_all_messages', len(self.merged_errors))
+            self.timings.hold('merge_all_messages',
+                              {'merged_errors': self.merged_errors.size()})
+            del self.all_errors
+            return
+        self.memory.choose_merge(self.stored_bytes())
         self.timeline, self.merged_errors, self.all_fields = \
-            merge_all_errors_by_time(self.all_errors, self.format_fields)
+            merge_all_errors_by_time(self.all_errors, self.format_fields,
+                                     self.memory.low_memory)
+        self.timings.count('merge_all_messages', len(self.merged_errors))
+        self.timings.hold('merge_all_messages',
+                          {'merged_errors': rows_size(self.merged_errors)})
+        self.release_data()
         try:
             del self.all_errors
         except:
             pass
 
+    @timed_stage
     def find_important_events(self):
+        if self.spill_dir is not None:
+            important_events, new_fields = clusterize_spilled_messages(
+                self.out_descr, self.merged_errors, self.all_fields,
+                self.user_events, self.all_vms, self.all_hosts,
+                self.subtasks, self.directory, self.timeline, self.vm_tasks,
+                self.long_tasks, self.output_dir, self.reasons,
+                self.needed_lines, self.criterias, self.vm_timeline,
+                self.spill_dir, self.report_format)
+            self.timings.count('find_important_events',
+                               len(important_events))
+            return important_events, new_fields
         important_events, new_fields = \
             clusterize_messages(self.out_descr, self.merged_errors,
                                 self.all_fields, self.user_events,
@@ -414,32 +565,50 @@ class LogAnalyzer:
                                 self.directory, self.timeline, self.vm_tasks,
                                 self.long_tasks, self.output_dir,
                                 self.reasons, self.needed_lines,
-                                self.criterias, self.vm_timeline)
+                                self.criterias, self.vm_timeline,
+                                self.report_format)
+        self.timings.count('find_important_events', len(important_events))
+        self.timings.hold('find_important_events',
+                          {'merged_errors': rows_size(self.merged_errors),
+                           'important_events': rows_size(important_events)})
         return important_events, new_fields
 
+    @timed_stage
     def print_errors(self, errors_list, new_fields, out):
-        print_only_dt_message(self.directory, errors_list, new_fields, out)
-
+        print_only_dt_message(self.directory, errors_list, new_fields, out,
+                              self.report_format)
+        self.timings.count('print_errors', len(errors_list))
 
-def star(input):
-    return process_files(*input)
+    @timed_stage
+    def export_columns(self, errors_list, new_fields):
+        # the shown messages, the VM timelines and the engine commands as
+        # columnar files in the output directory
+        filenames = export_tables(
+            os.path.join(self.output_dir, self.directory.split('/')[-2]),
+            [('messages', messages_columns(new_fields),
+              message_rows(errors_list, new_fields)),
+             ('vm_timeline', TIMELINE_COLUMNS,
+              timeline_rows(self.vm_timeline)),
+             ('commands', COMMANDS_COLUMNS,
+              command_rows(self.stuctured_commands))])
+        self.out_descr.write('Exported: %s\n' % ', '.join(filenames))
 
 
 def process_files(idx, log, formats_templates, directory, time_zones,
-                  positions, out_descr, q_bar, additive, user_events,
-                  user_hosts, time_ranges, user_vms, vm_timeline, tasks,
-                  needed_lines, real_line_num, flow_ids, show_warnings,
-                  progressbar=None, text_header=None):
-    if text_header:
-        text_header.update_mapping(type_op="Parsing:")
+                  positions, format_name, progress_slot, additive,
+                  user_events, user_hosts, time_ranges, user_time_ranges,
+                  user_vms, vm_timeline, tasks, needed_lines, real_line_num,
+                  flow_ids, show_warnings, warn_samples, spill_dir):
+    warnings = WarningCollector(log[idx], format_name, warn_samples)
     # gathering all information about errors from a logfile into lists
     lines_info, fields_names = loop_over_lines(directory,
                                                log[idx],
                                                formats_templates[log[idx]],
                                                time_zones[idx],
                                                positions[log[idx]],
-                                               out_descr,
-                                               q_bar,
+                                               warnings,
+                                               ProgressReporter(
+                                                   progress_slot),
                                                additive,
                                                user_events,
                                                user_hosts,
@@ -450,6 +619,29 @@ def process_files(idx, log, formats_templates, directory, time_zones,
                                                needed_lines,
                                                real_line_num[log[idx]],
                                                flow_ids,
-                                               show_warnings,
-                                               progressbar)
-    return lines_info, fields_names
+                                               show_warnings)
+    # with several time ranges every message gets the time_ranges field:
+    # the numbers of the user time ranges it belongs to (the ranges can
+    # overlap) joined by ';'
+    range_counts = [0]*len(user_time_ranges)
+    if len(user_time_ranges) > 1:
+        tr_field = len(fields_names)
+        fields_names = fields_names + ['time_ranges']
+        for line_info in lines_info:
+            tags = time_range_tags(user_time_ranges, line_info[DATE_TIME])
+            for tr_idx in tags:
+                range_counts[tr_idx] += 1
+            # the rows of the lines that do not match the template carry
+            # their text after the fields (see create_line_info), it is not
+            # stored anyway and the tag takes its place
+            line_info[tr_field:] = [';'.join([str(tr_idx + 1)
+                                              for tr_idx in tags])]
+    # only a small descriptor, the warnings summary and the numbers of
+    # messages per time range are sent back to the parent process
+    if spill_dir is not None:
+        # the run file is sorted by time for the merge
+        return write_run(spill_dir,
+                         sorted(stored_values(lines_info, fields_names),
+                                key=lambda k: k[DATE_TIME]),
+                         fields_names, 'load_'), warnings, range_counts
+    return store_rows(lines_info, fields_names), warnings, range_counts
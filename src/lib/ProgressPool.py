@@ -1,53 +1,40 @@
 import curses
 import progressbar
 import multiprocessing
-import time
 from progressbar import ProgressBar
-from multiprocessing import Pool
+from lib.progress import REFRESH_INTERVAL, throttled
 
 
 def runner_parallel(inp):
-    function, args, name, queue, order_idx = inp
-    idx = int(multiprocessing.current_process().name.split("-")[1])
-    custom_text = progressbar.FormatCustomText(
-                            '{} - %(type_op)s: '.format(name),
-                            dict(type_op="Start"))
-    widget_style = [custom_text, progressbar.Percentage(), ' (',
-                    progressbar.SimpleProgress(), ')', ' ',
-                    progressbar.Bar(), ' ', progressbar.Timer(), ' ',
-                    progressbar.AdaptiveETA()]
-    args += [ProgressBar(widgets=widget_style, fd=Writer((0, idx - 1),
-                         queue)), custom_text]
+    function, args, order_idx = inp
     return (function(*args), order_idx)
 
 
 class Writer(object):
-    def __init__(self, location, queue=None, interface=None):
+    def __init__(self, location, interface):
         self.location = location
-        self.queue = queue
         self.interface = interface
 
     def write(self, string):
-        if self.queue is None:
-            self.interface.addstr(self.location[1], self.location[0], string)
-        else:
-            self.queue.put((self.location, string))
+        self.interface.addstr(self.location[1], self.location[0], string)
 
     def flush(self):
-        if self.interface:
-            self.interface.refresh()
+        self.interface.refresh()
 
 
-def ProgressPool(run_args, processes=5):
-    manager = multiprocessing.Manager()
-    the_queue = manager.Queue()
+def ProgressPool(run_args, counters, pool, processes=5, slots=None):
+    # run_args: (function, name, args, progress slots, size in bytes)
+    # slots - semaphore limiting the number of running tasks
     result = []
     widget_style = ['All: ', progressbar.Percentage(), ' (',
                     progressbar.SimpleProgress(), ')', ' ',
                     progressbar.Bar(), ' ', progressbar.Timer(), ' ',
                     progressbar.AdaptiveETA()]
-    run_args = [(func, args, name, the_queue, order_idx)
-                for order_idx, (func, name, args) in enumerate(run_args)]
+    tasks = [(name, slots, size)
+             for (func, name, args, slots, size) in run_args]
+    run_args = [(func, args, order_idx)
+                for order_idx, (func, name, args, slots, size)
+                in enumerate(run_args)]
     if len(run_args) < processes:
         processes = len(run_args)
     if processes == 0:
@@ -58,26 +45,50 @@ def ProgressPool(run_args, processes=5):
         curses.cbreak()
         main_pb = ProgressBar(widgets=widget_style, fd=Writer((0, 0),
                               interface=interface), max_value=len(run_args))
-        with Pool(processes=processes) as pool:
-            workers = pool.imap_unordered(runner_parallel, run_args)
-            idx = 0
-            main_pb.start()
-            while True:
-                try:
-                    try:
-                        while True:
-                            result.append(workers.next(0))
-                            idx += 1
-                            main_pb.update(idx)
-                    except multiprocessing.TimeoutError:
-                        pass
-                    while not the_queue.empty():
-                        pos, text = the_queue.get()
-                        interface.addstr(pos[1], pos[0], text)
-                    interface.refresh()
-                    time.sleep(1)
-                except StopIteration:
-                    break
+        # one screen row per running task, the bars are drawn by the parent
+        # process from the shared progress counters
+        free_rows = list(range(1, processes + 1))
+        rows = {}
+        bars = {}
+        finished = set()
+        workers = pool.imap_unordered(runner_parallel,
+                                      run_args if slots is None
+                                      else throttled(run_args, slots))
+        main_pb.start()
+        while True:
+            try:
+                result.append(workers.next(REFRESH_INTERVAL))
+                if slots is not None:
+                    slots.release()
+                finished.add(result[-1][1])
+                main_pb.update(len(result))
+            except multiprocessing.TimeoutError:
+                pass
+            except StopIteration:
+                break
+            for order_idx, (name, task_slots, size) in enumerate(tasks):
+                pos = min(sum([counters.position(slot)
+                               for slot in task_slots]), size)
+                if order_idx in finished:
+                    if order_idx in rows:
+                        bars.pop(order_idx).finish()
+                        free_rows += [rows.pop(order_idx)]
+                    continue
+                if order_idx not in rows:
+                    if pos == 0 or free_rows == []:
+                        continue
+                    rows[order_idx] = free_rows.pop(0)
+                    interface.move(rows[order_idx], 0)
+                    interface.clrtoeol()
+                    bars[order_idx] = ProgressBar(
+                        widgets=['{} - Parsing: '.format(name)] +
+                        widget_style[1:],
+                        fd=Writer((0, rows[order_idx]),
+                                  interface=interface),
+                        max_value=max(size, 1))
+                    bars[order_idx].start()
+                bars[order_idx].update(pos)
+            interface.refresh()
     finally:
         curses.echo()
         curses.nocbreak()
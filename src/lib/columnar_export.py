@@ -0,0 +1,178 @@
+"""Columnar export of the results of the analysis (for notebooks)
+- export_tables - writes tables of floats, integers and strings as Parquet
+files when pyarrow is installed, as .npz files of numpy arrays otherwise
+- read_npz - reads the columns of an .npz file
+- message_rows, timeline_rows, command_rows - rows of the shown messages
+with their reasons, details and time range tags, of the VM timelines on the
+hosts and of the trees of engine commands
+"""
+import numpy as np
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# rows written to Parquet at once (one row group)
+ROW_GROUP = 65536
+# Column kinds: 'd' - float64, 'q' - int64, 's' - strings
+MESSAGES_COLUMNS = [('date_time', 'd'), ('line_num', 's'), ('reason', 's'),
+                    ('details', 's'), ('message', 's')]
+# the messages have it with several time ranges
+TIME_RANGES_COLUMN = ('time_ranges', 's')
+TIMELINE_COLUMNS = [('vm', 's'), ('host', 's'), ('start_time', 'd'),
+                    ('end_time', 'd')]
+COMMANDS_COLUMNS = [('log', 's'), ('id', 's'), ('parent_id', 's'),
+                    ('name', 's'), ('thread', 's'), ('flow_id', 's'),
+                    ('lvl', 'q'), ('first_line_num', 'q'),
+                    ('end_line_num', 'q'), ('start_time', 'd'),
+                    ('end_time', 'd'), ('duration', 'd')]
+# values of the missing fields
+MISSING = {'d': float('nan'), 'q': -1, 's': ''}
+NUMPY_TYPES = {'d': np.float64, 'q': np.int64}
+# the strings of a column are kept in .npz as their utf-8 bytes one after
+# another (<column>) and the offsets of every string (<column>_offsets)
+OFFSETS = '_offsets'
+
+
+def messages_columns(new_fields):
+    if TIME_RANGES_COLUMN[0] in new_fields:
+        return MESSAGES_COLUMNS + [TIME_RANGES_COLUMN]
+    return MESSAGES_COLUMNS
+
+
+def message_rows(errors, new_fields):
+    # errors - the shown messages (a list or the rows of a run file), the
+    # columns are messages_columns(new_fields)
+    idxs = [new_fields.index(name)
+            for name, kind in messages_columns(new_fields)]
+    for err in errors:
+        yield [err[idx] for idx in idxs]
+
+
+def timeline_rows(vm_timeline):
+    # vm_timeline: {vm: {host: [[start time, end time],...]}}
+    for vm in sorted(vm_timeline.keys()):
+        for host in sorted(vm_timeline[vm].keys()):
+            for start, end in vm_timeline[vm][host]:
+                yield [vm, host, start, end]
+
+
+def command_rows(commands):
+    # commands: {engine log: {id: command}}, every command is followed by
+    # its children (zchildren or ztasks) like in change_lvl_numbering
+    for log in sorted(commands.keys()):
+        stack = [(commands[log][com], '')
+                 for com in reversed(sorted(commands[log].keys()))]
+        while stack != []:
+            com, parent_id = stack.pop()
+            yield [log, com.get('id'), parent_id] + \
+                [com.get(name) for name, kind in COMMANDS_COLUMNS[3:]]
+            if 'zchildren' in com.keys():
+                children = com['zchildren']
+            elif 'ztasks' in com.keys():
+                children = com['ztasks']
+            else:
+                continue
+            stack += [(child, com.get('id', ''))
+                      for child in reversed(children)]
+
+
+def typed_columns(columns, rows):
+    # Lists of the values of the columns, the missing values and the numbers
+    # that are not numbers (like 'n/a') are replaced
+    values = [[] for column in columns]
+    for row in rows:
+        for col, (name, kind) in enumerate(columns):
+            value = row[col]
+            try:
+                if value is None:
+                    value = MISSING[kind]
+                elif kind == 'd':
+                    value = float(value)
+                elif kind == 'q':
+                    value = int(value)
+                else:
+                    value = str(value)
+            except ValueError:
+                value = MISSING[kind]
+            values[col].append(value)
+    return values
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk += [row]
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk != []:
+        yield chunk
+
+
+def write_parquet(filename, columns, rows):
+    types = {'d': pyarrow.float64(), 'q': pyarrow.int64(),
+             's': pyarrow.string()}
+    schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+    writer = pyarrow.parquet.ParquetWriter(filename, schema)
+    written = False
+    for chunk in chunks(rows, ROW_GROUP):
+        values = typed_columns(columns, chunk)
+        writer.write_table(pyarrow.Table.from_pydict(
+            dict([(name, values[col])
+                  for col, (name, kind) in enumerate(columns)]),
+            schema=schema))
+        written = True
+    if not written:
+        writer.write_table(schema.empty_table())
+    writer.close()
+
+
+def write_npz(filename, columns, rows):
+    # all the rows are kept in memory
+    values = typed_columns(columns, rows)
+    arrays = {}
+    for col, (name, kind) in enumerate(columns):
+        if kind != 's':
+            arrays[name] = np.array(values[col], dtype=NUMPY_TYPES[kind])
+            continue
+        data = [v.encode('utf-8', 'surrogateescape') for v in values[col]]
+        arrays[name] = np.frombuffer(b''.join(data), dtype=np.uint8)
+        arrays[name + OFFSETS] = np.cumsum([0] + [len(d) for d in data],
+                                           dtype=np.int64)
+    np.savez_compressed(filename, **arrays)
+
+
+def read_npz(filename):
+    # Returns {column: numpy array (numbers) or list of strings}
+    columns = {}
+    with np.load(filename) as f:
+        for name in f.files:
+            if name.endswith(OFFSETS):
+                continue
+            if name + OFFSETS not in f.files:
+                columns[name] = f[name]
+                continue
+            data = f[name].tobytes()
+            offsets = f[name + OFFSETS]
+            columns[name] = [str(data[offsets[i]:offsets[i + 1]], 'utf-8',
+                                 'surrogateescape')
+                             for i in range(len(offsets) - 1)]
+    return columns
+
+
+def export_tables(prefix, tables):
+    # tables: [(name, columns, rows),...], every table is written to
+    # <prefix>_<name>.parquet (or .npz). Returns the names of the files
+    filenames = []
+    for name, columns, rows in tables:
+        if pyarrow is not None:
+            filename = prefix + '_' + name + '.parquet'
+            write_parquet(filename, columns, rows)
+        else:
+            filename = prefix + '_' + name + '.npz'
+            write_npz(filename, columns, rows)
+        filenames += [filename]
+    return filenames
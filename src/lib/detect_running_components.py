@@ -1,18 +1,110 @@
 import os
 import re
+import bisect
+import functools
+import heapq
 import json
 import pytz
 import numpy as np
 from datetime import datetime
-import progressbar
-from progressbar import ProgressBar
-from lib.util import open_log_file
+from lib.util import open_log_file, reverse_lines
+from lib.progress import ProgressReporter
+from lib.log_records import log_records
+from lib.format_parsers import split_engine_line, EnginePattern
 
 
 re_timestamp = re.compile(
         r"[0-9\-]{10}[\sT][0-9]{2}:[0-9]{2}:[0-9]{2}[\.\,0-9]*[\+\-0-9Z]*")
 dt_formats = ["%Y-%m-%d %H:%M:%S,%f%z", "%Y-%m-%d %H:%M:%S%z"]
 
+# engine VMs and hosts, every regexp is tried only if the line contains its
+# literal part
+re_vm_id = re.compile(r"vmId=\'(.+?)\'")
+re_vm_id_dict = re.compile(r"\'vmId\'\ *[:=]\ *u*\'(.+?)\'")
+re_vm_name = re.compile(r"vmName\ *=\ *(.+?),")
+re_vm_name_vm = re.compile(r"vm\ *=\ *\'VM\ *\[([^\[\]]*?)\]\'")
+re_vm_name_vm_name = re.compile(r"\[(.+?)=VM_NAME\]")
+re_vm_name_vm_name_value = re.compile(r"\[([^\[\]]*?)=VM_NAME\]")
+re_vm_name_bracket = re.compile(r"\[(.+?)=VM\]")
+re_vm_name_bracket_value = re.compile(r"\[([^\[\]]*?)=VM\]")
+re_vm_name_dict = re.compile(r"\'vmName\'\ *[:=]\ *u*\'([^\']*?)\'")
+re_other_vm = re.compile(r'VM\ *\'(.{30,40}?)\'\ *\(([^\(\)]*?)\)')
+re_host_name = re.compile(r"HostName\ *=\ *(.+?),")
+re_host_id = re.compile(r"hostId=\'(.+?)\'")
+# engine commands and tasks, matched after splitting the line
+engine_running_command = EnginePattern(r"\ +[Rr]unning [Cc]ommand:\ +" +
+                                       r"([^\s]+)[Cc]ommand")
+engine_start = EnginePattern(r"\ +[Ss][Tt][Aa][Rr][Tt],\ +" +
+                             r"([^\s]+)Command.*\ +log id:\ (.+)")
+engine_finish = EnginePattern(r"\ +[Ff][Ii][Nn][Ii][Ss][Hh],\ +" +
+                              r"([^\s]+)Command.*\ +log id:\ (.+)")
+engine_ending = EnginePattern(r"\ +[Ee]nding\ +[Cc]ommand\ *" +
+                              r"\'.+\.(.+)Command\'\ *successfully")
+engine_multiasync = EnginePattern(r".+[Aa]dding\ +CommandMultiAsyncTasks\ +" +
+                                  r"[Oo]bject\ +[Ff]or\ +[Cc]ommand\ +" +
+                                  r"\'(.+?)\'")
+engine_subtask_init = EnginePattern(r".+[Aa]ttaching [Tt]ask\ +\'(.+?)\'\ +" +
+                                    r"[Tt]o [Cc]ommand\ +\'(.+?)\'")
+engine_subtask_start = EnginePattern(r".+[Aa]dding [Tt]ask\ +\'(.+?)\'\ +" +
+                                     r"\(*[Pp]arent [Cc]ommand\ +\'(.+?)\'" +
+                                     r".*\)")
+engine_subtask_wait = EnginePattern(r".+[Cc]ommand\ +\'(.+?)\'\ +" +
+                                    r"\([IDid]+\:\ +\'(.+?)\'\)\ +" +
+                                    r"[Ww]aiting [Oo]n\ +[Cc]hild.+" +
+                                    r"[IDid]\:\ +\'(.+?)\'\ +" +
+                                    r"[Tt]ype\:\ *\'(.+?)\'")
+engine_subtask_end = EnginePattern(r".+[Rr]emoved [Tt]ask\ +\'(.+?)\'\ +" +
+                                   r"[Ff]rom [Dd]ata[Bb]ase")
+# engine VMs timeline
+re_vm_start = re.compile(r'(VM|Guest)\ +([^\ ]+)\ +' +
+                         r'(started|was restarted)\ +on\ +[Hh]ost\ +' +
+                         r'([^\ ]+?)([\ +\,]+|$)')
+re_migration_start = re.compile(r'[Mm]igration\ +started' +
+                                r'\ +\(VM\:\ +([^\ ]+),\ +[Ss]ource\:' +
+                                r'\ +([^\ ]+)\,\ +[Dd]estination\:\ +' +
+                                r'([^\ ]+?)[\ +\,]+')
+re_migration_end = re.compile(r'[Mm]igration\ +completed' +
+                              r'\ +\(VM\:\ +([^\ ]+),\ +[Ss]ource\:' +
+                              r'\ +([^\ ]+)\,\ +[Dd]estination\:\ +' +
+                              r'([^\ ]+?)[\ +\,]+')
+re_vm_suspend = re.compile(r'VM\ +([^\ ]+)\ +' +
+                           r'on\ +[Hh]ost\ +([^\ ]+)[\ +\,]+is suspended')
+re_vm_down = re.compile(r'VM\ +([^\ ]+)\ +is [Dd]own')
+
+
+def search_pattern(stats, name, regexp, line):
+    # regexp.search counting searches and matches of every pattern
+    result = regexp.search(line)
+    if name not in stats.keys():
+        stats[name] = [0, 0]
+    stats[name][0] += 1
+    if result is not None:
+        stats[name][1] += 1
+    return result
+
+
+def merge_pattern_stats(all_stats):
+    # Sums stats of files and adds shares of searched lines and matches
+    total = {}
+    for stats in all_stats:
+        for name in stats.keys():
+            if name == 'lines':
+                total['lines'] = total.get('lines', 0) + stats[name]
+                continue
+            if name not in total.keys():
+                total[name] = [0, 0]
+            total[name][0] += stats[name][0]
+            total[name][1] += stats[name][1]
+    lines = total.pop('lines', 0)
+    report = {'lines': lines, 'patterns': {}}
+    for name in total.keys():
+        report['patterns'][name] = {
+            'searches': total[name][0],
+            'matches': total[name][1],
+            'searched_lines': total[name][0]/max(lines, 1),
+            'hit_rate': total[name][1]/max(total[name][0], 1)}
+    return report
+
 
 def parse_date_time(line, time_zone):
     dt = re_timestamp.search(line)
@@ -45,31 +137,58 @@ def parse_date_time(line, time_zone):
     return date_time
 
 
-def find_time_range(output_descriptor, log_directory, files, tz_info,
+def find_file_time_range(log_directory, log, time_zone):
+    # Returns [first datetime, last datetime] of the logfile
+    full_filename = os.path.join(log_directory, log)
+    f = open_log_file(full_filename, 'rb')
+    if f is None:
+        return None
+    file_range = []
+    dt = 0
+    while dt == 0:
+        line = f.readline()
+        if line == b'':
+            break
+        dt = parse_date_time(line.decode('utf-8', 'replace'), time_zone)
+    file_range += [dt]
+    dt = 0
+    for line in reverse_lines(f):
+        dt = parse_date_time(line, time_zone)
+        if dt != 0:
+            break
+    file_range += [dt]
+    f.close()
+    return file_range
+
+
+def merge_time_ranges(time_ranges):
+    # Returns the time ranges sorted with the overlapping and adjacent ones
+    # merged, so every part of a logfile is read once
+    merged = []
+    for time_range in sorted(time_ranges, key=lambda k: k[0]):
+        if merged != [] and time_range[0] <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], time_range[1])
+        else:
+            merged += [[time_range[0], time_range[1]]]
+    return merged
+
+
+def time_range_tags(time_ranges, date_time):
+    # Indexes of the (not merged) time ranges that contain the date_time
+    return [tr_idx for tr_idx, time_range in enumerate(time_ranges)
+            if time_range[0] <= date_time <= time_range[1]]
+
+
+def find_time_range(output_descriptor, files, files_ranges,
                     time_range_info):
+    # files_ranges: results of find_file_time_range for every file
     logs_datetimes = {}
     relevant_logs = []
     for log_idx, log in enumerate(files):
-        full_filename = os.path.join(log_directory, log)
-        f = open_log_file(full_filename)
-        if f is None:
+        if files_ranges[log_idx] is None:
             output_descriptor.write("Unknown file extension: %s" % log)
             continue
-        logs_datetimes[log] = []
-        dt = 0
-        while dt == 0:
-            dt = parse_date_time(f.readline(), tz_info[log_idx])
-        logs_datetimes[log] += [dt]
-        f.seek(0, os.SEEK_END)
-        file_len = f.tell()
-        offset = 1
-        dt = 0
-        while dt == 0:
-            while f.read(1) != "\n":
-                offset += 1
-                f.seek(file_len-offset, os.SEEK_SET)
-            dt = parse_date_time(f.readline(), tz_info[log_idx])
-        logs_datetimes[log] += [dt]
+        logs_datetimes[log] = files_ranges[log_idx]
         if (logs_datetimes[log][1] < logs_datetimes[log][0]):
             output_descriptor.write(('Warning: %s - end datetime (%s) is ' +
                                      'less than start time (%s)\n') %
@@ -110,160 +229,97 @@ def find_time_range(output_descriptor, log_directory, files, tz_info,
     return logs_datetimes, relevant_logs
 
 
-def find_needed_linenum(output_descriptor, log_directory, files, tz_info,
-                        time_range_info):
+def find_file_needed_linenum(log_directory, log, time_zone, time_range_info):
+    # Returns [[first position, last position],...] for every time range.
+    # The time ranges are sorted and do not overlap (merge_time_ranges), so
+    # all of them are found in one forward pass over the binary file that
+    # stops after the last range. A range ends before the first line after
+    # it, a range that is not in the file gets an empty window
+    full_filename = os.path.join(log_directory, log)
+    f = open_log_file(full_filename, 'rb')
+    if f is None:
+        return None
+    needed_linenum = []
+    if time_range_info == []:
+        f.seek(0, os.SEEK_END)
+        needed_linenum += [[0, f.tell()]]
+        f.close()
+        return needed_linenum
+    first_pos = None
+    pos = 0
+    for line in f:
+        dt = parse_date_time(line.decode('utf-8', 'replace'), time_zone)
+        while dt != 0 and len(needed_linenum) < len(time_range_info):
+            time_range = time_range_info[len(needed_linenum)]
+            if first_pos is None and dt >= time_range[0]:
+                first_pos = pos
+            if dt <= time_range[1]:
+                break
+            needed_linenum += [[pos if first_pos is None else first_pos,
+                                pos]]
+            first_pos = None
+        if len(needed_linenum) == len(time_range_info):
+            break
+        pos += len(line)
+    # the ranges that are not over at the end of the file
+    while len(needed_linenum) < len(time_range_info):
+        needed_linenum += [[pos if first_pos is None else first_pos, pos]]
+        first_pos = None
+    f.close()
+    return needed_linenum
+
+
+def find_needed_linenum(output_descriptor, files, files_positions):
+    # files_positions: results of find_file_needed_linenum for every file
     needed_linenum = {}
     for log_idx, log in enumerate(files):
-        full_filename = os.path.join(log_directory, log)
-        f = open_log_file(full_filename)
-        if f is None:
+        if files_positions[log_idx] is None:
             output_descriptor.write("Unknown file extension: %s" % log)
             continue
-        needed_linenum[log] = []
-        if time_range_info == []:
-            f.seek(0, os.SEEK_END)
-            needed_linenum[log] += [[0, f.tell()]]
-            continue
-        for tr_idx in range(len(time_range_info)):
-            f.seek(0, os.SEEK_SET)
-            needed_time = time_range_info[tr_idx][0]
-            dt = 0
-            while dt == 0:
-                cur_pos = f.tell()
-                dt = parse_date_time(f.readline(), tz_info[log_idx])
-
-            # if (dt >= needed_time and dt < time_range_info[tr_idx][1]):
-            #     needed_linenum[log] += [[cur_pos, cur_pos]]
-            #     continue
-            cur_time = dt
-            prev_time = dt
-            f.seek(0, os.SEEK_END)
-            file_len = f.tell()
-            dt = 0
-            offset = 1
-            while dt == 0:
-                while f.read(1) != "\n":
-                    offset += 1
-                    f.seek(file_len-offset, os.SEEK_SET)
-                cur_pos = f.tell()
-                dt = parse_date_time(f.readline(), tz_info[log_idx])
-            prev_pos = 0
-            cur_pos = 0
-            next_pos = file_len//2
-            condition = False
-            was_found = False
-            while not (was_found and condition):
-                f.seek(next_pos, os.SEEK_SET)
-                offset = 1
-                while f.read(1) != "\n" and next_pos-offset >= 0:
-                    f.seek(next_pos-offset, os.SEEK_SET)
-                    offset += 1
-                prev_pos = cur_pos
-                dt = 0
-                while dt == 0:
-                    cur_pos = f.tell()
-                    dt = parse_date_time(f.readline(), tz_info[log_idx])
-                prev_time = cur_time
-                cur_time = dt
-                if cur_time >= needed_time:
-                    next_pos = cur_pos - (cur_pos - prev_pos)//2
-                else:
-                    next_pos = prev_pos - (prev_pos - cur_pos)//2
-                condition = (prev_time <= needed_time) \
-                    and (cur_time > needed_time) \
-                    or (prev_time > needed_time) \
-                    and (cur_time <= needed_time) \
-                    or (cur_time == prev_time)
-                if condition:
-                    was_found = True
-                    if cur_time != prev_time:
-                        condition = False
-
-            border_left = min(prev_pos, cur_pos)
-            # end-range
-            needed_time = time_range_info[tr_idx][1]
-            cur_time = dt
-            prev_time = dt
-            f.seek(0, os.SEEK_END)
-            file_len = f.tell()
-            dt = 0
-            offset = 1
-            while dt == 0:
-                while f.read(1) != "\n":
-                    offset += 1
-                    f.seek(file_len-offset, os.SEEK_SET)
-                cur_pos = f.tell()
-                dt = parse_date_time(f.readline(), tz_info[log_idx])
-            prev_pos = border_left
-            cur_pos = border_left
-            next_pos = file_len//2
-            condition = False
-            was_found = False
-            while not (was_found and condition):
-                f.seek(next_pos, os.SEEK_SET)
-                offset = 1
-                while f.read(1) != "\n" and next_pos-offset >= 0:
-                    offset += 1
-                    f.seek(next_pos-offset, os.SEEK_SET)
-                prev_pos = cur_pos
-                dt = 0
-                while dt == 0:
-                    cur_pos = f.tell()
-                    dt = parse_date_time(f.readline(), tz_info[log_idx])
-                prev_time = cur_time
-                cur_time = dt
-                if cur_time >= needed_time:
-                    next_pos = cur_pos - (cur_pos - prev_pos)//2
-                else:
-                    next_pos = prev_pos - (prev_pos - cur_pos)//2
-                condition = (prev_time < needed_time) \
-                    and (cur_time >= needed_time) \
-                    or (prev_time >= needed_time) \
-                    and (cur_time < needed_time) \
-                    or (cur_time == prev_time)
-                if condition:
-                    was_found = True
-                    if cur_time != prev_time:
-                        condition = False
-            border_right = max(prev_pos, cur_pos)
-            needed_linenum[log] += [[border_left, border_right]]
+        needed_linenum[log] = files_positions[log_idx]
     return needed_linenum
 
 
-def libvirtd_vm_host(f, filename, pos, tz_info, vms, hosts,
-                     time_range_info):
+def first_line_position(f, start_time, tz_info):
+    # Position of the first line (from the current one) of a binary file
+    # with a date_time not before start_time, the end of the file if there
+    # is no such line
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if line == b'':
+            return pos
+        dt = parse_date_time(line.decode('utf-8', 'replace'), tz_info)
+        if dt != 0 and dt >= start_time:
+            return pos
+
+
+def libvirtd_vm_host(f, pos, tz_info, vms, hosts, time_range_info,
+                     lookbehind, progress):
     cur = {}
     f.seek(0, os.SEEK_END)
     file_len = f.tell()
     multiline = False
     f.seek(pos[0], os.SEEK_SET)
-    dt = 0
-    c = 0
-    while dt < time_range_info[0]:
-        c += 1
-        dt = 0
-        while dt == 0:
-            real_firstpos = f.tell()
-            dt = parse_date_time(f.readline(), tz_info)
-    # f.seek(real_firstpos, os.SEEK_SET)
-    f.seek(0, os.SEEK_SET)
-    widget_style = [filename + ':', progressbar.Percentage(), ' (',
-                    progressbar.SimpleProgress(), ')', ' ',
-                    progressbar.Bar(), ' ', progressbar.Timer()]
-    bar = ProgressBar(widgets=widget_style, max_value=file_len)
-    # i = real_firstpos
-    i = 0
+    real_firstpos = first_line_position(f, time_range_info[0], tz_info)
+    # VMs defined shortly before the time range are searched too
+    i = max(real_firstpos - lookbehind, 0)
+    f.seek(i, os.SEEK_SET)
+    if i > 0:
+        # skip the cut line
+        f.readline()
+        i = f.tell()
     real_lastpos = file_len
-    bar.update(i)
-    for line_num, line in enumerate(f):
-        i += len(line)
-        bar.update(i)
-        dt = parse_date_time(line, tz_info)
-        if dt == 0:
+    date_time = functools.partial(parse_date_time, time_zone=tz_info)
+    for record in log_records(f, date_time, i, progress=progress):
+        if record.line is None:
             continue
-        if dt >= time_range_info[1] and real_lastpos == file_len:
-            real_lastpos = i + real_firstpos
-        #     break
+        line = record.line
+        dt = record.date_time
+        if dt > time_range_info[1]:
+            # the window ends before the first record after the range
+            real_lastpos = max(record.pos, real_firstpos)
+            break
         vm_name = re.search(r'\<name\>(.+?)\<\/name\>', line)
         if (not multiline and vm_name is not None):
             multiline = True
@@ -309,43 +365,36 @@ def libvirtd_vm_host(f, filename, pos, tz_info, vms, hosts,
             if (other_vm.group(1) not in vms.keys()):
                 vms[other_vm.group(1)] = {'id': set(), 'hostids': set()}
             vms[other_vm.group(1)]['id'].add(other_vm.group(2))
-    bar.finish()
     return vms, hosts, real_firstpos, real_lastpos
 
 
-def vdsm_vm_host(f, filename, pos, tz_info, vms, hosts, time_range_info):
+def vdsm_vm_host(f, pos, tz_info, vms, hosts, time_range_info, lookbehind,
+                 progress):
     cur = {}
     f.seek(0, os.SEEK_END)
     file_len = f.tell()
     this_host = ''
     multiline = False
     f.seek(pos[0], os.SEEK_SET)
-    dt = 0
-    while dt < time_range_info[0]:
-        dt = 0
-        while dt == 0:
-            real_firstpos = f.tell()
-            dt = parse_date_time(f.readline(), tz_info)
-    # f.seek(real_firstpos, os.SEEK_SET)
-    f.seek(0, os.SEEK_SET)
-    widget_style = [filename + ':', progressbar.Percentage(), ' (',
-                    progressbar.SimpleProgress(), ')', ' ',
-                    progressbar.Bar(), ' ', progressbar.Timer()]
-    bar = ProgressBar(widgets=widget_style, max_value=file_len,
-                      redirect_stdout=True)
-    # i = real_firstpos
-    i = 0
+    real_firstpos = first_line_position(f, time_range_info[0], tz_info)
+    # VMs defined shortly before the time range are searched too
+    i = max(real_firstpos - lookbehind, 0)
+    f.seek(i, os.SEEK_SET)
+    if i > 0:
+        # skip the cut line
+        f.readline()
+        i = f.tell()
     real_lastpos = file_len
-    bar.update(i)
-    for line_num, line in enumerate(f):
-        i += len(line)
-        bar.update(i)
-        dt = parse_date_time(line, tz_info)
-        if dt == 0:
+    date_time = functools.partial(parse_date_time, time_zone=tz_info)
+    for record in log_records(f, date_time, i, progress=progress):
+        if record.line is None:
             continue
-        if dt >= time_range_info[1] and real_lastpos == file_len:
-            real_lastpos = i + real_firstpos
-        #     break
+        line = record.line
+        dt = record.date_time
+        if dt > time_range_info[1]:
+            # the window ends before the first record after the range
+            real_lastpos = max(record.pos, real_firstpos)
+            break
         vdsm_host = re.search(r'I am the actual vdsm ' +
                               r'([^\ ]+)\ +([^\ ]+)', line)
         if vdsm_host is not None:
@@ -378,93 +427,89 @@ def vdsm_vm_host(f, filename, pos, tz_info, vms, hosts, time_range_info):
             if this_host != '':
                 vms[other_vm.group(2)]['hostids'].add(this_host)
                 hosts[this_host]['vmids'].add(other_vm.group(1))
-    bar.finish()
     return vms, hosts, real_firstpos, real_lastpos
 
 
-def engine_vm_host(f, filename, pos, tz_info, vms, hosts, time_range_info):
+def engine_vm_host(f, pos, tz_info, vms, hosts, time_range_info, lookbehind,
+                   progress, stats):
     f.seek(0, os.SEEK_END)
     file_len = f.tell()
     f.seek(pos[0], os.SEEK_SET)
-    dt = 0
-    while dt < time_range_info[0]:
-        dt = 0
-        while dt == 0:
-            real_firstpos = f.tell()
-            dt = parse_date_time(f.readline(), tz_info)
-    # f.seek(real_firstpos, os.SEEK_SET)
-    f.seek(0, os.SEEK_SET)
-    widget_style = [filename + ':', progressbar.Percentage(), ' (',
-                    progressbar.SimpleProgress(), ')', ' ',
-                    progressbar.Bar(), ' ', progressbar.Timer()]
-    bar = ProgressBar(widgets=widget_style, max_value=file_len)
-    # i = real_firstpos
-    i = 0
+    real_firstpos = first_line_position(f, time_range_info[0], tz_info)
+    # VMs defined shortly before the time range are searched too
+    i = max(real_firstpos - lookbehind, 0)
+    f.seek(i, os.SEEK_SET)
+    if i > 0:
+        # skip the cut line
+        f.readline()
+        i = f.tell()
     real_lastpos = file_len
-    bar.update(i)
     unknown_vmnames = []
-    for line_num, line in enumerate(f):
-        i += len(line)
-        bar.update(i)
-        dt = parse_date_time(line, tz_info)
-        if dt == 0:
+    date_time = functools.partial(parse_date_time, time_zone=tz_info)
+    for record in log_records(f, date_time, i, progress=progress):
+        if record.line is None:
             continue
+        line = record.line
+        dt = record.date_time
+        stats['lines'] = stats.get('lines', 0) + 1
         vm_name = ''
         vm_id = ''
         host_name = ''
         host_id = ''
-        if dt >= time_range_info[1] and real_lastpos == file_len:
-            real_lastpos = i + real_firstpos
-        #     break
-        if any([v in line.lower() for v in ['vmid', 'vmname', 'vm_name']]):
-            if (re.search(r"vmId=\'(.+?)\'", line) is not None):
-                vm_id = re.search(r"vmId=\'(.+?)\'", line).group(1)
-            elif (re.search(r"\'vmId\'\ *[:=]\ *u*\'(.+?)\'",
-                            line) is not None):
-                vm_id = re.search(
-                    r"\'vmId\'\ *[:=]\ *u*\'(.+?)\'", line).group(1)
-            else:
-                vm_id = ''
-            if (re.search(r"vmName\ *=\ *(.+?),", line) is not None):
-                vm_name = re.sub('[\'\"]', '',
-                                 re.search(r"vmName\ *=\ *(.+?),",
-                                           line).group(1))
-            elif (re.search(r"vm\ *=\ *\'VM\ *\[([^\[\]]*?)\]\'",
-                            line) is not None):
-                vm_name = re.sub('[\'\"]', '',
-                                 re.search(r"vm\ *=\ *\'VM\ *" +
-                                           r"\[([^\[\]]*?)\]\'",
-                                           line).group(1))
-            elif (re.search(r"\[(.+?)=VM_NAME\]", line) is not None):
-                vm_name = re.sub('[\'\"]', '',
-                                 re.search(r"\[([^\[\]]*?)=VM_NAME\]",
-                                           line).group(1))
-            elif (re.search(r"\[(.+?)=VM\]", line) is not None):
-                vm_name = re.sub('[\'\"]', '',
-                                 re.search(r"\[([^\[\]]*?)=VM\]",
-                                           line).group(1))
-            elif (re.search(r"\'vmName\'\ *[:=]\ *u*\'([^\']*?)\'",
-                            line) is not None):
-                vm_name = re.sub('[\'\"]', '',
-                                 re.search(r"\'vmName\'" +
-                                           r"\ *[:=]\ *u*\'([^\']*?)\'",
-                                           line).group(1))
-            else:
-                vm_name = ''
-        if (vm_name == '' and vm_id == ''):
-            other_vm = re.search(r'VM\ *\'(.{30,40}?)\'\ *' +
-                                 r'\(([^\(\)]*?)\)', line)
+        if dt > time_range_info[1]:
+            # the window ends before the first record after the range
+            real_lastpos = max(record.pos, real_firstpos)
+            break
+        line_lower = line.lower()
+        if any([v in line_lower for v in ['vmid', 'vmname', 'vm_name']]):
+            vm = None
+            if 'vmId' in line:
+                vm = search_pattern(stats, 'vmId=', re_vm_id, line)
+                if vm is None:
+                    vm = search_pattern(stats, "'vmId':", re_vm_id_dict, line)
+            if vm is not None:
+                vm_id = vm.group(1)
+            vm = None
+            if 'vmName' in line:
+                vm = search_pattern(stats, 'vmName=', re_vm_name, line)
+            if vm is None and "'VM" in line:
+                vm = search_pattern(stats, "vm='VM [...]'", re_vm_name_vm,
+                                    line)
+            if vm is None and '=VM_NAME]' in line:
+                vm = search_pattern(stats, '[...=VM_NAME]',
+                                    re_vm_name_vm_name, line)
+                if vm is not None:
+                    vm = re_vm_name_vm_name_value.search(line)
+            if vm is None and '=VM]' in line:
+                vm = search_pattern(stats, '[...=VM]', re_vm_name_bracket,
+                                    line)
+                if vm is not None:
+                    vm = re_vm_name_bracket_value.search(line)
+            if vm is None and "'vmName'" in line:
+                vm = search_pattern(stats, "'vmName':", re_vm_name_dict,
+                                    line)
+            if vm is not None:
+                vm_name = re.sub('[\'\"]', '', vm.group(1))
+        if (vm_name == '' and vm_id == '' and 'VM' in line
+                and '(' in line):
+            other_vm = search_pattern(stats, "VM '...' (...)", re_other_vm,
+                                      line)
             if (other_vm is not None):
                 vm_name = other_vm.group(2)
                 vm_id = other_vm.group(1)
-        if (any([i in line.lower() for i in ['hostid',
-                                             'hostname']])):
-            host_name = re.search(r"HostName\ *=\ *(.+?),", line)
+        if (any([i in line_lower for i in ['hostid',
+                                           'hostname']])):
+            host_name = None
+            if 'HostName' in line:
+                host_name = search_pattern(stats, 'HostName=', re_host_name,
+                                           line)
             if host_name is not None:
                 host_name = host_name.group(1)
             else:
                 host_name = ''
-            host_id = re.search(r"hostId=\'(.+?)\'", line)
+            host_id = None
+            if "hostId='" in line:
+                host_id = search_pattern(stats, 'hostId=', re_host_id, line)
             if host_id is not None:
                 host_id = host_id.group(1)
             else:
@@ -487,25 +532,26 @@ def engine_vm_host(f, filename, pos, tz_info, vms, hosts, time_range_info):
             hosts[host_name] = {'id': set(), 'vmids': set()}
         hosts[host_name]['id'].add(host_id)
         hosts[host_name]['vmids'].add(vm_id)
-    bar.finish()
     return vms, unknown_vmnames, hosts, real_firstpos, real_lastpos
 
 
-def timeline_for_engine_vm(output_directory, log_directory, f, filename,
-                           output_descriptor, tz_info, vms, hosts):
+def timeline_for_engine_vm(f, tz_info, vms, hosts, stats):
     all_vms = {}
     for vm in vms.keys():
         all_vms[vm] = {}
         for host in vms[vm]['hostids']:
             all_vms[vm][host] = []
-    for line_num, line in enumerate(f):
-        dt = parse_date_time(line, tz_info)
-        if dt == 0:
+    date_time = functools.partial(parse_date_time, time_zone=tz_info)
+    for record in log_records(f, date_time):
+        if record.line is None:
             continue
-        vm_start = re.search(r'(VM|Guest)\ +([^\ ]+)\ +' +
-                             r'(started|was restarted)\ +on\ +[Hh]ost\ +' +
-                             r'([^\ ]+?)([\ +\,]+|$)',
-                             line)
+        line = record.line
+        dt = record.date_time
+        stats['lines'] = stats.get('lines', 0) + 1
+        vm_start = None
+        if 'started' in line:
+            vm_start = search_pattern(stats, 'started on host', re_vm_start,
+                                      line)
         if vm_start is not None:
             this_host = ''
             if vm_start.group(2) not in all_vms.keys():
@@ -521,11 +567,13 @@ def timeline_for_engine_vm(output_directory, log_directory, f, filename,
                 all_vms[vm_start.group(2)][this_host] = []
             all_vms[vm_start.group(2)][this_host] += [(dt, 'start')]
         # migration
-        migration_start = re.search(r'[Mm]igration\ +started' +
-                                    r'\ +\(VM\:\ +([^\ ]+),\ +[Ss]ource\:' +
-                                    r'\ +([^\ ]+)\,\ +[Dd]estination\:\ +' +
-                                    r'([^\ ]+?)[\ +\,]+',
-                                    line)
+        migration_start = None
+        migration_end = None
+        if 'igration' in line:
+            migration_start = search_pattern(stats, 'migration started',
+                                             re_migration_start, line)
+            migration_end = search_pattern(stats, 'migration completed',
+                                           re_migration_end, line)
         if migration_start is not None:
             this_host = ''
             if migration_start.group(1) not in all_vms.keys():
@@ -547,11 +595,6 @@ def timeline_for_engine_vm(output_directory, log_directory, f, filename,
             all_vms[migration_start.group(1)][
                     this_host] += [(dt, 'migrating_to')]
         # migration completed
-        migration_end = re.search(r'[Mm]igration\ +completed' +
-                                  r'\ +\(VM\:\ +([^\ ]+),\ +[Ss]ource\:' +
-                                  r'\ +([^\ ]+)\,\ +[Dd]estination\:\ +' +
-                                  r'([^\ ]+?)[\ +\,]+',
-                                  line)
         if migration_end is not None:
             this_host = ''
             if migration_end.group(1) not in all_vms.keys():
@@ -571,9 +614,10 @@ def timeline_for_engine_vm(output_directory, log_directory, f, filename,
                 all_vms[migration_end.group(1)][this_host] = []
             all_vms[migration_end.group(1)][this_host] += [(dt, 'migrated_to')]
         # suspend
-        vm_suspend = re.search(r'VM\ +([^\ ]+)\ +' +
-                               r'on\ +[Hh]ost\ +([^\ ]+)[\ +\,]+is suspended',
-                               line)
+        vm_suspend = None
+        if 'is suspended' in line:
+            vm_suspend = search_pattern(stats, 'is suspended', re_vm_suspend,
+                                        line)
         if vm_suspend is not None:
             this_host = ''
             if vm_suspend.group(1) not in all_vms.keys():
@@ -589,8 +633,9 @@ def timeline_for_engine_vm(output_directory, log_directory, f, filename,
                 all_vms[vm_suspend.group(1)][this_host] = []
             all_vms[vm_suspend.group(1)][this_host] += [(dt, 'suspend')]
         # down
-        vm_down = re.search(r'VM\ +([^\ ]+)\ +is [Dd]own',
-                            line)
+        vm_down = None
+        if ' is Down' in line or ' is down' in line:
+            vm_down = search_pattern(stats, 'is down', re_vm_down, line)
         if vm_down is not None:
             if vm_down.group(1) not in all_vms.keys():
                 all_vms[vm_down.group(1)] = {}
@@ -598,10 +643,6 @@ def timeline_for_engine_vm(output_directory, log_directory, f, filename,
                 all_vms[vm_down.group(1)][host] += [(dt, 'down')]
     if all_vms != {}:
         all_vms = create_time_ranges_for_vms(all_vms)
-    json.dump(all_vms, open(os.path.join(output_directory,
-                            filename +
-                            '_VMs_timeline.json'),
-                            'w'), indent=4, sort_keys=True)
     return all_vms
 
 
@@ -644,44 +685,69 @@ def create_time_ranges_for_vms(vms):
     return vm_time_range
 
 
-def find_all_vm_host(positions,
-                     output_descriptor,
-                     output_directory,
-                     log_directory,
-                     files,
-                     tz_info,
-                     time_range_info):
+def find_file_vm_host(log_directory, log, log_positions, tz_info,
+                      time_range_info, lookbehind, progress_slot):
+    # Returns the inventory of one logfile: VMs, hosts, VM ids with unknown
+    # names, [[first position, last position],...] for every time range and
+    # regexps statistics.
+    # Only the time range and lookbehind bytes before it are scanned, the
+    # file is read in binary mode so the positions are in bytes
+    full_filename = os.path.join(log_directory, log)
+    f = open_log_file(full_filename, 'rb')
+    if f is None:
+        return None
+    progress = ProgressReporter(progress_slot)
+    vms = {}
+    hosts = {}
+    unknown_vmnames = []
+    first_lines = []
+    stats = {}
+    for tr_idx, log_position in enumerate(log_positions):
+        if 'vdsm' in log.lower():
+            vms, hosts, firstline_pos, lastline_pos = \
+                vdsm_vm_host(f, log_position, tz_info, vms, hosts,
+                             time_range_info[tr_idx], lookbehind, progress)
+        elif 'libvirt' in log.lower():
+            vms, hosts, firstline_pos, lastline_pos = \
+                libvirtd_vm_host(f, log_position, tz_info, vms, hosts,
+                                 time_range_info[tr_idx], lookbehind,
+                                 progress)
+        else:
+            vms, unknown_vmnames, hosts, firstline_pos, lastline_pos = \
+                engine_vm_host(f, log_position, tz_info, vms, hosts,
+                               time_range_info[tr_idx], lookbehind,
+                               progress, stats)
+        first_lines += [[firstline_pos, lastline_pos]]
+    progress.flush()
+    f.close()
+    return vms, hosts, unknown_vmnames, first_lines, stats
+
+
+def find_all_vm_host(output_descriptor, files, inventories):
+    # inventories: results of find_file_vm_host for every file, they are
+    # merged in the order of the files
     vms = {}
     hosts = {}
     # list of number of first lines for the time range to pass others
     first_lines = {}
     unknown_vmnames = []
     for log_idx, log in enumerate(files):
-        full_filename = os.path.join(log_directory, log)
-        f = open_log_file(full_filename)
-        if f is None:
+        if inventories[log_idx] is None:
             output_descriptor.write("Unknown file extension: %s" % log)
             continue
-        first_lines[log] = []
-        for tr_idx, log_position in enumerate(positions[log]):
-            if 'vdsm' in log.lower():
-                vms, hosts, firstline_pos, lastline_pos = \
-                    vdsm_vm_host(f, log, log_position,
-                                 tz_info[log_idx], vms, hosts,
-                                 time_range_info[tr_idx])
-            elif 'libvirt' in log.lower():
-                vms, hosts, firstline_pos, lastline_pos = \
-                    libvirtd_vm_host(f, log, log_position,
-                                     tz_info[log_idx], vms, hosts,
-                                     time_range_info[tr_idx])
-            else:
-                vms, unknown_vmnames, hosts, firstline_pos, lastline_pos = \
-                    engine_vm_host(f, log, log_position,
-                                   tz_info[log_idx],
-                                   vms, hosts,
-                                   time_range_info[tr_idx])
-            first_lines[log] += [[firstline_pos, lastline_pos]]
-        f.close()
+        file_vms, file_hosts, file_unknown_vmnames, first_lines[log], \
+            stats = inventories[log_idx]
+        for vm_name in file_vms.keys():
+            if vm_name not in vms.keys():
+                vms[vm_name] = {'id': set(), 'hostids': set()}
+            vms[vm_name]['id'] |= file_vms[vm_name]['id']
+            vms[vm_name]['hostids'] |= file_vms[vm_name]['hostids']
+        for host_name in file_hosts.keys():
+            if host_name not in hosts.keys():
+                hosts[host_name] = {'id': set(), 'vmids': set()}
+            hosts[host_name]['id'] |= file_hosts[host_name]['id']
+            hosts[host_name]['vmids'] |= file_hosts[host_name]['vmids']
+        unknown_vmnames += file_unknown_vmnames
     # print('------VMS------')
     not_running_vms = []
     for k in sorted(vms.keys()):
@@ -725,189 +791,230 @@ def find_all_vm_host(positions,
             hosts[k]['id'].remove('')
         if ('' in hosts[k]['vmids']):
             hosts[k]['vmids'].remove('')
+    return vms, hosts, not_running_vms, not_found_vmnames, \
+        not_found_hostnames, first_lines
+
+
+def find_file_vm_timeline(log_directory, log, log_positions, tz_info, vms,
+                          hosts):
+    # Returns timeline of VMs on hosts for every time range of an engine log
+    # and regexps statistics
+    full_filename = os.path.join(log_directory, log)
+    f = open_log_file(full_filename)
+    if f is None:
+        return None
+    timelines = []
+    stats = {}
+    for tr_idx, log_position in enumerate(log_positions):
+        timelines += [timeline_for_engine_vm(f, tz_info, vms, hosts, stats)]
+    f.close()
+    return timelines, stats
+
+
+def merge_vm_timelines(output_descriptor, output_directory, files,
+                       timelines):
+    # timelines: results of find_file_vm_timeline for every engine log
     vms_timeline = {}
     for log_idx, log in enumerate(files):
-        if 'engine' not in log:
-            continue
-        full_filename = os.path.join(log_directory, log)
-        f = open_log_file(full_filename)
-        if f is None:
+        if timelines[log_idx] is None:
             output_descriptor.write("Unknown file extension: %s" % log)
             continue
-        for tr_idx, log_position in enumerate(positions[log]):
-            cur_timeline = timeline_for_engine_vm(output_directory,
-                                                  log_directory, f, log,
-                                                  output_descriptor,
-                                                  tz_info[log_idx], vms,
-                                                  hosts)
+        for cur_timeline in timelines[log_idx][0]:
+            json.dump(cur_timeline, open(os.path.join(output_directory,
+                                         log +
+                                         '_VMs_timeline.json'),
+                                         'w'), indent=4, sort_keys=True)
             vms_timeline.update(cur_timeline)
-    return vms, hosts, not_running_vms, not_found_vmnames, \
-        not_found_hostnames, first_lines, vms_timeline
+    return vms_timeline
+
+
+class EngineCommandsIndex:
+    # Lookups in commands_threads of find_vm_tasks_engine, they replace
+    # scanning the commands on every start, finish and ending line
+    def __init__(self, commands_threads):
+        self.commands_threads = commands_threads
+        self.threads = []
+        self.threads_rank = {}
+        # thread: {flow id: index of the last command with it}
+        self.last_flow = {}
+        # thread: {log id: [indexes of commands with it]}
+        self.log_ids = {}
+        # (init time, thread rank, index) of commands that were run and
+        # have not ended, sorted
+        self.running = []
+        self.running_names = []
+
+    def add(self, thread, command):
+        if thread not in self.commands_threads.keys():
+            self.commands_threads[thread] = []
+            self.threads_rank[thread] = len(self.threads)
+            self.threads += [thread]
+            self.last_flow[thread] = {}
+            self.log_ids[thread] = {}
+        com_id = len(self.commands_threads[thread])
+        self.commands_threads[thread] += [command]
+        self.last_flow[thread][command['flow_id']] = com_id
+        if 'log_id' in command.keys():
+            if command['log_id'] not in self.log_ids[thread].keys():
+                self.log_ids[thread][command['log_id']] = []
+            self.log_ids[thread][command['log_id']] += [com_id]
+        if 'init_time' in command.keys():
+            key = (command['init_time'], self.threads_rank[thread], com_id)
+            running_idx = bisect.bisect(self.running, key)
+            self.running.insert(running_idx, key)
+            self.running_names.insert(running_idx, command['command_name'])
+
+    def last_flow_command(self, thread, flow_id):
+        if thread not in self.last_flow.keys():
+            return None
+        return self.last_flow[thread].get(flow_id)
 
+    def set_log_id(self, thread, com_id, log_id):
+        command = self.commands_threads[thread][com_id]
+        if 'log_id' in command.keys():
+            self.log_ids[thread][command['log_id']].remove(com_id)
+        command['log_id'] = log_id
+        if log_id not in self.log_ids[thread].keys():
+            self.log_ids[thread][log_id] = []
+        bisect.insort(self.log_ids[thread][log_id], com_id)
 
-def find_vm_tasks_engine(positions, output_descriptor, log_directory,
-                         log, file_formats, tz_info, time_range_info,
-                         output_directory, needed_linenum, reasons,
-                         criterias):
+    def log_id_commands(self, thread, log_id):
+        return list(self.log_ids[thread].get(log_id, []))
+
+    def find_running(self, command_name):
+        # The position mirrored to the first running command with the name
+        # (sorted by run time), as the former list lookup did
+        try:
+            return len(self.running_names) - 1 - \
+                self.running_names.index(command_name)
+        except ValueError:
+            return None
+
+    def end_running(self, running_idx):
+        init_time, rank, com_id = self.running.pop(running_idx)
+        self.running_names.pop(running_idx)
+        return self.threads[rank], com_id
+
+
+def find_vm_tasks_engine(positions, log, file_format, tz_info,
+                         time_range_info, criterias, progress_slot):
+    # Returns tasks of one engine log and the json files to write
+    # ({filename suffix: data}), None for unknown file extension
     commands_threads = {}
     long_actions = []
     tasks = {}
     commands = {}
+    needed_linenum = set()
+    reasons = {}
     f = open_log_file(log)
     if f is None:
-        output_descriptor.write("Unknown file extension: %s" % log)
-        return commands_threads, long_actions, {}, {}, needed_linenum, reasons
-    firstline = f.readline()
-    for fmt in file_formats:
-        prog = re.compile(fmt)
-        fields = prog.search(firstline)
-        if fields is not None:
-            file_format = prog
-            break
-    if fields is None:
+        return None
+    if file_format is None:
         # Format is not found
-        return commands_threads, long_actions, {}, {}, needed_linenum, reasons
+        return commands_threads, long_actions, {}, {}, needed_linenum, \
+            reasons, {}
     f.seek(0, os.SEEK_END)
-    widget_style = [log + ':', progressbar.Percentage(), ' (',
-                    progressbar.SimpleProgress(), ')', ' ',
-                    progressbar.Bar(), ' ', progressbar.Timer()]
-    bar = ProgressBar(widgets=widget_style, max_value=max(
-                      [p[i] for p in positions for i in range(len(p))]))
+    progress = ProgressReporter(progress_slot)
+    index = EngineCommandsIndex(commands_threads)
+    date_time = functools.partial(parse_date_time, time_zone=tz_info)
     for tr_idx, pos in enumerate(positions):
         f.seek(pos[0], os.SEEK_SET)
-        i = pos[0]
-        bar.update(i)
-        for line_num, line in enumerate(f):
-            i += len(line)
-            bar.update(i)
-            fields = file_format.search(line)
-            if fields is None:
+        for record in log_records(f, date_time, pos[0], progress=progress):
+            line = record.line
+            if line is None or file_format.search(line) is None:
                 # Tracebacks will be added anyway
                 continue
-            fields = fields.groupdict()
-            dt = parse_date_time(line, tz_info)
-            if dt == 0:
-                continue
+            line_num = record.line_num
+            dt = record.date_time
             if (dt > time_range_info[tr_idx][1]):
                 break
-            com = re.search(r"\((.+?)\)\ +\[(.*?)\]\ +" +
-                            r"[Rr]unning [Cc]ommand:\ +" +
-                            r"([^\s]+)[Cc]ommand", line)
+            tokens = split_engine_line(line)
+            if tokens is None:
+                # all the patterns start with the thread and correlation id
+                continue
+            line_lower = line.lower()
+            com = None
+            if 'running command:' in line_lower:
+                com = engine_running_command.search(tokens, line)
             if (com is not None):
-                if (com.group(1) not in commands_threads.keys()):
-                    commands_threads[com.group(1)] = []
-                commands_threads[com.group(1)] += [
-                                 {'command_name': com.group(3),
-                                  'command_start_name': com.group(3),
-                                  'init_time': dt,
-                                  'log': log,
-                                  'init_line_num': line_num + 1,
-                                  'flow_id': com.group(2),
-                                  'thread': com.group(1)}]
+                index.add(com.group(1), {'command_name': com.group(3),
+                                         'command_start_name': com.group(3),
+                                         'init_time': dt,
+                                         'log': log,
+                                         'init_line_num': line_num + 1,
+                                         'flow_id': com.group(2),
+                                         'thread': com.group(1)})
                 continue
-            start = re.search(r"\((.+?)\)\ +\[(.*?)\]\ +" +
-                              r"[Ss][Tt][Aa][Rr][Tt],\ +" +
-                              r"([^\s]+)Command.*\ +log id:\ (.+)", line)
+            start = None
+            if 'start,' in line_lower and 'log id: ' in line:
+                start = engine_start.search(tokens, line)
             if (start is not None):
-                if (start.group(1) not in commands_threads.keys()):
-                    commands_threads[start.group(1)] = [
-                                     {'command_name': start.group(3),
-                                      'command_start_name': start.group(3),
-                                      'start_time': dt,
-                                      'log': log,
-                                      'log_id': start.group(4),
-                                      'flow_id': start.group(2),
-                                      'thread': start.group(1),
-                                      'start_line_num': line_num + 1}]
+                # the thread name is looked up among the flow ids
+                com_id = index.last_flow_command(start.group(1),
+                                                 start.group(1))
+                if com_id is not None:
+                    commands_threads[start.group(1)][
+                        com_id]['command_start_name'] = start.group(3)
+                    commands_threads[start.group(1)][
+                        com_id]['start_time'] = dt
+                    index.set_log_id(start.group(1), com_id,
+                                     start.group(4))
+                    commands_threads[start.group(1)][
+                        com_id]['start_line_num'] = line_num + 1
                 else:
-                    flow_list = [com['flow_id'] for com in
-                                 commands_threads[start.group(1)]]
-                    try:
-                        com_id = len(flow_list) - 1 - \
-                                 flow_list[::-1].index(start.group(1))
-                        commands_threads[start.group(1)][
-                            com_id]['command_start_name'] = start.group(3)
-                        commands_threads[start.group(1)][
-                            com_id]['start_time'] = dt
-                        commands_threads[start.group(1)][
-                            com_id]['log_id'] = start.group(4)
-                        commands_threads[start.group(1)][
-                            com_id]['start_line_num'] = line_num + 1
-                    except:
-                        commands_threads[start.group(1)] += [
-                                        {'command_name': start.group(3),
-                                         'command_start_name': start.group(3),
-                                         'start_time': dt,
-                                         'log': log,
-                                         'log_id': start.group(4),
-                                         'flow_id': start.group(2),
-                                         'thread': start.group(1),
-                                         'start_line_num': line_num + 1}]
+                    index.add(start.group(1),
+                              {'command_name': start.group(3),
+                               'command_start_name': start.group(3),
+                               'start_time': dt,
+                               'log': log,
+                               'log_id': start.group(4),
+                               'flow_id': start.group(2),
+                               'thread': start.group(1),
+                               'start_line_num': line_num + 1})
                 continue
-            finish = re.search(r"\((.+?)\)\ +\[(.*?)\]\ +" +
-                               r"[Ff][Ii][Nn][Ii][Ss][Hh],\ +" +
-                               r"([^\s]+)Command.*\ +log id:\ (.+)", line)
+            finish = None
+            if 'finish,' in line_lower and 'log id: ' in line:
+                finish = engine_finish.search(tokens, line)
             if (finish is not None):
                 if (finish.group(1) not in commands_threads.keys()):
                     continue
-                for task_idx, command in \
-                        enumerate(commands_threads[finish.group(1)]):
-                    if ('log_id' in command.keys() and
-                            command['log_id'] == finish.group(4)):
-                        commands_threads[finish.group(1)][task_idx][
-                            'finish_time'] = dt
-                        commands_threads[finish.group(1)][task_idx][
-                            'finish_line_num'] = line_num + 1
-                        if ('start_time' in commands_threads[
-                                finish.group(1)][task_idx].keys()):
+                for task_idx in index.log_id_commands(finish.group(1),
+                                                      finish.group(4)):
+                    commands_threads[finish.group(1)][task_idx][
+                        'finish_time'] = dt
+                    commands_threads[finish.group(1)][task_idx][
+                        'finish_line_num'] = line_num + 1
+                    if ('start_time' in commands_threads[
+                            finish.group(1)][task_idx].keys()):
+                        commands_threads[finish.group(1)][
+                                         task_idx]['duration'] = dt - \
                             commands_threads[finish.group(1)][
-                                             task_idx]['duration'] = dt - \
-                                commands_threads[finish.group(1)][
-                                                 task_idx]['start_time']
-                            break
+                                             task_idx]['start_time']
+                        break
                 continue
-            ending = re.search(r"\((.+?)\)\ +\[(.*?)\]\ +" +
-                               r"[Ee]nding\ +[Cc]ommand\ *" +
-                               r"\'.+\.(.+)Command\'\ *successfully", line)
+            ending = None
+            if 'ending' in line_lower and 'successfully' in line_lower:
+                ending = engine_ending.search(tokens, line)
             if (ending is not None):
                 if (ending.group(1) not in commands_threads.keys()):
                     continue
-                else:
-                    thr_list = [(com['thread'], idx, com['init_time'])
-                                for thr in
-                                commands_threads.keys()
-                                for idx, com in
-                                enumerate(commands_threads[thr])
-                                if 'init_time' in com.keys()
-                                and 'duration_full' not in com.keys()]
-                    com_list = [com['command_name'] for thr in
-                                commands_threads.keys()
-                                for com in commands_threads[thr]
-                                if 'init_time' in com.keys()
-                                and 'duration_full' not in com.keys()]
-                    to_sort_idx = sorted(range(len(thr_list)),
-                                         key=lambda k: thr_list[k][2])
-                    thr_list = [thr_list[i] for i in to_sort_idx]
-                    com_list = [com_list[i] for i in to_sort_idx]
-                    try:
-                        com_id = len(com_list) - 1 - \
-                                 com_list.index(ending.group(3))
-                    except:
-                        continue
-                    commands_threads[thr_list[com_id][0]][
-                                    thr_list[com_id][1]]['end_time'] = dt
-                    commands_threads[thr_list[com_id][0]][
-                            thr_list[com_id][1]]['end_line_num'] = line_num + 1
-                    commands_threads[thr_list[com_id][0]][
-                        thr_list[com_id][1]]['duration_full'] = dt - \
-                        commands_threads[thr_list[com_id][0]][thr_list[
-                            com_id][1]]['init_time']
+                running_idx = index.find_running(ending.group(3))
+                if running_idx is None:
+                    continue
+                thread, com_id = index.end_running(running_idx)
+                commands_threads[thread][com_id]['end_time'] = dt
+                commands_threads[thread][com_id]['end_line_num'] = \
+                    line_num + 1
+                commands_threads[thread][com_id]['duration_full'] = dt - \
+                    commands_threads[thread][com_id]['init_time']
                 continue
-            multiasync = re.search(r"\((.+?)\)\ +\[(.*?)\].+" +
-                                   r"[Aa]dding\ +CommandMultiAsyncTasks\ +" +
-                                   r"[Oo]bject\ +[Ff]or\ +[Cc]ommand\ +" +
-                                   r"\'(.+?)\'", line)
+            multiasync = None
+            if 'commandmultiasynctasks' in line_lower:
+                multiasync = engine_multiasync.search(tokens, line)
             if multiasync is not None:
+                # the command was started before the beginning of the file
+                if (multiasync.group(1) not in commands_threads.keys()):
+                    continue
                 commands[multiasync.group(3)] = {'name': commands_threads[
                               multiasync.group(1)][-1]['command_name'],
                               'thread': multiasync.group(1),
@@ -915,10 +1022,9 @@ def find_vm_tasks_engine(positions, output_descriptor, log_directory,
                               'log': log,
                               'first_line_num': line_num + 1}
                 continue
-            subtask_init = re.search(r"\((.+?)\)\ +\[(.*?)\].+" +
-                                     r"[Aa]ttaching [Tt]ask\ +\'(.+?)\'\ +" +
-                                     r"[Tt]o [Cc]ommand\ +\'(.+?)\'",
-                                     line)
+            subtask_init = None
+            if 'attaching task' in line_lower:
+                subtask_init = engine_subtask_init.search(tokens, line)
             if subtask_init is not None:
                 if (subtask_init.group(4) not in commands.keys()):
                     commands[subtask_init.group(4)] = {
@@ -934,11 +1040,9 @@ def find_vm_tasks_engine(positions, output_descriptor, log_directory,
                                             'first_line_num': line_num + 1}
                 continue
             # start
-            subtask_start = re.search(r"\((.+?)\)\ +\[(.*?)\].+" +
-                                      r"[Aa]dding [Tt]ask\ +\'(.+?)\'\ +" +
-                                      r"\(*[Pp]arent [Cc]ommand\ +\'(.+?)\'" +
-                                      r".*\)",
-                                      line)
+            subtask_start = None
+            if 'adding task' in line_lower:
+                subtask_start = engine_subtask_start.search(tokens, line)
             if subtask_start is not None:
                 if (subtask_start.group(3) not in tasks.keys()):
                     tasks[subtask_start.group(3)] = {
@@ -954,13 +1058,9 @@ def find_vm_tasks_engine(positions, output_descriptor, log_directory,
                 tasks[subtask_start.group(3)]['start_time'] = dt
                 continue
             # wait
-            subtask_wait = re.search(r"\((.+?)\)\ +\[(.*?)\].+" +
-                                     r"[Cc]ommand\ +\'(.+?)\'\ +\([IDid]+\:" +
-                                     r"\ +" +
-                                     r"\'(.+?)\'\)\ +[Ww]aiting [Oo]n\ +" +
-                                     r"[Cc]hild.+[IDid]\:\ +" +
-                                     r"\'(.+?)\'\ +[Tt]ype\:\ *\'(.+?)\'",
-                                     line)
+            subtask_wait = None
+            if 'waiting on' in line_lower:
+                subtask_wait = engine_subtask_wait.search(tokens, line)
             if subtask_wait is not None:
                 if (subtask_wait.group(4) not in commands.keys()):
                     commands[subtask_wait.group(4)] = {
@@ -991,9 +1091,9 @@ def find_vm_tasks_engine(positions, output_descriptor, log_directory,
                                          'child_name': subtask_wait.group(6)}]
                 continue
             # end
-            subtask_end = re.search(r"\((.+?)\)\ +\[(.*?)\].+" +
-                                    r"[Rr]emoved [Tt]ask\ +\'(.+?)\'\ +" +
-                                    r"[Ff]rom [Dd]ata[Bb]ase", line)
+            subtask_end = None
+            if 'removed task' in line_lower:
+                subtask_end = engine_subtask_end.search(tokens, line)
             if subtask_end is not None:
                 if (subtask_end.group(3) not in tasks.keys()):
                     continue
@@ -1004,37 +1104,29 @@ def find_vm_tasks_engine(positions, output_descriptor, log_directory,
                         tasks[subtask_end.group(3)]['start_time']
                 continue
     f.close()
-    bar.finish()
+    progress.flush()
+    # a command keeps the last of its tasks (by id)
+    last_task = {}
+    for task_id in sorted(tasks.keys()):
+        if 'parent_id' in tasks[task_id].keys():
+            last_task[tasks[task_id]['parent_id']] = task_id
     for com in sorted(commands.keys()):
-        for task_id in sorted(tasks.keys()):
-            if 'parent_id' not in tasks[task_id].keys():
-                tasks.pop(task_id)
-                continue
-            if (tasks[task_id]['parent_id'] == com):
-                if 'tasks' not in commands[com].keys():
-                    commands[com]['ztasks'] = []
-                commands[com]['ztasks'] += [tasks[task_id]]
-                commands[com]['ztasks'][-1]['id'] = task_id
-                tasks.pop(task_id)
-    json.dump(commands_threads, open(os.path.join(output_directory,
-                                     log_directory.split('/')[-2] +
-                                     '_engine_commands_by_id.json'),
-                                     'w'), indent=4, sort_keys=True)
-    new_commands, command_lvl = link_commands(log_directory.split('/')[-2],
-                                              output_descriptor,
-                                              commands,
-                                              output_directory)
+        if com in last_task.keys():
+            commands[com]['ztasks'] = [tasks[last_task[com]]]
+            commands[com]['ztasks'][-1]['id'] = last_task[com]
+    new_commands, command_lvl = link_commands(None, commands)
+    outputs = {'_engine_commands_by_id.json': commands_threads,
+               '_commands.json': new_commands}
     if commands_threads != {} and 'Long operations' in criterias:
         long_actions, needed_linenum, reasons = find_long_operations(
                                                             commands_threads,
                                                             needed_linenum,
                                                             reasons)
     return commands_threads, long_actions, new_commands, command_lvl, \
-        needed_linenum, reasons
+        needed_linenum, reasons, outputs
 
 
-def link_commands(log_dir, output_descriptor, commands,
-                  output_directory):
+def link_commands(output_descriptor, commands):
     without_parents = []
     new_commands = {}
     for command_id in sorted(commands.keys()):
@@ -1049,171 +1141,180 @@ def link_commands(log_dir, output_descriptor, commands,
                 commands[command_id].pop('childs', None)
                 new_commands[command_id] = commands[command_id]
                 new_commands[command_id]['lvl'] = 1
-    leafs = True
-    while leafs:
-        leafs = False
-        for idx, command_id in enumerate(sorted(commands.keys())):
-            if 'childs' not in commands[command_id].keys():
-                leafs = True
-                parent = find_parent(output_descriptor, commands, command_id)
-                if parent is None:
-                    without_parents += [commands[command_id]]
-                    without_parents[-1]['id'] = command_id
-                    commands.pop(command_id)
-                    new_commands.pop(command_id)
-                else:
-                    commands.pop(command_id)
-                    new_commands[parent] = {
-                                        'name': commands[parent]['name'],
-                                        'thread': commands[parent]['thread'],
-                                        'flow_id': commands[parent]['flow_id'],
-                                        'log': commands[parent]['log'],
-                                        'first_line_num': commands[parent][
-                                                          'first_line_num'],
-                                        'id': parent,
-                                        'lvl': 2,
-                                        'zchildren': []}
-                    for child in commands[parent]['childs']:
-                        if (child['child_id'] in new_commands.keys()
-                                or child['child_id'] in commands.keys()
-                                and 'childs' not in
-                                commands[child['child_id']].keys()):
-                            new_commands[parent]['zchildren'] += \
-                                [new_commands[child['child_id']]]
-                            new_commands[parent]['zchildren'][-1]['id'] = \
-                                child['child_id']
-                            if child['child_id'] in commands.keys():
-                                commands.pop(child['child_id'])
-                            if child['child_id'] in new_commands.keys():
-                                new_commands.pop(child['child_id'])
-                break
-    heads = []
-    com_len = 0
+    links = CommandsLinks(commands, new_commands)
+    # leafs, the first one (by id) is linked to its parent on every step
+    for command_id in sorted(commands.keys()):
+        if (command_id not in commands.keys()
+                or 'childs' in commands[command_id].keys()):
+            continue
+        parent = links.find_parent(command_id)
+        if parent is None:
+            without_parents += [commands[command_id]]
+            without_parents[-1]['id'] = command_id
+            links.pop(command_id)
+            continue
+        commands.pop(command_id)
+        links.set(parent, {'name': commands[parent]['name'],
+                           'thread': commands[parent]['thread'],
+                           'flow_id': commands[parent]['flow_id'],
+                           'log': commands[parent]['log'],
+                           'first_line_num':
+                           commands[parent]['first_line_num'],
+                           'id': parent,
+                           'lvl': 2,
+                           'zchildren': []})
+        for child_id in links.linked_children(parent):
+            new_commands[parent]['zchildren'] += [new_commands[child_id]]
+            new_commands[parent]['zchildren'][-1]['id'] = child_id
+            links.pop(child_id)
+    # linked commands, the first one (by id) that is not a head is linked to
+    # its parent on every step
+    heads = set()
+    not_linked = sorted(new_commands.keys())
+    com_len = None
     while(com_len != len(commands)):
         com_len = len(commands)
-        for idx, command_id in enumerate(sorted(new_commands.keys())):
-            if command_id in heads:
-                continue
-            parent = find_parent(output_descriptor, commands, command_id)
-            if parent is None:
-                if command_id in commands.keys():
-                    commands.pop(command_id)
-                heads += [command_id]
-                break
-            else:
-                new_commands[parent] = {'name': commands[parent]['name'],
-                                        'thread': commands[parent]['thread'],
-                                        'flow_id': commands[parent]['flow_id'],
-                                        'log': commands[parent]['log'],
-                                        'first_line_num': commands[parent][
-                                                            'first_line_num'],
-                                        'id': parent,
-                                        'zchildren': []}
-                for child in commands[parent]['childs']:
-                    if (child['child_id'] in new_commands.keys()
-                            or child['child_id'] in commands.keys()
-                            and 'childs' not in
-                            commands[child['child_id']].keys()):
-                        new_commands[parent]['zchildren'] += \
-                            [new_commands[child['child_id']]]
-                        new_commands[parent]['zchildren'][-1]['id'] = \
-                            child['child_id']
-                        new_commands[parent]['lvl'] = \
-                            new_commands[child['child_id']]['lvl'] + 1
-                        if child['child_id'] in commands.keys():
-                            commands.pop(child['child_id'])
-                        if child['child_id'] in new_commands.keys():
-                            new_commands.pop(child['child_id'])
+        while not_linked != [] and (not_linked[0] in heads or not_linked[0]
+                                    not in new_commands.keys()):
+            heapq.heappop(not_linked)
+        if not_linked == []:
             break
+        command_id = not_linked[0]
+        parent = links.find_parent(command_id)
+        if parent is None:
+            if command_id in commands.keys():
+                commands.pop(command_id)
+            heads.add(command_id)
+            heapq.heappop(not_linked)
+            continue
+        links.set(parent, {'name': commands[parent]['name'],
+                           'thread': commands[parent]['thread'],
+                           'flow_id': commands[parent]['flow_id'],
+                           'log': commands[parent]['log'],
+                           'first_line_num':
+                           commands[parent]['first_line_num'],
+                           'id': parent,
+                           'zchildren': []})
+        heapq.heappush(not_linked, parent)
+        for child_id in links.linked_children(parent):
+            new_commands[parent]['zchildren'] += [new_commands[child_id]]
+            new_commands[parent]['zchildren'][-1]['id'] = child_id
+            new_commands[parent]['lvl'] = new_commands[child_id]['lvl'] + 1
+            links.pop(child_id)
     for com in without_parents:
         new_commands[com['id']] = com
     new_commands, command_lvl = change_lvl_numbering(new_commands)
-    json.dump(new_commands, open(os.path.join(output_directory,
-              log_dir + '_commands.json'), 'w'), indent=4, sort_keys=True)
     return new_commands, command_lvl
 
 
 def change_lvl_numbering(commands):
+    # Numbers the levels of the trees of commands and tasks (1 for the roots)
     command_lvl = {}
-    cur_lvl = 1
-    for com in commands.keys():
-        commands[com], lvl = change_lvl_numbering_recursive(commands[com],
-                                                            cur_lvl,
-                                                            command_lvl)
+    stack = [(commands[com], 1) for com in reversed(list(commands.keys()))]
+    while stack != []:
+        com, cur_lvl = stack.pop()
+        com['lvl'] = cur_lvl
+        command_lvl[com['id']] = cur_lvl
+        if 'zchildren' in com.keys():
+            children = com['zchildren']
+        elif 'ztasks' in com.keys():
+            children = com['ztasks']
+        else:
+            continue
+        stack += [(child, cur_lvl + 1) for child in reversed(children)]
     return commands, command_lvl
 
 
-def change_lvl_numbering_recursive(com, cur_lvl, lvls):
-    com['lvl'] = cur_lvl
-    lvls[com['id']] = cur_lvl
-    if ('zchildren' not in com.keys()
-            and 'ztasks' not in com.keys()):
-        return com, lvls
-    if 'zchildren' in com.keys():
-        for child_id, child in enumerate(com['zchildren']):
-            com['zchildren'][child_id], lvl = \
-                change_lvl_numbering_recursive(child, cur_lvl + 1, lvls)
-            lvls.update(lvl)
-    elif 'ztasks' in com.keys():
-        for child_id, child in enumerate(com['ztasks']):
-            com['ztasks'][child_id], lvl = \
-                change_lvl_numbering_recursive(child, cur_lvl + 1, lvls)
-            lvls.update(lvl)
-    return com, lvls
-
-
-def find_parent(output_descriptor, commands, command_id):
-    parent = None
-    for com in sorted(commands.keys()):
-        if ('childs' in commands[com].keys() and command_id in
-                [c['child_id'] for c in commands[com]['childs']]):
-            parent = com
-            break
-    return parent
+class CommandsLinks:
+    # Index of link_commands: parents of every command and the children of
+    # every command that are in new_commands (ready to be linked)
+    def __init__(self, commands, new_commands):
+        self.commands = commands
+        self.new_commands = new_commands
+        # child id: [parent ids, sorted], a command is not its own parent
+        self.parents = {}
+        # child id: index of the first parent in self.parents that may be
+        # still in commands
+        self.first_parent = {}
+        # parent id: {child id: position in the 'childs' list}
+        self.childs_pos = {}
+        self.linked = {}
+        for com in sorted(commands.keys()):
+            if 'childs' not in commands[com].keys():
+                continue
+            self.childs_pos[com] = {}
+            self.linked[com] = set()
+            for pos, child in enumerate(commands[com]['childs']):
+                if (child['child_id'] == com
+                        or child['child_id'] in self.childs_pos[com].keys()):
+                    continue
+                self.childs_pos[com][child['child_id']] = pos
+                if child['child_id'] not in self.parents.keys():
+                    self.parents[child['child_id']] = []
+                self.parents[child['child_id']] += [com]
+        for com in new_commands.keys():
+            for parent in self.parents.get(com, []):
+                self.linked[parent].add(com)
+
+    def find_parent(self, command_id):
+        # The first (by id) command in commands with command_id as a child
+        parents = self.parents.get(command_id, [])
+        idx = self.first_parent.get(command_id, 0)
+        while idx < len(parents) and parents[idx] not in self.commands.keys():
+            idx += 1
+        self.first_parent[command_id] = idx
+        if idx == len(parents):
+            return None
+        return parents[idx]
+
+    def set(self, command_id, command):
+        self.new_commands[command_id] = command
+        for parent in self.parents.get(command_id, []):
+            self.linked[parent].add(command_id)
 
+    def pop(self, command_id):
+        self.commands.pop(command_id, None)
+        self.new_commands.pop(command_id, None)
+        for parent in self.parents.get(command_id, []):
+            self.linked[parent].discard(command_id)
 
-def find_vm_tasks_libvirtd(positions, output_descriptor, log_directory,
-                           log, file_formats, tz_info, time_range_info,
-                           output_directory, needed_linenum, reasons,
-                           criterias):
+    def linked_children(self, parent):
+        # Children of parent in new_commands in the order of its 'childs'
+        return sorted(self.linked.get(parent, []),
+                      key=lambda child_id: self.childs_pos[parent][child_id])
+
+
+def find_vm_tasks_libvirtd(positions, log, file_format, tz_info,
+                           time_range_info, criterias, progress_slot):
+    # Returns tasks of one libvirtd log and the json files to write
+    # ({filename suffix: data}), None for unknown file extension
     commands_threads = {}
     long_actions = []
     qemu_monitor = {}
+    needed_linenum = set()
+    reasons = {}
     f = open_log_file(log)
     if f is None:
-        output_descriptor.write("Unknown file extension: %s" % log)
-        return commands_threads, long_actions, needed_linenum, reasons
-    firstline = f.readline()
-    for fmt in file_formats:
-        prog = re.compile(fmt)
-        fields = prog.search(firstline)
-        if fields is not None:
-            file_format = prog
-            break
-    if fields is None:
+        return None
+    if file_format is None:
         # Format is not found
-        return commands_threads, long_actions, needed_linenum, reasons
+        return commands_threads, long_actions, needed_linenum, reasons, {}
     f.seek(0, os.SEEK_END)
-    widget_style = [log + ':', progressbar.Percentage(), ' (',
-                    progressbar.SimpleProgress(), ')', ' ',
-                    progressbar.Bar(), ' ', progressbar.Timer()]
-    bar = ProgressBar(widgets=widget_style, max_value=sum(
-                      [p[i] for p in positions for i in range(len(p))]))
+    progress = ProgressReporter(progress_slot)
+    date_time = functools.partial(parse_date_time, time_zone=tz_info)
     for tr_idx, pos in enumerate(positions):
         f.seek(pos[0], os.SEEK_SET)
-        i = pos[0]
-        bar.update(i)
-        for line_num, line in enumerate(f):
-            i += len(line)
-            bar.update(i)
+        for record in log_records(f, date_time, pos[0], progress=progress):
+            line = record.line
+            if line is None:
+                continue
             fields = file_format.search(line)
             if fields is None:
                 # Tracebacks will be added anyway
                 continue
             fields = fields.groupdict()
-            dt = parse_date_time(line, tz_info)
-            if dt == 0:
-                continue
+            line_num = record.line_num
+            dt = record.date_time
             if (dt > time_range_info[tr_idx][1]):
                 break
             start = re.search(r"Thread (.+?) \((.+?)\) is now running " +
@@ -1312,11 +1413,8 @@ def find_vm_tasks_libvirtd(positions, output_descriptor, log_directory,
                         break
 
     f.close()
-    bar.finish()
-    json.dump(qemu_monitor, open(os.path.join(output_directory,
-                                 log_directory.split('/')[-2] +
-                                 '_qemu_libvirt.json'),
-                                 'w'), indent=4, sort_keys=True)
+    progress.flush()
+    outputs = {'_qemu_libvirt.json': qemu_monitor}
     # json.dump(commands_threads, open(os.path.join(output_directory,
     #                                  'tasks_libvirtd_' +
     #                                  log_directory.split('/')[-2] +
@@ -1332,7 +1430,27 @@ def find_vm_tasks_libvirtd(positions, output_descriptor, log_directory,
     #                                  log_directory.split('/')[-2] +
     #                                  '.json'),
     #                                  'w'), indent=4, sort_keys=True)
-    return commands_threads, long_actions, needed_linenum, reasons
+    return commands_threads, long_actions, needed_linenum, reasons, outputs
+
+
+def find_file_vm_tasks(positions, log, file_format, tz_info, time_range_info,
+                       criterias, progress_slot):
+    # Returns (tasks, long tasks, structured commands, subtasks levels,
+    # needed lines, reasons, json files to write) for engine and libvirtd
+    # logs, None for unknown file extension. file_format is None if the log
+    # does not have an engine (libvirt) format
+    if 'engine' in log.lower():
+        return find_vm_tasks_engine(positions, log, file_format, tz_info,
+                                    time_range_info, criterias,
+                                    progress_slot)
+    result = find_vm_tasks_libvirtd(positions, log, file_format,
+                                    tz_info, time_range_info, criterias,
+                                    progress_slot)
+    if result is None:
+        return None
+    tasks_file, long_tasks_file, needed_linenum, reasons, outputs = result
+    return tasks_file, long_tasks_file, None, {}, needed_linenum, reasons, \
+        outputs
 
 
 # def find_vm_tasks_vdsm(positions, output_descriptor, log_directory,
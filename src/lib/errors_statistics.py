@@ -1,20 +1,70 @@
 """ Linking errors from logfiles to each other
+- merge_all_errors_by_time, clusterize_messages - in memory
+- merge_spilled_errors_by_time, clusterize_spilled_messages - the same for
+the messages kept in run files on disk (the out-of-core mode): the messages
+are streamed and only the aggregates of the clusters are kept in memory
 """
 import os
+import sys
+import heapq
 import numpy as np
 import re
-from datetime import datetime
+from lib.spill import RunWriter, SpilledRows, external_sort
+from lib.represent_statistics import ReportWriter, report_filename
 
 
-def merge_all_errors_by_time(all_errors, fields_names):
-    all_messages = []
+# long quoted and bracketed parts of the messages
+LONG_GROUPS = re.compile(r"[^^](\"[^\"]{20,}\")|" +
+                         r"[^^](\'[^\']{20,}\')|" +
+                         r"[^^](\(+.*\)+)|" +
+                         r"[^^](\[+.*\]+)|" +
+                         r"[^^](\{+.*\}+)|" +
+                         r"[^^](\<+.*\>+)")
+# columns of _frequent.txt
+FREQUENT_FIELDS = ['date_time', 'line_num', 'reason', 'message']
+# field values up to this length are interned in the low memory mode (hosts,
+# threads, levels and the like repeat in many messages)
+INTERN_LENGTH = 64
+
+
+def frequent_writer(f, report_format, max_len, ranges_len=None):
+    # The writer of _frequent, ranges_len - width of the time_ranges column
+    # (None if the messages do not have the field)
+    if ranges_len is None:
+        return ReportWriter(f, FREQUENT_FIELDS, report_format, [20, max_len])
+    return ReportWriter(f, FREQUENT_FIELDS[:2] + ['time_ranges'] +
+                        FREQUENT_FIELDS[2:], report_format,
+                        [20, ranges_len, max_len])
+
+
+def shown_fields(fields):
+    # Fields of the shown messages, the time range tags are kept if the
+    # messages have them
+    if 'time_ranges' in fields:
+        return ['date_time', 'line_num', 'reason', 'details', 'message',
+                'time_ranges']
+    return ['date_time', 'line_num', 'reason', 'details', 'message']
+
+
+def merged_headers(fields_names):
     set_headers = set([h for s in list(fields_names.values())
                        for h in s])
     set_headers.remove("date_time")
     set_headers.remove("line_num")
     set_headers.remove("message")
-    list_headers = ["date_time", "line_num", "message"] +\
-        sorted(list(set_headers))
+    return ["date_time", "line_num", "message"] + sorted(list(set_headers))
+
+
+def is_error(error):
+    return any([w in str(f).lower() for f in error for w in
+                ['error', 'traceback', 'warn', 'fail']])
+
+
+def merge_all_errors_by_time(all_errors, fields_names, low_memory=False):
+    # low_memory - every logfile's rows are released right after they are
+    # copied and the short values are shared between the messages
+    all_messages = []
+    list_headers = merged_headers(fields_names)
     for log in sorted(all_errors.keys()):
         for err in all_errors[log]:
             line = []
@@ -24,7 +74,12 @@ def merge_all_errors_by_time(all_errors, fields_names):
                 else:
                     idx = fields_names[log].index(field)
                     line += [err[idx]]
+            if low_memory:
+                line = [sys.intern(f) if isinstance(f, str) and
+                        len(f) <= INTERN_LENGTH else f for f in line]
             all_messages += [line]
+        if low_memory:
+            all_errors[log].close()
     all_messages = sorted(all_messages, key=lambda k: k[0])
     min_time = all_messages[0][0]
     max_time = all_messages[-1][0]
@@ -32,27 +87,206 @@ def merge_all_errors_by_time(all_errors, fields_names):
     for t_id in range(int(max_time) - int(min_time) + 1):
         timeline += [[]]
     for error in all_messages:
-        if any([w in str(f).lower() for f in error for w in
-                ['error', 'traceback', 'warn', 'fail']]):
+        if is_error(error):
             timeline[int(error[0]) - int(min_time)] += [error]
     return timeline, all_messages, list_headers
 
 
+def headers_rows(rows, idxs):
+    # rows of a logfile with the fields of the merged messages
+    for err in rows:
+        yield ['' if idx is None else err[idx] for idx in idxs]
+
+
+class SpilledTimeline:
+    # The timeline of merge_all_errors_by_time in the out-of-core mode: the
+    # number of errors of every second from start and the errors
+    # ([date_time, line_num] sorted by time) in a run file
+    def __init__(self, start, counts, errors):
+        self.start = start
+        self.counts = counts
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.counts)
+
+    def close(self):
+        self.errors.close()
+
+
+def merge_spilled_errors_by_time(all_errors, fields_names, spill_dir):
+    # merge_all_errors_by_time of the run files of the logfiles (sorted by
+    # date_time): the merged messages and the date_time and line_num of the
+    # errors are written to run files while they are merged, only the
+    # numbers of errors per second are kept
+    list_headers = merged_headers(fields_names)
+    streams = []
+    for log in sorted(all_errors.keys()):
+        streams += [headers_rows(all_errors[log],
+                                 [fields_names[log].index(field)
+                                  if field in fields_names[log] else None
+                                  for field in list_headers])]
+    merged = RunWriter(spill_dir, 'merged_')
+    errors = RunWriter(spill_dir, 'errors_')
+    counts = []
+    min_time = None
+    # heapq.merge keeps the order of the logfiles for equal times like the
+    # stable sort of merge_all_errors_by_time
+    for error in heapq.merge(*streams, key=lambda k: k[0]):
+        if min_time is None:
+            min_time = error[0]
+        max_time = error[0]
+        merged.add(error)
+        if is_error(error):
+            second = int(error[0]) - int(min_time)
+            counts += [0]*(second + 1 - len(counts))
+            counts[second] += 1
+            errors.add(error[:2])
+    for log in all_errors.keys():
+        all_errors[log].close()
+    counts += [0]*(int(max_time) - int(min_time) + 1 - len(counts))
+    timeline = SpilledTimeline(int(min_time), counts,
+                               SpilledRows(errors.close()))
+    return timeline, SpilledRows(merged.close(list_headers)), list_headers
+
+
+def shorten_message(mstext, names):
+    # The first 80 characters of a message without its long quoted and
+    # bracketed parts that do not contain a name of a VM or a host
+    groups = re.findall(LONG_GROUPS, mstext)
+    for g in groups:
+        for subg in g:
+            if subg == '' or any([k in subg for k in names]):
+                continue
+            mstext = mstext.replace(subg, '')
+    return mstext[:min(80, len(mstext))]
+
+
+def cluster_key(shorten):
+    # clusters join the shortened messages of the same first two words
+    word_key = shorten.split(' ')[0]
+    if len(shorten.split(' ')) > 1:
+        word_key += ' '+shorten.split(' ')[1]
+    return word_key
+
+
+def message_reasons(msg, fields, msid, user_events, all_vms, all_hosts,
+                    vms_list, hosts_list, subtasks, criterias):
+    # Returns the details (user events, VMs and hosts the message mentions),
+    # the reasons (criterias the message meets) and the keywords (VMs that
+    # differ the messages of a cluster) of a message with the shortened
+    # message as the last field
+    details = set()
+    reasons = set()
+    keywords = set()
+    for event in user_events:
+        if event in msg[msid]:
+            details.add('Event=' + event)
+    for vm_name in vms_list:
+        if (vm_name in msg[msid]):
+            if vm_name not in all_vms.keys():
+                vm_add = [k for k in all_vms.keys()
+                          for vm in all_vms[k]['id']
+                          if vm == vm_name]
+            else:
+                vm_add = [vm_name]
+            details.add('VM=' + vm_add[0])
+            if 'Differ by VM ID' in criterias:
+                keywords.add(vm_name)
+    for host_name in hosts_list:
+        if (host_name in msg[msid]):
+            if host_name not in all_hosts.keys():
+                host_add = [k for k in all_hosts.keys()
+                            for host in all_hosts[k]['id']
+                            if host == host_name]
+            else:
+                host_add = [host_name]
+            details.add('Host=' + host_add[0])
+    if 'Subtasks' in criterias:
+        for t in subtasks.keys():
+            if t in msg[msid]:
+                # Check if user-defined words are in the message
+                reasons.add('Task/' + str(subtasks[t]))
+    if 'Error or warning' in criterias:
+        for k in ['error', 'fail', 'failure', 'failed', 'traceback',
+                  'warn', 'warning', 'could not', 'exception', 'down',
+                  'crash']:
+            for field_id, f in enumerate(fields):
+                err_res = re.search(r'(^|[ \:\.\,]+)' + k +
+                                    r'([ \:\.\,=]+|$)',
+                                    str(msg[field_id]).lower())
+                if err_res is not None:
+                    reasons.add('Error or warning')
+    return details, reasons, keywords
+
+
+def cluster_reasons(size, keywords, mean_len, std_len, criterias):
+    # Returns the reasons of the messages of a cluster and whether they are
+    # needed (None - as decided by the messages themselves)
+    reasons = set()
+    needed = None
+    if 'Differ by VM ID' in criterias:
+        if (len(keywords) > 1):
+            # Differ by VM
+            reasons.add('Differ by VM IDs')
+            needed = True
+    if 'Exclude frequent messages' in criterias:
+        if size > mean_len + 3*std_len:
+            reasons.add('Many messages')
+            needed = False
+        elif (size == 1):
+            reasons.add('Unique')
+            needed = True
+        elif (size < mean_len - 3*std_len):
+            reasons.add('Rare')
+    return reasons, needed
+
+
+def increased_seconds(err_timeline):
+    # Seconds of the timeline (a list per second) followed by an increased
+    # amount of errors
+    return [t for t in range(10, len(err_timeline)-10)
+            if len(err_timeline[t-10:t]) < len(err_timeline[t:t+10])]
+
+
+def increased_errors(err_timeline, strid, criterias):
+    # line_num of the errors followed by an increased amount of errors
+    increased = set()
+    if 'Increased errors' in criterias:
+        for t in increased_seconds(err_timeline):
+            # Show because an amount of followed messages increased
+            for msg in err_timeline[t]:
+                increased.add(msg[strid])
+    return increased
+
+
+def increased_spilled_errors(err_timeline, criterias):
+    # increased_errors of a SpilledTimeline, the errors of the seconds are
+    # read from its run file
+    increased = set()
+    if 'Increased errors' not in criterias:
+        return increased
+    seconds = set(increased_seconds(err_timeline.counts))
+    if seconds == set():
+        return increased
+    for date_time, line_num in err_timeline.errors:
+        if int(date_time) - err_timeline.start in seconds:
+            increased.add(line_num)
+    return increased
+
+
 def clusterize_messages(out_descr, all_errors, fields, user_events,
                         all_vms, all_hosts, subtasks, dirname,
                         err_timeline, vm_tasks,
                         long_tasks, output_directory, detail_reasons,
-                        needed_msgs, criterias, vm_timeline):
+                        needed_msgs, criterias, vm_timeline,
+                        report_format='text'):
     reasons = {}
-    template = re.compile(r"[^^](\"[^\"]{20,}\")|" +
-                          r"[^^](\'[^\']{20,}\')|" +
-                          r"[^^](\(+.*\)+)|" +
-                          r"[^^](\[+.*\]+)|" +
-                          r"[^^](\{+.*\}+)|" +
-                          r"[^^](\<+.*\>+)")
     msid = fields.index("message")
     dtid = fields.index('date_time')
     strid = fields.index('line_num')
+    trid = fields.index('time_ranges') if 'time_ranges' in fields else None
+    new_fields = shown_fields(fields)
     fields += ['filtered']
     events = {}
     all_errors = [msg for msg in all_errors if len(msg[msid]) > 10]
@@ -64,16 +298,8 @@ def clusterize_messages(out_descr, all_errors, fields, user_events,
         if err_id % 100 == 0:
             out_descr.write(('clusterize_messages: Preprocessing %s ' +
                              'from %s\r') % (err_id, len(all_errors)))
-        mstext = all_errors[err_id][msid]
-        groups = re.findall(template, mstext)
-        for g in groups:
-            for subg in g:
-                if subg == '' or any([k in subg
-                                      for k in
-                                      vms_list + hosts_list]):
-                    continue
-                mstext = mstext.replace(subg, '')
-        mstext = mstext[:min(80, len(mstext))]
+        mstext = shorten_message(all_errors[err_id][msid],
+                                 vms_list + hosts_list)
         if mstext not in events.keys():
             events[mstext] = {'date_time': [], 'line_num': [], 'data': [],
                               'keywords': set()}
@@ -81,72 +307,24 @@ def clusterize_messages(out_descr, all_errors, fields, user_events,
         events[mstext]['line_num'] += [all_errors[err_id][strid]]
         events[mstext]['data'] += [all_errors[err_id]]
         all_errors[err_id] += [mstext]
-        for event in user_events:
-            if event in all_errors[err_id][msid]:
-                needed_msgs.add(all_errors[err_id][strid])
-                if all_errors[err_id][strid] not in detail_reasons.keys():
-                    detail_reasons[all_errors[err_id][strid]] = set()
-                detail_reasons[all_errors[err_id][strid]].add('Event=' +
-                                                              event)
-        for vm_name in vms_list:
-            if (vm_name in all_errors[err_id][msid]):
-                if vm_name not in all_vms.keys():
-                    vm_add = [k for k in all_vms.keys()
-                              for vm in all_vms[k]['id']
-                              if vm == vm_name]
-                else:
-                    vm_add = [vm_name]
-                needed_msgs.add(all_errors[err_id][strid])
-                if all_errors[err_id][strid] not in detail_reasons.keys():
-                    detail_reasons[all_errors[err_id][strid]] = set()
-                detail_reasons[all_errors[err_id][strid]].add('VM=' +
-                                                              vm_add[0])
-                if 'Differ by VM ID' in criterias:
-                    events[mstext]['keywords'].add(vm_name)
-        for host_name in hosts_list:
-            if (host_name in all_errors[err_id][msid]):
-                if host_name not in all_hosts.keys():
-                    host_add = [k for k in all_hosts.keys()
-                                for host in all_hosts[k]['id']
-                                if host == host_name]
-                else:
-                    host_add = [host_name]
-                needed_msgs.add(all_errors[err_id][strid])
-                if all_errors[err_id][strid] not in detail_reasons.keys():
-                    detail_reasons[all_errors[err_id][strid]] = set()
-                detail_reasons[all_errors[err_id][strid]].add('Host=' +
-                                                              host_add[0])
-        if 'Subtasks' in criterias:
-            for t in subtasks.keys():
-                if t in all_errors[err_id][msid]:
-                    # Check if user-defined words are in the message
-                    needed_msgs.add(all_errors[err_id][strid])
-                    if all_errors[err_id][strid] not in reasons.keys():
-                        reasons[all_errors[err_id][strid]] = set()
-                    reasons[all_errors[err_id][strid]].add('Task/' +
-                                                           str(subtasks[t]))
-                    # break
-        if 'Error or warning' in criterias:
-            for k in ['error', 'fail', 'failure', 'failed', 'traceback',
-                      'warn', 'warning', 'could not', 'exception', 'down',
-                      'crash']:
-                for field_id, f in enumerate(fields):
-                    err_res = re.search(r'(^|[ \:\.\,]+)' + k +
-                                        r'([ \:\.\,=]+|$)',
-                                        str(all_errors[err_id][
-                                            field_id]).lower())
-                    if err_res is not None:
-                        # if (k == 'traceback' or f != 'message'):
-                        needed_msgs.add(all_errors[err_id][strid])
-                        if all_errors[err_id][strid] not in reasons.keys():
-                            reasons[all_errors[err_id][strid]] = set()
-                        reasons[all_errors[err_id][strid]].add(
-                            'Error or warning')
+        details, msg_reasons, keywords = message_reasons(
+            all_errors[err_id], fields, msid, user_events, all_vms,
+            all_hosts, vms_list, hosts_list, subtasks, criterias)
+        line_num = all_errors[err_id][strid]
+        if details != set() or msg_reasons != set():
+            needed_msgs.add(line_num)
+        if details != set():
+            if line_num not in detail_reasons.keys():
+                detail_reasons[line_num] = set()
+            detail_reasons[line_num].update(details)
+        if msg_reasons != set():
+            if line_num not in reasons.keys():
+                reasons[line_num] = set()
+            reasons[line_num].update(msg_reasons)
+        events[mstext]['keywords'].update(keywords)
     new_events = {}
     for shorten in sorted(events.keys()):
-        word_key = shorten.split(' ')[0]
-        if len(shorten.split(' ')) > 1:
-            word_key += ' '+shorten.split(' ')[1]
+        word_key = cluster_key(shorten)
         if word_key not in new_events.keys():
             new_events[word_key] = {'date_time': [], 'line_num': [],
                                     'data': [], 'keywords': set()}
@@ -169,50 +347,35 @@ def clusterize_messages(out_descr, all_errors, fields, user_events,
     for fid, filtered in enumerate(events.keys()):
         out_descr.write(("clusterize_messages: Cluster %d from %d\r") %
                         (fid+1, len(events.keys())))
-        if 'Differ by VM ID' in criterias:
-            if (len(events[filtered]['keywords']) > 1):
-                # Differ by VM
-                for line_num in events[filtered]['line_num']:
-                    needed_msgs.add(line_num)
-                    if line_num not in reasons.keys():
-                        reasons[line_num] = set()
-                    reasons[line_num].add('Differ by VM IDs')
-        if 'Exclude frequent messages' in criterias:
-            if len(events[filtered]['line_num']) > mean_len + 3*std_len:
-                for line_num in events[filtered]['line_num']:
-                    if line_num not in reasons.keys():
-                        reasons[line_num] = set()
-                    reasons[line_num].add('Many messages')
-                    if (line_num in needed_msgs):
-                        needed_msgs.remove(line_num)
-            elif (len(events[filtered]['line_num']) == 1):
-                needed_msgs.add(events[filtered]['data'][0][strid])
-                if events[filtered]['data'][0][strid] not in reasons.keys():
-                    reasons[events[filtered]['data'][0][strid]] = set()
-                reasons[events[filtered]['data'][0][strid]].add('Unique')
-            elif (len(events[filtered]['line_num']) < mean_len - 3*std_len):
-                for line_num in events[filtered]['line_num']:
-                    if line_num not in reasons.keys():
-                        reasons[line_num] = set()
-                    reasons[line_num].add('Rare')
+        cl_reasons, needed = cluster_reasons(
+            len(events[filtered]['line_num']), events[filtered]['keywords'],
+            mean_len, std_len, criterias)
+        for line_num in events[filtered]['line_num']:
+            if cl_reasons != set():
+                if line_num not in reasons.keys():
+                    reasons[line_num] = set()
+                reasons[line_num].update(cl_reasons)
+            if needed:
+                needed_msgs.add(line_num)
+            elif needed is not None:
+                needed_msgs.discard(line_num)
     out_descr.write('\n')
-    if 'Increased errors' in criterias:
-        for t in range(10, len(err_timeline)-10):
-            if len(err_timeline[t-10:t]) < len(err_timeline[t:t+10]):
-                # Show because an amount of followed messages increased
-                for msg in err_timeline[t]:
-                    needed_msgs.add(msg[strid])
-                    if msg[strid] not in reasons.keys():
-                        reasons[msg[strid]] = set()
-                    reasons[msg[strid]].add('Increased errors')
+    for line_num in increased_errors(err_timeline, strid, criterias):
+        needed_msgs.add(line_num)
+        if line_num not in reasons.keys():
+            reasons[line_num] = set()
+        reasons[line_num].add('Increased errors')
     msg_showed = []
-    new_fields = ['date_time', 'line_num', 'reason', 'details', 'message']
     if reasons == {}:
         return msg_showed, new_fields
-    f = open(os.path.join(output_directory,
-             dirname.split('/')[-2]+'_frequent.txt'), 'w')
+    f = open(os.path.join(output_directory, report_filename(
+             dirname.split('/')[-2]+'_frequent', report_format)), 'w')
     separator = ';'
     max_len = max([len(separator.join(reasons[r])) for r in reasons.keys()])
+    ranges_len = None
+    if trid is not None:
+        ranges_len = max([len(msg[trid]) for msg in all_errors])
+    frequent = frequent_writer(f, report_format, max_len, ranges_len)
     for msg in all_errors:
         if msg[strid] in needed_msgs:
             if msg[strid] in reasons.keys():
@@ -228,18 +391,17 @@ def clusterize_messages(out_descr, all_errors, fields, user_events,
             msg_showed += [[msg[dtid], msg[strid],
                             all_reasons,
                             all_details,
-                            msg[msid]]]
+                            msg[msid]] +
+                           ([] if trid is None else [msg[trid]])]
         else:
             if msg[strid] in reasons.keys():
                 reason = separator.join(sorted(reasons[msg[strid]]))
             else:
                 reason = 'unknown'
-            f.write("%12s %s | %20s | %*s | %s\n" %
-                    (datetime.utcfromtimestamp(msg[dtid]).strftime(
-                                                        "%H:%M:%S,%f")[:-3],
-                     datetime.utcfromtimestamp(msg[dtid]).strftime(
-                                                        "%d-%m-%Y"),
-                     msg[strid], max_len, reason, msg[msid]))
+            frequent.add(msg[dtid], [msg[strid]] +
+                         ([] if trid is None else [msg[trid]]) +
+                         [reason, msg[msid]])
+    frequent.flush()
     f.close()
     strid = new_fields.index('message')
     msg_showed = sorted(msg_showed, key=lambda k: k[0])
@@ -249,3 +411,176 @@ def clusterize_messages(out_descr, all_errors, fields, user_events,
             msg_showed.remove(msg)
         prev_message = msg[strid]
     return msg_showed, new_fields
+
+
+def clusterize_spilled_messages(out_descr, all_errors, fields, user_events,
+                                all_vms, all_hosts, subtasks, dirname,
+                                err_timeline, vm_tasks,
+                                long_tasks, output_directory, detail_reasons,
+                                needed_msgs, criterias, vm_timeline,
+                                spill_dir, report_format='text'):
+    # clusterize_messages of the merged messages in a run file: the first
+    # pass finds the reasons of every message and counts the messages of the
+    # clusters, the second one (over the messages with their reasons kept in
+    # a run file) writes the output. Returns the shown messages in a run file
+    msid = fields.index("message")
+    dtid = fields.index('date_time')
+    strid = fields.index('line_num')
+    trid = fields.index('time_ranges') if 'time_ranges' in fields else None
+    new_fields = shown_fields(fields)
+    fields += ['filtered']
+    # cluster key: {'count', 'keywords', 'first' - the least shortened
+    # message (the clusters are ordered by it like in clusterize_messages)}.
+    # The keywords of the clusters stay empty like in clusterize_messages
+    # (the union of the keywords of its messages is not kept)
+    clusters = {}
+    vms_list = list(all_vms.keys()) + [i for k in all_vms.keys()
+                                       for i in all_vms[k]['id']]
+    hosts_list = list(all_hosts.keys()) + [i for k in all_hosts.keys()
+                                           for i in all_hosts[k]['id']]
+    # [date_time, line_num, message, shortened message, reasons, details]
+    # and the time range tags if the messages have them
+    annotated = RunWriter(spill_dir, 'annotated_')
+    ranges_len = None if trid is None else 0
+    for err_id, msg in enumerate(msg for msg in all_errors
+                                 if len(msg[msid]) > 10):
+        if err_id % 100 == 0:
+            out_descr.write(('clusterize_messages: Preprocessing %s ' +
+                             'from %s\r') % (err_id, len(all_errors)))
+        mstext = shorten_message(msg[msid], vms_list + hosts_list)
+        word_key = cluster_key(mstext)
+        if word_key not in clusters.keys():
+            clusters[word_key] = {'count': 0, 'keywords': set(),
+                                  'first': mstext}
+        clusters[word_key]['count'] += 1
+        clusters[word_key]['first'] = min(clusters[word_key]['first'],
+                                          mstext)
+        msg += [mstext]
+        details, msg_reasons, keywords = message_reasons(
+            msg, fields, msid, user_events, all_vms, all_hosts, vms_list,
+            hosts_list, subtasks, criterias)
+        annotated.add([msg[dtid], msg[strid], msg[msid], mstext,
+                       sorted(msg_reasons), sorted(details)] +
+                      ([] if trid is None else [msg[trid]]))
+        if trid is not None:
+            ranges_len = max(ranges_len, len(msg[trid]))
+    annotated = SpilledRows(annotated.close())
+    # the messages of every cluster in the order of clusterize_messages
+    c_ids = dict([(clust, c_id)
+                  for c_id, clust in enumerate(sorted(clusters.keys()))])
+    f = open(os.path.join(output_directory,
+             dirname.split('/')[-2]+"_clusters.txt"), 'w')
+    prev_cluster = None
+    for word_key, shorten, pos, message in external_sort(
+            ((cluster_key(msg[3]), msg[3], pos, msg[2])
+             for pos, msg in enumerate(annotated)),
+            lambda k: k[:3], spill_dir):
+        if prev_cluster is not None and word_key != prev_cluster:
+            f.write('\n')
+        f.write("%d : %s\n" % (c_ids[word_key], message))
+        prev_cluster = word_key
+    if prev_cluster is not None:
+        f.write('\n')
+    f.close()
+    out_descr.write('\n')
+    mean_len = np.mean([clusters[g]['count'] for g in clusters.keys()])
+    std_len = np.std([clusters[g]['count'] for g in clusters.keys()])
+    for fid, filtered in enumerate(sorted(clusters.keys(),
+                                          key=lambda k:
+                                          clusters[k]['first'])):
+        out_descr.write(("clusterize_messages: Cluster %d from %d\r") %
+                        (fid+1, len(clusters.keys())))
+        clusters[filtered]['order'] = fid
+        clusters[filtered]['reasons'], clusters[filtered]['needed'] = \
+            cluster_reasons(clusters[filtered]['count'],
+                            clusters[filtered]['keywords'], mean_len,
+                            std_len, criterias)
+    out_descr.write('\n')
+    increased = increased_spilled_errors(err_timeline, criterias)
+
+    def line_state(line_num, msgs):
+        # Reasons, details and whether the messages of a line_num are shown
+        # (msgs: [(shortened message, reasons, details),...])
+        reasons = set()
+        details = set()
+        needed = line_num in needed_msgs
+        for shorten, msg_reasons, msg_details in msgs:
+            reasons.update(msg_reasons)
+            details.update(msg_details)
+            needed = needed or msg_reasons != [] or msg_details != []
+        # the clusters decide in the order of clusterize_messages
+        for cluster in sorted([clusters[cluster_key(msg[0])]
+                               for msg in msgs], key=lambda c: c['order']):
+            reasons.update(cluster['reasons'])
+            if cluster['needed'] is not None:
+                needed = cluster['needed']
+        if line_num in increased:
+            reasons.add('Increased errors')
+            needed = True
+        return reasons, details, needed
+
+    # a record split into several messages gives them the same line_num,
+    # they share their reasons like in clusterize_messages. The messages
+    # are grouped by line_num and the state of every message is written to
+    # a run file ([position, reasons, details, needed]) that is sorted
+    # back in the order of the messages
+    separator = ';'
+    states = RunWriter(spill_dir, 'states_')
+
+    def write_group(group, max_len):
+        # Returns the width of the reasons column with the group's reasons
+        reasons, details, needed = line_state(group[0][0],
+                                              [g[2:] for g in group])
+        for g in group:
+            states.add([g[1], sorted(reasons), sorted(details), needed])
+        if reasons == set():
+            return max_len
+        return max(max_len or 0, len(separator.join(reasons)))
+
+    max_len = None
+    group = []
+    for line_num, pos, shorten, msg_reasons, msg_details in external_sort(
+            ((msg[1], pos, msg[3], msg[4], msg[5])
+             for pos, msg in enumerate(annotated)),
+            lambda k: k[:2], spill_dir):
+        if group != [] and group[0][0] != line_num:
+            max_len = write_group(group, max_len)
+            group = []
+        group += [(line_num, pos, shorten, msg_reasons, msg_details)]
+    if group != []:
+        max_len = write_group(group, max_len)
+    del group
+    states = SpilledRows(states.close())
+    if increased != set():
+        max_len = max(max_len or 0, len('Increased errors'))
+    if max_len is None:
+        annotated.close()
+        states.close()
+        return [], new_fields
+    f = open(os.path.join(output_directory, report_filename(
+             dirname.split('/')[-2]+'_frequent', report_format)), 'w')
+    frequent = frequent_writer(f, report_format, max_len, ranges_len)
+    # the messages are sorted by time, the repeated ones are shown once
+    msg_showed = RunWriter(spill_dir, 'showed_')
+    prev_message = None
+    for msg, (pos, reasons, details, needed) in zip(
+            annotated, external_sort(states, lambda k: k[0], spill_dir)):
+        if needed:
+            details = set(details).union(detail_reasons.get(msg[1], set()))
+            if prev_message is None or msg[2] != prev_message:
+                msg_showed.add([msg[0], msg[1],
+                                separator.join(reasons),
+                                separator.join(sorted(details)),
+                                msg[2]] + msg[6:])
+            prev_message = msg[2]
+        else:
+            if reasons != []:
+                reason = separator.join(reasons)
+            else:
+                reason = 'unknown'
+            frequent.add(msg[0], [msg[1]] + msg[6:] + [reason, msg[2]])
+    frequent.flush()
+    f.close()
+    annotated.close()
+    states.close()
+    return SpilledRows(msg_showed.close(new_fields)), new_fields
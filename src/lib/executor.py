@@ -0,0 +1,204 @@
+"""Running per-file jobs in worker processes
+- Class Executor - pool of worker processes shared by all stages of the
+analysis, every stage maps a function over the logfiles
+- schedule_files - orders files largest first and batches the small ones
+into one task
+- run_batch - runs a job for every file of a batch and measures the time,
+the CPU time, the read bytes and lines and the peak memory of every file and
+how long the worker was busy, optionally under cProfile
+- report_utilisation - prints how busy every worker was during a stage
+"""
+import os
+import time
+import cProfile
+import threading
+import tracemalloc
+import progressbar
+from multiprocessing import Pool
+from progressbar import ProgressBar
+from lib.progress import ProgressCounters, init_worker, collect_results, \
+    reset_read_totals, read_totals, throttled
+from lib.memory_usage import peak_rss, reset_peak_rss
+from lib.ProgressPool import ProgressPool
+
+
+SMALL_FILE_SIZE = 1024*1024
+BATCH_SIZE = 16*1024*1024
+
+
+def schedule_files(sizes):
+    order = sorted(range(len(sizes)), key=lambda k: sizes[k], reverse=True)
+    batches = []
+    small = []
+    small_size = 0
+    for idx in order:
+        if sizes[idx] >= SMALL_FILE_SIZE:
+            batches += [[idx]]
+            continue
+        if small != [] and small_size + sizes[idx] > BATCH_SIZE:
+            batches += [small]
+            small = []
+            small_size = 0
+        small += [idx]
+        small_size += sizes[idx]
+    if small != []:
+        batches += [small]
+    return sorted(batches, key=lambda b: sum([sizes[i] for i in b]),
+                  reverse=True)
+
+
+def run_batch(function, batch, profile=None, trace_memory=False):
+    # batch: [(file index, function arguments),...]
+    # Returns [(file index, result, time, CPU time, read bytes, read lines,
+    # peak RSS, peak traced memory or None),...], the worker's pid and its
+    # busy time. With profile (a path prefix) the statistics of cProfile are
+    # dumped to profile.<pid>.<file index>
+    start = time.time()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if profile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    result = []
+    for idx, args in batch:
+        file_start = time.time()
+        file_cpu = time.process_time()
+        reset_read_totals()
+        reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        file_result = function(*args)
+        result += [(idx, file_result, time.time() - file_start,
+                    time.process_time() - file_cpu) + read_totals() +
+                   (peak_rss(), tracemalloc.get_traced_memory()[1]
+                    if tracemalloc.is_tracing() else None)]
+    if profile is not None:
+        profiler.disable()
+        profiler.dump_stats('%s.%d.%d' % (profile, os.getpid(), batch[0][0]))
+    return result, os.getpid(), time.time() - start
+
+
+def star_batch(inp):
+    return run_batch(*inp)
+
+
+def report_utilisation(out_descr, stage, tasks_stats, wall_time,
+                       files_times=None, slowest=3):
+    # tasks_stats: [(worker pid, busy time),...]
+    # files_times: [(logfile, processing time),...]
+    busy = {}
+    tasks = {}
+    for pid, elapsed in tasks_stats:
+        busy[pid] = busy.get(pid, 0) + elapsed
+        tasks[pid] = tasks.get(pid, 0) + 1
+    out_descr.write('%s: %d tasks on %d workers in %.2fs\n' %
+                    (stage, len(tasks_stats), len(busy), wall_time))
+    for num, pid in enumerate(sorted(busy.keys())):
+        out_descr.write('    worker %d (pid %d): %d tasks, busy %.2fs (%d%%)\n'
+                        % (num + 1, pid, tasks[pid], busy[pid],
+                           100*busy[pid]/max(wall_time, 1e-6)))
+    if files_times is None:
+        return
+    for log, elapsed in sorted(files_times, key=lambda x: x[1],
+                               reverse=True)[:slowest]:
+        out_descr.write('    %s: %.2fs\n' % (log, elapsed))
+
+
+class Executor:
+    def __init__(self, jobs, slots):
+        self.jobs = jobs
+        self.counters = ProgressCounters(slots)
+        self.pool = Pool(processes=jobs, initializer=init_worker,
+                         initargs=(self.counters.values,))
+        # stage: ([(worker pid, busy time),...], wall time)
+        self.utilisation = {}
+        # stage: [processing time of every file]
+        self.files_times = {}
+        # stage: [{'name', 'seconds', 'cpu_seconds', 'bytes', 'lines',
+        # 'records', 'peak_rss', 'traced_peak'} of every file]
+        self.files_stats = {}
+        # names of the stages in the order they were run
+        self.stages = []
+        # path prefix of the cProfile statistics of the workers, None if the
+        # workers are not profiled
+        self.profile = None
+        # the workers trace their memory with tracemalloc
+        self.trace_memory = False
+
+    def map_files(self, stage, function, files_args, sizes, names=None,
+                  label=None, full_screen=False, count=None,
+                  parallel=None):
+        # Returns [function(*files_args[i]) for every file i]
+        # count(result) - number of records found in a file (for the
+        # statistics of the files)
+        # parallel - number of batches run at once (all workers by default)
+        self.counters.reset()
+        batches = schedule_files(sizes)
+        jobs = [(function, [(i, files_args[i]) for i in b], self.profile,
+                 self.trace_memory) for b in batches]
+        slots = None
+        done = None
+        if parallel is not None and parallel < self.jobs:
+            # a worker takes the next batch only when a running one ends
+            slots = threading.BoundedSemaphore(parallel)
+            done = slots.release
+        start_time = time.time()
+        if full_screen:
+            tasks = ProgressPool([(run_batch,
+                                   names[b[0]] if len(b) == 1 else
+                                   "{} files".format(len(b)),
+                                   list(job), b, sum([sizes[i] for i in b]))
+                                  for b, job in zip(batches, jobs)],
+                                 self.counters, self.pool,
+                                 processes=self.jobs, slots=slots)
+        elif label is not None:
+            widget_style = [label, progressbar.Percentage(), ' (',
+                            progressbar.SimpleProgress(), ')', ' ',
+                            progressbar.Bar(), ' ', progressbar.Timer(), ' ',
+                            progressbar.AdaptiveETA()]
+            bar = ProgressBar(widgets=widget_style,
+                              max_value=max(sum(sizes), 1))
+            tasks = collect_results(
+                self.pool.imap_unordered(star_batch,
+                                         jobs if slots is None
+                                         else throttled(jobs, slots)),
+                lambda: bar.update(min(self.counters.total(),
+                                       max(sum(sizes), 1))), done)
+            bar.finish()
+        else:
+            tasks = collect_results(
+                self.pool.imap_unordered(star_batch,
+                                         jobs if slots is None
+                                         else throttled(jobs, slots)),
+                lambda: None, done)
+        result = [None]*len(files_args)
+        files_times = [0]*len(files_args)
+        files_stats = [None]*len(files_args)
+        for task_result, pid, busy in tasks:
+            for idx, file_result, elapsed, cpu, read, lines, peak, traced \
+                    in task_result:
+                result[idx] = file_result
+                files_times[idx] = elapsed
+                # only the records readers count the bytes, the other jobs
+                # are taken as reading all the bytes they were given
+                files_stats[idx] = {
+                    'name': idx if names is None else names[idx],
+                    'seconds': elapsed,
+                    'cpu_seconds': cpu,
+                    'bytes': read if lines > 0 else sizes[idx],
+                    'lines': lines,
+                    'records': None if count is None or file_result is None
+                    else count(file_result),
+                    'peak_rss': peak,
+                    'traced_peak': traced}
+        self.files_times[stage] = files_times
+        self.files_stats[stage] = files_stats
+        self.stages += [stage]
+        self.utilisation[stage] = ([(pid, busy)
+                                    for task_result, pid, busy in tasks],
+                                   time.time() - start_time)
+        return result
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
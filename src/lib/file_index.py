@@ -0,0 +1,113 @@
+"""Information about logfiles cached between runs
+- file_fingerprint - identifies the content of a logfile by its size and
+modification time
+- FileIndex - per-file values (time span, newline index,...) saved in
+log_analyzer_cache, values of a changed file are dropped
+- find_file_line_numbers - converts positions in a logfile to line numbers
+with the newline index (numbers of lines before every NEWLINE_CHECKPOINT
+bytes of the decompressed file)
+"""
+import os
+import pickle
+from array import array
+from lib.util import open_log_file
+
+
+NEWLINE_CHECKPOINT = 1024*1024
+
+
+def file_fingerprint(file_name):
+    stat = os.stat(file_name)
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class FileIndex:
+    def __init__(self, directory):
+        self.filename = os.path.join(directory, 'log_analyzer_cache',
+                                     'file_index.pckl')
+        self.entries = {}
+        self.changed = False
+        if os.path.isfile(self.filename):
+            with open(self.filename, 'rb') as f:
+                self.entries = pickle.load(f)
+
+    def get(self, log, key):
+        entry = self.entries.get(os.path.abspath(log))
+        if entry is None or entry['fingerprint'] != file_fingerprint(log):
+            return None
+        return entry.get(key)
+
+    def set(self, log, key, value):
+        fingerprint = file_fingerprint(log)
+        entry = self.entries.get(os.path.abspath(log))
+        if entry is None or entry['fingerprint'] != fingerprint:
+            entry = {'fingerprint': fingerprint}
+            self.entries[os.path.abspath(log)] = entry
+        entry[key] = value
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        if not os.path.isdir(os.path.dirname(self.filename)):
+            os.mkdir(os.path.dirname(self.filename))
+        with open(self.filename, 'wb') as f:
+            pickle.dump(self.entries, f)
+        self.changed = False
+
+
+def lines_before(f, positions, checkpoint=NEWLINE_CHECKPOINT):
+    # One pass over a binary file. Returns the numbers of newlines before
+    # every position (sorted) and before every multiple of checkpoint
+    checkpoints = array('q', [0])
+    lines = []
+    idx = 0
+    offset = 0
+    while True:
+        block = f.read(checkpoint)
+        while (idx < len(positions)
+               and (positions[idx] < offset + len(block) or block == b'')):
+            lines += [checkpoints[-1] +
+                      block.count(b'\n', 0, max(positions[idx] - offset, 0))]
+            idx += 1
+        if block == b'':
+            break
+        offset += len(block)
+        checkpoints.append(checkpoints[-1] + block.count(b'\n'))
+    return lines, checkpoints
+
+
+def indexed_lines_before(f, positions, checkpoints,
+                         checkpoint=NEWLINE_CHECKPOINT):
+    # Numbers of newlines before positions, only the part of a checkpoint
+    # before every position is read
+    lines = []
+    for pos in positions:
+        idx = min(pos // checkpoint, len(checkpoints) - 1)
+        f.seek(idx*checkpoint, os.SEEK_SET)
+        lines += [checkpoints[idx] +
+                  f.read(max(pos - idx*checkpoint, 0)).count(b'\n')]
+    return lines
+
+
+def find_file_line_numbers(file_name, positions, checkpoints):
+    # Returns the numbers of lines that start before every position and the
+    # newline index of the file. The index is built if checkpoints is None
+    f = open_log_file(file_name, 'rb')
+    if f is None:
+        return None
+    # a line starts before pos if there is a newline before pos - 1
+    before = [pos - 1 for pos in positions if pos > 0]
+    if checkpoints is None:
+        order = sorted(range(len(before)), key=lambda k: before[k])
+        sorted_lines, checkpoints = lines_before(f, [before[k]
+                                                     for k in order])
+        lines = [0]*len(before)
+        for k, line_num in zip(order, sorted_lines):
+            lines[k] = line_num
+    else:
+        lines = indexed_lines_before(f, before, checkpoints)
+    f.close()
+    lines.reverse()
+    return [0 if pos <= 0 else lines.pop() + 1 for pos in positions], \
+        checkpoints
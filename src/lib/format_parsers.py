@@ -0,0 +1,184 @@
+"""Splitting log lines into fields with plain string operations
+- split_engine_line - thread, correlation id, logger and message of an
+engine line
+- EnginePattern - regexp of an engine message that is matched against the
+message part of a split line
+"""
+import re
+
+
+ENGINE_PREFIX = r"\((.+?)\)\ +\[(.*?)\]"
+re_engine_prefix = re.compile(ENGINE_PREFIX)
+
+
+def split_engine_line(line):
+    # Returns (thread, correlation id, logger, message) or None. The message
+    # is the rest of the line after the correlation id
+    prefix = re_engine_prefix.search(line)
+    if prefix is None:
+        return None
+    head = line[:prefix.start()].rstrip(' ')
+    logger = ''
+    if head.endswith(']'):
+        logger = head[head.rfind('[') + 1:-1]
+    return prefix.group(1), prefix.group(2), logger, line[prefix.end():]
+
+
+class EngineMatch:
+    __slots__ = ['groups']
+
+    def __init__(self, groups):
+        self.groups = groups
+
+    def group(self, idx):
+        return self.groups[idx - 1]
+
+
+class EnginePattern:
+    # Groups of a match: thread, correlation id, groups of message_pattern
+    def __init__(self, message_pattern):
+        self.message = re.compile(message_pattern)
+        self.line = re.compile(ENGINE_PREFIX + message_pattern)
+
+    def search(self, tokens, line):
+        if tokens is not None:
+            result = self.message.match(tokens[3])
+            if result is not None:
+                return EngineMatch((tokens[0], tokens[1]) + result.groups())
+        # the first thread and correlation id of the line do not fit, the
+        # whole line regexp finds the same match as before splitting
+        return self.line.search(line)
+
+
+# Templates of format_templates.txt with a parser below, a changed template
+# is matched with its regexp
+DATE_TIME = r"[0-9\-]{10}[\sT][0-9]{2}:[0-9]{2}:[0-9]{2}[\.\,0-9]*" + \
+    r"[\+\-0-9Z]*"
+ENGINE_TEMPLATE = r"^(?P<date_time>" + DATE_TIME + r")(?P<msg_type>.+)" + \
+    r"\ +\[(?P<sender>.*?)\]\ +\((?P<thread>.*?)\)\ +\[(?P<id>.*?)\]\ +" + \
+    r"(?P<message>.+)$"
+VDSM_TEMPLATE = r"^(?P<date_time>" + DATE_TIME + r")(?P<msg_type>.+)" + \
+    r"\ +\((?P<thread>.*?)\)\ +\[(?P<sender>.*?)\]\ +(?P<message>.+)" + \
+    r"\ +\((?P<task>.*?)\)$"
+LIBVIRTD_TEMPLATE = r"^(?P<date_time>" + DATE_TIME + r")\:\ +" + \
+    r"(?P<thread>.+)\:\ +(?P<msg_type>.+)\ +\:\ +(?P<code2>.+)\ +\:\ +" + \
+    r"(?P<message>.+)$"
+re_date_time = re.compile(DATE_TIME)
+
+
+def skip_spaces(line, pos):
+    # Position of the first character after the spaces at pos
+    while pos < len(line) and line[pos] == ' ':
+        pos += 1
+    return pos
+
+
+# The parsers below take a stripped line and return the fields of the
+# template in the order of their names (without date_time). They choose the
+# same fields as the regexp: greedy fields end at the last delimiter that
+# lets the rest of the line match, lazy fields at the first one. None means
+# that the line does not match or that only the regexp can tell (a run of
+# several spaces that the regexp could split between two fields)
+
+def parse_engine_fields(line):
+    # (id, message, msg_type, sender, thread)
+    date_time = re_date_time.match(line)
+    if date_time is None:
+        return None
+    start = date_time.end()
+    end = len(line)
+    while True:
+        space = line.rfind(' [', start + 1, end)
+        if space < 0:
+            return None
+        end = space + 1
+        sender_end = line.find(']', space + 2)
+        while sender_end >= 0:
+            thread = skip_spaces(line, sender_end + 1)
+            if thread > sender_end + 1 and line.startswith('(', thread):
+                thread_end = line.find(')', thread + 1)
+                while thread_end >= 0:
+                    com_id = skip_spaces(line, thread_end + 1)
+                    if (com_id > thread_end + 1
+                            and line.startswith('[', com_id)):
+                        id_end = line.find(']', com_id + 1)
+                        while id_end >= 0:
+                            message = skip_spaces(line, id_end + 1)
+                            if (message > id_end + 1
+                                    and message < len(line)):
+                                return (line[com_id + 1:id_end],
+                                        line[message:], line[start:space],
+                                        line[space + 2:sender_end],
+                                        line[thread + 1:thread_end])
+                            id_end = line.find(']', id_end + 1)
+                    thread_end = line.find(')', thread_end + 1)
+            sender_end = line.find(']', sender_end + 1)
+
+
+def parse_vdsm_fields(line):
+    # (message, msg_type, sender, task, thread)
+    date_time = re_date_time.match(line)
+    if date_time is None or not line.endswith(')'):
+        return None
+    start = date_time.end()
+    end = len(line)
+    while True:
+        space = line.rfind(' (', start + 1, end)
+        if space < 0:
+            return None
+        end = space + 1
+        thread_end = line.find(')', space + 2)
+        while thread_end >= 0:
+            sender = skip_spaces(line, thread_end + 1)
+            if sender > thread_end + 1 and line.startswith('[', sender):
+                sender_end = line.find(']', sender + 1)
+                while sender_end >= 0:
+                    message = skip_spaces(line, sender_end + 1)
+                    if message > sender_end + 1:
+                        task = line.rfind(' (', message + 1, len(line) - 1)
+                        if task >= 0:
+                            return (line[message:task], line[start:space],
+                                    line[sender + 1:sender_end],
+                                    line[task + 2:-1],
+                                    line[space + 2:thread_end])
+                        if message > sender_end + 2:
+                            return None
+                    sender_end = line.find(']', sender_end + 1)
+            thread_end = line.find(')', thread_end + 1)
+
+
+def parse_libvirtd_fields(line):
+    # (code2, message, msg_type, thread)
+    date_time = re_date_time.match(line)
+    if date_time is None or not line.startswith(':', date_time.end()):
+        return None
+    thread = skip_spaces(line, date_time.end() + 1)
+    if thread == date_time.end() + 1:
+        return None
+    thread_end = len(line)
+    while True:
+        thread_end = line.rfind(': ', thread + 1, thread_end + 1)
+        if thread_end < 0:
+            return None
+        msg_type = skip_spaces(line, thread_end + 1)
+        msg_type_end = len(line)
+        while True:
+            msg_type_end = line.rfind(' : ', msg_type + 1, msg_type_end + 2)
+            if msg_type_end < 0:
+                break
+            code2 = skip_spaces(line, msg_type_end + 2)
+            code2_end = line.rfind(' : ', code2 + 1)
+            if code2_end >= 0:
+                return (line[code2:code2_end],
+                        line[skip_spaces(line, code2_end + 2):],
+                        line[msg_type:msg_type_end],
+                        line[thread:thread_end])
+            if code2 > msg_type_end + 3:
+                return None
+        if msg_type > thread_end + 2:
+            return None
+
+
+FIELDS_PARSERS = {ENGINE_TEMPLATE: parse_engine_fields,
+                  VDSM_TEMPLATE: parse_vdsm_fields,
+                  LIBVIRTD_TEMPLATE: parse_libvirtd_fields}
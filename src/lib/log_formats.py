@@ -0,0 +1,202 @@
+"""Finding formats of logfiles
+- read_templates - reads and compiles the templates of format_templates.txt
+- detect_file_format - scores the templates on lines sampled from the head
+and the middle of a logfile, returns the best template and the templates
+of the lines it does not match (for files with mixed formats)
+- Class FormatDispatcher - matches a line with the template of the file and
+falls back to the other templates whose literals are found in the line,
+the fields of the engine, vdsm and libvirtd templates are split without
+the regexp (see format_parsers)
+"""
+import os
+import re
+import hashlib
+from lib.util import open_log_file
+from lib.format_parsers import FIELDS_PARSERS
+
+
+SAMPLE_LINES = 20
+# share of the best score that the main template has to reach
+MAIN_FORMAT_SHARE = 0.5
+# share of the sampled lines that a fallback template has to match
+MIXED_FORMAT_SHARE = 0.1
+
+
+def read_templates(out_descr, templates_filename):
+    # Returns [{'name':..., 'regexp':..., 'compiled':...},...]
+    formats = open(templates_filename, 'r').read().split('\n')
+    formats_templates = []
+    format_name = ''
+    for line in formats:
+        if line[0] == '@':
+            format_name = line[1:]
+        elif line[0:2] == 'r^' and format_name != '':
+            try:
+                compiled = re.compile(line[1:])
+            except re.error:
+                out_descr.write("Wrong format of regexp: %s\n" % line[1:])
+                exit()
+            formats_templates += [{'name': format_name,
+                                   'regexp': line[1:],
+                                   'compiled': compiled}]
+            format_name = ''
+        else:
+            out_descr.write("Wrong format of template: %s\n" % line)
+    return formats_templates
+
+
+def templates_key(formats_templates):
+    # Identifies the set of templates in the file index
+    return hashlib.sha1('\n'.join([fmt['regexp'] for fmt in
+                                   formats_templates]).encode()).hexdigest()
+
+
+def required_literals(regexp):
+    # Strings that every line matched by the template contains: escaped
+    # characters outside of the groups (a quantified character counts once
+    # if it is required)
+    literals = []
+    current = ''
+    depth = 0
+    idx = 0
+    while idx < len(regexp):
+        char = regexp[idx]
+        if char == '\\' and idx + 1 < len(regexp):
+            literal = regexp[idx + 1]
+            idx += 2
+            if depth > 0:
+                continue
+            quantifier = regexp[idx] if idx < len(regexp) else ''
+            if literal.isalnum() or quantifier in ['*', '?', '{']:
+                literals += [current]
+                current = ''
+                continue
+            current += literal
+            if quantifier == '+':
+                # the last of the repeated characters is followed by the rest
+                idx += 1
+                literals += [current]
+                current = literal
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '[' and depth == 0:
+            # character classes are not literals
+            idx = regexp.index(']', idx + 2)
+        if char not in ['^', '$'] or depth > 0:
+            literals += [current]
+            current = ''
+        idx += 1
+    literals += [current]
+    return [literal for literal in literals if literal != '']
+
+
+def sample_lines(f, size, count=SAMPLE_LINES):
+    # The first count lines and count lines from the middle of a binary file
+    # (of the file on disk for compressed files) without empty lines
+    lines = []
+    for line in f:
+        if line.strip() != b'':
+            lines += [line.decode('utf-8', 'replace').strip()]
+        if len(lines) == count:
+            break
+    f.seek(size//2, os.SEEK_SET)
+    # the first line after seeking is cut
+    f.readline()
+    for line in f:
+        if line.strip() != b'':
+            lines += [line.decode('utf-8', 'replace').strip()]
+        if len(lines) == 2*count:
+            break
+    return lines
+
+
+def choose_templates(lines, formats_templates):
+    # Returns indexes of the templates of the lines. The main template is the
+    # first one (in the order of the templates file) that matches at least
+    # MAIN_FORMAT_SHARE of the lines matched by the best one, so generic
+    # templates at the end of the file are used only if nothing else fits.
+    # The fallbacks match the lines not matched yet, but not the lines of
+    # the main template (they are other formats, not generic templates)
+    matched = [set([num for num, line in enumerate(lines)
+                    if fmt['compiled'].search(line) is not None])
+               for fmt in formats_templates]
+    scores = [len(lines_set) for lines_set in matched]
+    if scores == [] or max(scores) == 0:
+        return []
+    main = [idx for idx in range(len(scores))
+            if scores[idx] >= MAIN_FORMAT_SHARE*max(scores)][0]
+    chosen = [main]
+    not_matched = set(range(len(lines))) - matched[main]
+    while True:
+        scores = [len(matched[idx] & not_matched)
+                  if idx not in chosen and len(matched[idx] & matched[main])
+                  < MAIN_FORMAT_SHARE*len(matched[main]) else 0
+                  for idx in range(len(formats_templates))]
+        if max(scores) == 0 or max(scores) < MIXED_FORMAT_SHARE*len(lines):
+            break
+        chosen += [scores.index(max(scores))]
+        not_matched -= matched[chosen[-1]]
+    return chosen
+
+
+def detect_file_format(log, formats_templates):
+    # Returns regexps of the templates of the logfile (the main one first),
+    # [] if no template matches the sampled lines, None for unknown file
+    # extension
+    f = open_log_file(log, 'rb')
+    if f is None:
+        return None
+    lines = sample_lines(f, os.path.getsize(log))
+    f.close()
+    return [formats_templates[idx]['regexp']
+            for idx in choose_templates(lines, formats_templates)]
+
+
+class FormatDispatcher:
+    # Used as the compiled regexp of a logfile format (search, pattern and
+    # groupindex of the main template)
+    def __init__(self, formats_templates, regexps):
+        templates = {fmt['regexp']: fmt for fmt in formats_templates}
+        self.name = templates[regexps[0]]['name']
+        self.main = templates[regexps[0]]['compiled']
+        self.pattern = self.main.pattern
+        self.main_fields = tuple(sorted([name for name in
+                                         self.main.groupindex.keys()
+                                         if name != 'date_time']))
+        self.main_parser = FIELDS_PARSERS.get(self.pattern)
+        self.fallbacks = [(templates[regexp]['compiled'],
+                           required_literals(regexp))
+                          for regexp in regexps[1:]]
+
+    @property
+    def groupindex(self):
+        return self.main.groupindex
+
+    def search(self, line):
+        fields = self.main.search(line)
+        if fields is not None or self.fallbacks == []:
+            return fields
+        for template, literals in self.fallbacks:
+            if all([literal in line for literal in literals]):
+                fields = template.search(line)
+                if fields is not None:
+                    return fields
+        return None
+
+    def parse(self, line):
+        # Returns (names, values) of the fields of a stripped line (without
+        # date_time) sorted by name, None if no template matches the line
+        if self.main_parser is not None:
+            values = self.main_parser(line)
+            if values is not None:
+                return self.main_fields, values
+        fields = self.search(line)
+        if fields is None:
+            return None
+        fields = fields.groupdict()
+        names = tuple(sorted([name for name in fields.keys()
+                              if name != 'date_time']))
+        return names, tuple([fields[name] for name in names])
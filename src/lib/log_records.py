@@ -0,0 +1,87 @@
+"""Logical records of logfiles
+- log_records - yields every line with a date_time together with the lines
+without it that follow the line (tracebacks, multiline messages)
+- Class LogRecord - one logical record: position and number of its first
+line, its date_time, the first line and the continuation lines
+"""
+import re
+
+
+# continuation lines kept in a record, the following ones are only counted
+# (a runaway traceback or a dump does not fill the memory)
+MAX_CONTINUATION_LINES = 10000
+
+re_continuation_strip = re.compile(r'^[\t\ \.\,\=]+|[\t\ \.\,\x00\n]+$')
+re_traceback_start = re.compile(r'^[\t\ ]*[at,Caused,\.\.\.].+')
+
+
+def strip_continuation(line):
+    return re_continuation_strip.sub(' ', line)
+
+
+def starts_traceback(line):
+    return 'Traceback' in line or re_traceback_start.match(line) is not None
+
+
+class LogRecord:
+    __slots__ = ['pos', 'line_num', 'date_time', 'line', 'continuation',
+                 'dropped']
+
+    def __init__(self, pos, line_num, date_time, line):
+        # pos - position of the first line from the beginning of the file
+        # (in bytes for a binary file, in characters for a text file),
+        # line_num - its number as counted by log_records, date_time and line
+        # are None for the lines before the first line with a date_time
+        self.pos = pos
+        self.line_num = line_num
+        self.date_time = date_time
+        self.line = line
+        # [(line_num, line),...]
+        self.continuation = []
+        self.dropped = 0
+
+    def continuation_text(self):
+        # The continuation lines stripped of the punctuation and joined
+        return ''.join([strip_continuation(line)
+                        for line_num, line in self.continuation])
+
+    @property
+    def text(self):
+        if self.line is None:
+            return self.continuation_text()
+        return self.line + self.continuation_text()
+
+
+def log_records(f, date_time, pos=0, line_num=0, skip=None, progress=None):
+    # Reads the file from its current position (pos) and yields LogRecord for
+    # every line that date_time(line) returns a date_time for (the other
+    # lines get None or 0).
+    # Lines matched by the skip regexp are not a part of any record, but they
+    # are counted in the positions and the line numbers. Lines are numbered
+    # from line_num, progress is updated with the length of every read line.
+    # The lines of a binary file are decoded, the positions are in bytes
+    record = None
+    for raw_line in f:
+        if progress is not None:
+            progress.update(len(raw_line))
+        if isinstance(raw_line, bytes):
+            line = raw_line.decode('utf-8', 'replace')
+        else:
+            line = raw_line
+        if skip is None or skip.match(line) is None:
+            dt = date_time(line)
+            if dt:
+                if record is not None:
+                    yield record
+                record = LogRecord(pos, line_num, dt, line)
+            else:
+                if record is None:
+                    record = LogRecord(pos, line_num, None, None)
+                if len(record.continuation) < MAX_CONTINUATION_LINES:
+                    record.continuation.append((line_num, line))
+                else:
+                    record.dropped += 1
+        pos += len(raw_line)
+        line_num += 1
+    if record is not None:
+        yield record
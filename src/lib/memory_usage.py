@@ -0,0 +1,121 @@
+"""Memory of the analysis
+- rss, peak_rss, reset_peak_rss - resident set size of the current process
+(from /proc on Linux, the peak falls back to getrusage elsewhere)
+- rows_size - approximate size of a list of rows of Python values
+- MemoryBudget - projects the memory of the next stage from the sizes of its
+input and chooses the low memory strategies (or the out-of-core mode) when
+the projection exceeds the limit
+"""
+import sys
+import resource
+
+
+# Python objects of the parsed messages per byte of the text they are made of
+# (the worst case when every line of a file is kept)
+PARSED_BYTES_FACTOR = 4
+# rows of the merged messages sampled to estimate their size
+SIZE_SAMPLE = 1000
+
+
+def proc_status(key):
+    # Value of a /proc/self/status field in bytes, None if not available
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    return None
+
+
+def rss():
+    value = proc_status('VmRSS')
+    if value is None:
+        return peak_rss()
+    return value
+
+
+def peak_rss():
+    value = proc_status('VmHWM')
+    if value is None:
+        # kilobytes on Linux, bytes on macOS; never reset
+        value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            value *= 1024
+    return value
+
+
+def reset_peak_rss():
+    # Linux resets the peak (VmHWM) when 5 is written to clear_refs
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def rows_size(rows):
+    # Size of the list and of its rows estimated on a sample of the rows
+    if len(rows) == 0:
+        return sys.getsizeof(rows)
+    step = max(len(rows) // SIZE_SAMPLE, 1)
+    sample = rows[::step]
+    sample_size = sum([sys.getsizeof(row) +
+                       sum([sys.getsizeof(value) for value in row])
+                       for row in sample])
+    return sys.getsizeof(rows) + sample_size*len(rows) // len(sample)
+
+
+class MemoryBudget:
+    def __init__(self, out_descr, limit=None):
+        # limit - bytes the analysis should fit in, None for no limit
+        self.out_descr = out_descr
+        self.limit = limit
+        # the merged messages are built with the low memory strategies
+        self.low_memory = False
+
+    def parallel_files(self, sizes, jobs):
+        # Number of files parsed at once so that the parsed messages of the
+        # largest ones fit in the limit with the main process
+        if self.limit is None or sizes == []:
+            return jobs
+        available = self.limit - rss()
+        largest = sorted(sizes, reverse=True)
+        parallel = min(jobs, len(largest))
+        while (parallel > 1 and PARSED_BYTES_FACTOR *
+               sum(largest[:parallel]) > available):
+            parallel -= 1
+        if parallel < min(jobs, len(largest)):
+            self.out_descr.write('Memory limit: parsing %d files at once\n' %
+                                 parallel)
+        if PARSED_BYTES_FACTOR*largest[0] > available:
+            self.out_descr.write('Memory limit: parsing the largest file ' +
+                                 'may need about %d MB\n' %
+                                 (PARSED_BYTES_FACTOR*largest[0] //
+                                  1024 // 1024))
+        return parallel
+
+    def choose_spill(self, sizes):
+        # The messages are kept on disk when even the text of the logfiles
+        # does not fit in the limit
+        if self.limit is None:
+            return False
+        if sum(sizes) <= self.limit - rss():
+            return False
+        self.out_descr.write('Memory limit: %d MB of logs are analysed out '
+                             'of core\n' % (sum(sizes) // 1024 // 1024))
+        return True
+
+    def choose_merge(self, stored_bytes):
+        # stored_bytes - size of the loaded messages in the shared memory,
+        # the merged messages take about PARSED_BYTES_FACTOR times more
+        if self.limit is None:
+            return
+        projected = rss() + PARSED_BYTES_FACTOR*stored_bytes
+        if projected > self.limit:
+            self.low_memory = True
+            self.out_descr.write('Memory limit: merging the messages of %d '
+                                 'MB (about %d MB projected) in low memory '
+                                 'mode\n' % (stored_bytes // 1024 // 1024,
+                                             projected // 1024 // 1024))
@@ -0,0 +1,70 @@
+"""Collecting parser warnings in worker processes
+- WarningCollector - counts warnings per kind for one logfile and keeps a
+limited number of sample lines for each kind
+- print_warnings - aggregates the collected warnings per kind and format
+"""
+
+# warning kinds
+NO_DATE_TIME = 'Line does not have date_time field'
+DATE_TIME_FORMAT = 'Unknown date_time format'
+FORMAT_MISMATCH = 'Line does not match format'
+NO_MESSAGE = 'Line does not have message field'
+TRACEBACK_MATCHED = 'Traceback matched'
+MULTILINE_MATCHED = 'Multiline matched'
+TRUNCATED_RECORD = 'Too many lines without date_time'
+
+SAMPLE_LENGTH = 200
+
+
+class WarningCollector:
+    __slots__ = ['log', 'format_name', 'limit', 'counts', 'samples']
+
+    def __init__(self, log, format_name, limit):
+        self.log = log
+        self.format_name = format_name
+        self.limit = limit
+        self.counts = {}
+        self.samples = {}
+
+    def add(self, kind, line_num, line):
+        count = self.counts.get(kind, 0)
+        self.counts[kind] = count + 1
+        if count >= self.limit:
+            return
+        if count == 0:
+            self.samples[kind] = []
+        # line_num is a line number or a "log:line_num" string
+        if isinstance(line_num, str):
+            line_num = int(line_num.rpartition(':')[2])
+        self.samples[kind] += [(line_num, line[:SAMPLE_LENGTH].rstrip())]
+
+
+def print_warnings(out_descr, collectors):
+    total = {}
+    by_format = {}
+    for collector in collectors:
+        if collector.format_name not in by_format.keys():
+            by_format[collector.format_name] = {}
+        for kind, count in collector.counts.items():
+            total[kind] = total.get(kind, 0) + count
+            by_format[collector.format_name][kind] = \
+                by_format[collector.format_name].get(kind, 0) + count
+    if total == {}:
+        return
+    out_descr.write('------- Parser warnings -------\n')
+    for kind in sorted(total.keys()):
+        out_descr.write('%s: %d\n' % (kind, total[kind]))
+    out_descr.write('------- Parser warnings by format -------\n')
+    for format_name in sorted(by_format.keys()):
+        if by_format[format_name] == {}:
+            continue
+        out_descr.write('%s:\n' % format_name)
+        for kind in sorted(by_format[format_name].keys()):
+            out_descr.write('    %s: %d\n' %
+                            (kind, by_format[format_name][kind]))
+    out_descr.write('------- Parser warnings samples -------\n')
+    for collector in collectors:
+        for kind in sorted(collector.samples.keys()):
+            for line_num, line in collector.samples[kind]:
+                out_descr.write('%s:%d: %s: %s\n' % (collector.log, line_num,
+                                                     kind, line))
@@ -0,0 +1,102 @@
+"""Progress accounting for worker processes
+- ProgressCounters - shared array with a counter of processed bytes per slot
+(one slot per logfile), read by the parent process
+- ProgressReporter - worker side accumulator that adds its bytes to the
+shared counter only every PROGRESS_STEP bytes
+- reset_read_totals, read_totals - bytes and lines read by the reporters of
+the current process (for the statistics of every file)
+- throttled - passes tasks to a pool only while it runs fewer than a number
+of them
+"""
+import multiprocessing
+
+
+PROGRESS_STEP = 256*1024
+REFRESH_INTERVAL = 0.5
+
+# shared counters of the current worker process (see init_worker)
+counters = None
+# [bytes, lines] flushed by all the reporters of the current process
+totals = [0, 0]
+
+
+def init_worker(values):
+    global counters
+    counters = values
+
+
+class ProgressCounters:
+    def __init__(self, size):
+        # every slot is written by one task only, so no lock is needed
+        self.values = multiprocessing.RawArray('q', max(size, 1))
+
+    def reset(self):
+        for slot in range(len(self.values)):
+            self.values[slot] = 0
+
+    def position(self, slot):
+        return self.values[slot]
+
+    def total(self):
+        return sum(self.values)
+
+
+def reset_read_totals():
+    totals[0] = 0
+    totals[1] = 0
+
+
+def read_totals():
+    return totals[0], totals[1]
+
+
+class ProgressReporter:
+    __slots__ = ['slot', 'step', 'pending', 'pending_lines', 'values']
+
+    def __init__(self, slot, step=PROGRESS_STEP):
+        self.slot = slot
+        self.step = step
+        self.pending = 0
+        self.pending_lines = 0
+        self.values = counters
+
+    def update(self, processed):
+        # called once for every read line
+        self.pending += processed
+        self.pending_lines += 1
+        if self.pending >= self.step:
+            self.flush()
+
+    def flush(self):
+        if self.values is not None and self.slot < len(self.values):
+            self.values[self.slot] += self.pending
+        totals[0] += self.pending
+        totals[1] += self.pending_lines
+        self.pending = 0
+        self.pending_lines = 0
+
+
+def throttled(tasks, slots):
+    # Yields the tasks while a slot of the semaphore is free, the consumer of
+    # the results releases a slot for every result
+    for task in tasks:
+        slots.acquire()
+        yield task
+
+
+def collect_results(workers, refresh, done=None):
+    # Gather results of Pool.imap calling refresh() at a fixed rate and
+    # done() after every result
+    result = []
+    while True:
+        try:
+            result += [workers.next(REFRESH_INTERVAL)]
+            if done is not None:
+                done()
+        except multiprocessing.TimeoutError:
+            pass
+        except StopIteration:
+            break
+        refresh()
+    refresh()
+    return result
@@ -1,7 +1,126 @@
 """Saving received information about log lines
+- ReportWriter - writes the rows of a report aligned as text or as JSON
+lines, CSV or TSV, in large buffered writes
+- TimeFormatter - formats the times of the messages, the strings of a
+second are computed once
+- print_only_dt_message - the report of the shown messages
 """
 from datetime import datetime
-import os
+import csv
+import json
+import math
+
+
+REPORT_FORMATS = ['text', 'jsonl', 'csv', 'tsv']
+# rows joined into one write
+WRITE_ROWS = 4096
+# seconds kept by TimeFormatter
+TIMES_MEMO = 65536
+
+
+class TimeFormatter:
+    def __init__(self):
+        # second: (time, date, ISO date and time) without the milliseconds
+        self.seconds = {}
+
+    def split(self, date_time):
+        # The second and the milliseconds the way datetime.utcfromtimestamp
+        # rounds them
+        frac, second = math.modf(date_time)
+        us = round(frac * 1e6)
+        if us >= 1000000:
+            second += 1
+            us -= 1000000
+        elif us < 0:
+            second -= 1
+            us += 1000000
+        second = int(second)
+        if second not in self.seconds:
+            if len(self.seconds) >= TIMES_MEMO:
+                self.seconds = {}
+            dt = datetime.utcfromtimestamp(second)
+            self.seconds[second] = (dt.strftime("%H:%M:%S"),
+                                    dt.strftime("%d-%m-%Y"),
+                                    dt.strftime("%Y-%m-%dT%H:%M:%S"))
+        return self.seconds[second], us // 1000
+
+    def text(self, date_time):
+        # '%H:%M:%S,%f'[:-3] and '%d-%m-%Y'
+        (hms, dmy, iso), ms = self.split(date_time)
+        return '%s,%03d' % (hms, ms), dmy
+
+    def iso(self, date_time):
+        # the format of the time ranges of analyze_logs.py
+        (hms, dmy, iso), ms = self.split(date_time)
+        return '%s,%03d' % (iso, ms)
+
+
+class ReportWriter:
+    # fields - names of the columns, the first one is the time of the
+    # message and the last one is the message
+    # widths - widths of the columns between them in the text format (right
+    # aligned), titles - the header of the text format (None for no header)
+    def __init__(self, out, fields, report_format='text', widths=None,
+                 titles=None):
+        self.out = out
+        self.fields = fields
+        self.report_format = report_format
+        self.widths = widths
+        self.times = TimeFormatter()
+        self.buffer = []
+        if report_format in ['csv', 'tsv']:
+            self.csv = csv.writer(self, dialect='excel' if
+                                  report_format == 'csv' else 'excel-tab',
+                                  lineterminator='\n')
+            self.csv.writerow(fields)
+        elif report_format == 'text' and titles is not None:
+            self.buffer += ["%23s" % titles[0] +
+                            ''.join([' | %*s' % (width, title)
+                                     for width, title in
+                                     zip(widths, titles[1:-1])]) +
+                            ' | %s\n' % titles[-1],
+                            '-'*(29 + sum(widths) + 50)+'\n']
+
+    def write(self, data):
+        # the csv writer writes to the buffer
+        self.buffer.append(data)
+
+    def add(self, date_time, values):
+        # values - the values of the columns after the time
+        if self.report_format == 'text':
+            time, date = self.times.text(date_time)
+            self.buffer.append('%12s %s' % (time, date) +
+                               ''.join([' | %*s' % (width, value)
+                                        for width, value in
+                                        zip(self.widths, values)]) +
+                               ' | %s\n' % values[-1])
+        elif self.report_format == 'jsonl':
+            self.buffer.append(json.dumps(dict(zip(
+                self.fields, [self.times.iso(date_time)] + values))) + '\n')
+        else:
+            self.csv.writerow([self.times.iso(date_time)] + values)
+        if len(self.buffer) >= WRITE_ROWS:
+            self.flush()
+
+    def flush(self):
+        self.out.write(''.join(self.buffer))
+        self.buffer = []
+
+
+def report_filename(name, report_format):
+    # name of a report file without the extension
+    if report_format == 'text':
+        return name + '.txt'
+    return name + '.' + report_format
+
+
+def line_path(directory, line_num):
+    # os.path.join of the directory and the line_num
+    if line_num.startswith('/'):
+        return line_num
+    if directory == '' or directory.endswith('/'):
+        return directory + line_num
+    return directory + '/' + line_num
 
 
 def print_all_headers(directory, errors, headers, log_format_headers, out):
@@ -18,8 +137,19 @@ def print_all_headers(directory, errors, headers, log_format_headers, out):
         out.write("\n")
 
 
-def print_only_dt_message(directory, errors, new_fields, out):
-    if errors == []:
+def message_reason(err, reason_idx, details_idx):
+    if err[details_idx] == '':
+        return err[reason_idx]
+    if err[reason_idx] == '':
+        return err[details_idx]
+    return err[reason_idx] + ';' + err[details_idx]
+
+
+def print_only_dt_message(directory, errors, new_fields, out,
+                          report_format='text'):
+    # errors - a list or the rows of a run file (read once to find the width
+    # of the columns in the text format and once to write them)
+    if len(errors) == 0:
         return
 
     dt_idx = new_fields.index("date_time")
@@ -27,23 +157,41 @@ def print_only_dt_message(directory, errors, new_fields, out):
     msg_idx = new_fields.index("message")
     reason_idx = new_fields.index("reason")
     details_idx = new_fields.index("details")
-    reason = [err[reason_idx]
-              if err[details_idx] == ''
-              else err[details_idx] if err[reason_idx] == ''
-              else err[reason_idx] + ';' + err[details_idx]
-              for err in errors]
-    linenum_len = max(len(os.path.join(directory, err[line_idx]))
-                      for err in errors)
-    full_reason_len = max([len(reason[r]) for r in range(len(reason))])
-    out.write("%23s | %*s | %*s | %s\n" % ('Date+Time',
-              linenum_len, 'Line', full_reason_len,
-              'Reason', 'Message'))
-    out.write('-'*(29+linenum_len+full_reason_len+50)+'\n')
-    for idx, err in enumerate(errors):
-        out.write("%12s %s | %*s | %*s | %s\n" %
-                  (datetime.utcfromtimestamp(err[dt_idx]).strftime(
-                   "%H:%M:%S,%f")[:-3],
-                   datetime.utcfromtimestamp(err[dt_idx]).strftime(
-                   "%d-%m-%Y"),
-                   linenum_len, os.path.join(directory, err[line_idx]),
-                   full_reason_len, reason[idx], err[msg_idx]))
+    # the time range tags follow the line with several time ranges
+    ranges = []
+    if "time_ranges" in new_fields:
+        ranges = ["time_ranges"]
+    ranges_idx = [new_fields.index(field) for field in ranges]
+    if report_format != 'text':
+        writer = ReportWriter(out, ['date_time', 'line_num'] + ranges +
+                              ['reason', 'details', 'message'],
+                              report_format)
+        for err in errors:
+            writer.add(err[dt_idx], [line_path(directory, err[line_idx])] +
+                       [err[idx] for idx in ranges_idx] +
+                       [err[reason_idx], err[details_idx], err[msg_idx]])
+        writer.flush()
+        return
+    linenum_len = 0
+    ranges_len = [len('Ranges') for idx in ranges_idx]
+    full_reason_len = 0
+    for err in errors:
+        linenum_len = max(linenum_len,
+                          len(line_path(directory, err[line_idx])))
+        ranges_len = [max(width, len(err[idx]))
+                      for width, idx in zip(ranges_len, ranges_idx)]
+        full_reason_len = max(full_reason_len,
+                              len(message_reason(err, reason_idx,
+                                                 details_idx)))
+    writer = ReportWriter(out, ['date_time', 'line_num'] + ranges +
+                          ['reason', 'message'], report_format,
+                          [linenum_len] + ranges_len + [full_reason_len],
+                          ['Date+Time', 'Line'] +
+                          ['Ranges' for idx in ranges_idx] +
+                          ['Reason', 'Message'])
+    for err in errors:
+        writer.add(err[dt_idx], [line_path(directory, err[line_idx])] +
+                   [err[idx] for idx in ranges_idx] +
+                   [message_reason(err, reason_idx, details_idx),
+                    err[msg_idx]])
+    writer.flush()
@@ -0,0 +1,108 @@
+"""Passing parsed log lines from worker processes through shared memory
+- store_rows - packs rows into a shared memory segment (one column after
+another) and returns a small picklable descriptor
+- SharedRows - read-only sequence of rows mapped from the segment
+"""
+from array import array
+from itertools import accumulate
+from multiprocessing import shared_memory, resource_tracker
+
+
+ALIGN = 8
+
+
+def aligned(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def store_rows(rows, fields_names):
+    # Column kinds: 'd' - float64 values (date_time),
+    #               's' - utf-8 strings with int64 offsets
+    columns = []
+    size = 0
+    for col in range(len(fields_names)):
+        values = [row[col] for row in rows]
+        if all([isinstance(v, float) for v in values]):
+            columns += [['d', array('d', values), None, size, 0, 0]]
+            size += aligned(8*len(values))
+        else:
+            data = [str(v).encode('utf-8', 'surrogateescape')
+                    for v in values]
+            offsets = array('q', [0])
+            offsets.extend(accumulate([len(d) for d in data]))
+            data = b''.join(data)
+            data_offset = size + aligned(8*len(offsets))
+            columns += [['s', offsets, data, size, data_offset, len(data)]]
+            size = data_offset + aligned(len(data))
+    descriptor = {'name': None,
+                  'rows': len(rows),
+                  'fields': fields_names,
+                  'columns': [c[0:1] + c[3:] for c in columns]}
+    if rows == [] or size == 0:
+        return descriptor
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    # the parent process is responsible for unlinking the segment
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    for kind, values, data, offset, data_offset, data_size in columns:
+        view = shm.buf[offset:offset + 8*len(values)].cast(values.typecode)
+        view[:] = values
+        view.release()
+        if kind == 's':
+            shm.buf[data_offset:data_offset + data_size] = data
+    descriptor['name'] = shm.name
+    shm.close()
+    return descriptor
+
+
+class SharedRows:
+    def __init__(self, descriptor):
+        self.fields_names = descriptor['fields']
+        self.rows = descriptor['rows']
+        self.columns = []
+        self.shm = None
+        if descriptor['name'] is None:
+            return
+        self.shm = shared_memory.SharedMemory(name=descriptor['name'])
+        for kind, offset, data_offset, data_size in descriptor['columns']:
+            if kind == 'd':
+                values = self.shm.buf[offset:offset +
+                                      8*self.rows].cast('d')
+                self.columns += [(kind, values, None)]
+            else:
+                offsets = self.shm.buf[offset:offset +
+                                       8*(self.rows + 1)].cast('q')
+                data = self.shm.buf[data_offset:data_offset + data_size]
+                self.columns += [(kind, offsets, data)]
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.rows
+        if idx < 0 or idx >= self.rows:
+            raise IndexError('SharedRows index out of range')
+        row = []
+        for kind, values, data in self.columns:
+            if kind == 'd':
+                row += [values[idx]]
+            else:
+                row += [str(data[values[idx]:values[idx + 1]], 'utf-8',
+                            'surrogateescape')]
+        return row
+
+    def __iter__(self):
+        for idx in range(self.rows):
+            yield self[idx]
+
+    def close(self):
+        if self.shm is None:
+            return
+        for kind, values, data in self.columns:
+            values.release()
+            if data is not None:
+                data.release()
+        self.columns = []
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
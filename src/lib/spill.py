@@ -0,0 +1,123 @@
+"""Keeping rows on disk when they do not fit in memory (the out-of-core mode)
+- write_run - writes rows to a run file in chunks and returns a small
+picklable descriptor
+- SpilledRows - sequence of the rows of a run file that is read one chunk at
+a time (every iteration reads the file again)
+- RunWriter - appends rows to a run file one by one
+- external_sort - sorts rows that do not fit in memory: sorted runs of a
+bounded number of rows are merged with heapq
+- stored_values - converts the values of a logfile's rows the way the shared
+memory rows do (see shared_rows.store_rows) so that both modes give the same
+output
+"""
+import os
+import heapq
+import pickle
+import tempfile
+
+
+# rows pickled together, every reader holds one chunk of its run file
+CHUNK_ROWS = 10000
+# rows sorted in memory by external_sort before they are spilled
+RUN_ROWS = 100000
+
+
+def stored_values(rows, fields_names):
+    # Columns of floats stay floats, the values of the other columns become
+    # strings, only the columns of the fields are kept
+    floats = [all([isinstance(row[col], float) for row in rows])
+              for col in range(len(fields_names))]
+    return [[row[col] if floats[col] else str(row[col])
+             for col in range(len(fields_names))] for row in rows]
+
+
+class RunWriter:
+    def __init__(self, directory, prefix='run_'):
+        fd, self.path = tempfile.mkstemp(prefix=prefix, suffix='.pckl',
+                                         dir=directory)
+        self.f = os.fdopen(fd, 'wb')
+        self.chunk = []
+        self.rows = 0
+
+    def add(self, row):
+        self.chunk += [row]
+        self.rows += 1
+        if len(self.chunk) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.chunk != []:
+            pickle.dump(self.chunk, self.f, pickle.HIGHEST_PROTOCOL)
+            self.chunk = []
+
+    def close(self, fields_names=None):
+        # Returns the descriptor of the run file
+        self.flush()
+        self.f.close()
+        return {'run': self.path, 'rows': self.rows, 'fields': fields_names}
+
+
+def write_run(directory, rows, fields_names, prefix='run_'):
+    writer = RunWriter(directory, prefix)
+    for row in rows:
+        writer.add(row)
+    return writer.close(fields_names)
+
+
+class SpilledRows:
+    def __init__(self, descriptor):
+        self.path = descriptor['run']
+        self.rows = descriptor['rows']
+        self.fields_names = descriptor['fields']
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        if self.path is None:
+            return
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    return
+                yield from chunk
+
+    def size(self):
+        # bytes on disk
+        if self.path is None:
+            return 0
+        return os.path.getsize(self.path)
+
+    def close(self):
+        if self.path is None:
+            return
+        os.remove(self.path)
+        self.path = None
+
+
+def external_sort(rows, key, directory, run_rows=RUN_ROWS):
+    # Yields the rows sorted by key (stable like sorted), at most run_rows
+    # rows and a chunk of every run are kept in memory
+    runs = []
+    chunk = []
+    try:
+        for row in rows:
+            chunk += [row]
+            if len(chunk) >= run_rows:
+                runs += [SpilledRows(write_run(directory,
+                                               sorted(chunk, key=key), None,
+                                               'sort_'))]
+                chunk = []
+        if runs == []:
+            yield from sorted(chunk, key=key)
+            return
+        runs += [sorted(chunk, key=key)]
+        chunk = []
+        # heapq.merge keeps the order of the runs for equal keys
+        yield from heapq.merge(*runs, key=key)
+    finally:
+        for run in runs:
+            if isinstance(run, SpilledRows):
+                run.close()
@@ -0,0 +1,134 @@
+"""Time and memory of the stages of the analysis
+- StageTimings - wall and CPU time and the memory of every stage of
+LogAnalyzer with the statistics of the files the stage processed in the
+workers (kept by the executor), optionally one stage is profiled with
+cProfile in the parent and in the workers
+- timed_stage - decorator of the LogAnalyzer methods that are stages
+"""
+import os
+import glob
+import json
+import time
+import pstats
+import cProfile
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from lib.memory_usage import rss, peak_rss, reset_peak_rss
+
+
+STAGES = ['read_time_ranges', 'find_vms_and_hosts', 'find_vm_tasks',
+          'find_real_line_num', 'load_data', 'merge_all_messages',
+          'find_important_events', 'print_errors', 'export_columns']
+
+
+def timed_stage(method):
+    # the method runs as the stage of its name in self.timings
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.timings.stage(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class StageTimings:
+    def __init__(self, executor, profile_stage=None, profile_prefix=None):
+        # profile_prefix - path prefix of the statistics of the profiled
+        # stage: <prefix>.pstats of the parent, <prefix>_workers.pstats of
+        # the workers
+        self.executor = executor
+        self.profile_stage = profile_stage
+        self.profile_prefix = profile_prefix
+        # [(stage, wall time, CPU time of the parent, [executor stages],
+        # memory of the parent),...]
+        self.stages = []
+        # stage: records of the stages that run in the parent
+        self.records = {}
+        # stage: {structure: bytes} of the structures the stage left in the
+        # parent
+        self.holders = {}
+
+    @contextmanager
+    def stage(self, name):
+        first = len(self.executor.stages)
+        profiler = None
+        if name == self.profile_stage:
+            profiler = cProfile.Profile()
+            self.executor.profile = self.profile_prefix + '_workers'
+            profiler.enable()
+        rss_before = rss()
+        reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.time()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.time() - start
+            cpu = time.process_time() - cpu
+            memory = {'rss_before': rss_before, 'rss_after': rss(),
+                      'peak_rss': peak_rss(),
+                      'traced_peak': tracemalloc.get_traced_memory()[1]
+                      if tracemalloc.is_tracing() else None}
+            if profiler is not None:
+                profiler.disable()
+                self.executor.profile = None
+                self.dump_profiles(profiler)
+            self.stages += [(name, wall, cpu, self.executor.stages[first:],
+                             memory)]
+
+    def count(self, name, records):
+        self.records[name] = records
+
+    def hold(self, name, holders):
+        self.holders[name] = holders
+
+    def dump_profiles(self, profiler):
+        profiler.dump_stats(self.profile_prefix + '.pstats')
+        # the statistics of every batch of the workers are joined
+        parts = glob.glob(glob.escape(self.profile_prefix) + '_workers.*.*')
+        if parts == []:
+            return
+        pstats.Stats(*parts).dump_stats(self.profile_prefix +
+                                        '_workers.pstats')
+        for part in parts:
+            os.remove(part)
+
+    def report(self):
+        # {stage: {'wall_seconds', 'cpu_seconds' (the parent and the
+        # workers), 'parent_cpu_seconds', 'bytes', 'lines', 'records',
+        # 'rss_before', 'rss_after', 'peak_rss', 'traced_peak' (of the
+        # parent), 'workers_peak_rss', 'holders': {structure: bytes},
+        # 'files': {executor stage: [statistics of every file]}}}
+        report = {}
+        for name, wall, cpu, executor_stages, memory in self.stages:
+            files = dict([(executor_stage,
+                           [stats for stats in
+                            self.executor.files_stats[executor_stage]
+                            if stats is not None])
+                          for executor_stage in executor_stages])
+            all_files = [stats for executor_stage in files.keys()
+                         for stats in files[executor_stage]]
+            records = [stats['records'] for stats in all_files
+                       if stats['records'] is not None]
+            report[name] = {
+                'wall_seconds': wall,
+                'cpu_seconds': cpu + sum([stats['cpu_seconds']
+                                          for stats in all_files]),
+                'parent_cpu_seconds': cpu,
+                'bytes': sum([stats['bytes'] for stats in all_files]),
+                'lines': sum([stats['lines'] for stats in all_files]),
+                'records': self.records.get(name, sum(records)
+                                            if records != [] else None),
+                'workers_peak_rss': max([stats['peak_rss']
+                                         for stats in all_files],
+                                        default=None),
+                'holders': self.holders.get(name, {}),
+                'files': files}
+            report[name].update(memory)
+        return report
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=4, sort_keys=True)
@@ -3,10 +3,12 @@ import lzma
 import os
 
 
-def open_log_file(file_name):
+REVERSE_BLOCK_SIZE = 64*1024
+
+
+def open_log_file(file_name, mode='rt'):
     if '.log' not in os.path.basename(file_name):
         return None
-    mode = 'rt'
     if file_name.endswith('.xz'):
         f = lzma.open(file_name, mode)
     elif file_name.endswith('.gz'):
@@ -14,3 +16,20 @@ def open_log_file(file_name):
     else:
         f = open(file_name, mode)
     return f
+
+
+def reverse_lines(f, block_size=REVERSE_BLOCK_SIZE):
+    # Yields lines of a binary file starting from the last one. The file is
+    # read backwards by blocks, so a compressed file is decompressed only a
+    # few times instead of once per character
+    end = f.seek(0, os.SEEK_END)
+    rest = b''
+    while end > 0:
+        start = max(end - block_size, 0)
+        f.seek(start, os.SEEK_SET)
+        lines = (f.read(end - start) + rest).split(b'\n')
+        end = start
+        rest = lines[0]
+        for line in reversed(lines[1:]):
+            yield line.decode('utf-8', 'replace')
+    yield rest.decode('utf-8', 'replace')
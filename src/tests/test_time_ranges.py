@@ -0,0 +1,84 @@
+"""Time range tags of the messages (several --time_range pairs)
+
+Run from the src directory:
+python3 -m unittest discover -s tests
+"""
+import os
+import re
+import csv
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ENGINE_LINE = ("2017-05-12 03:%02d:%02d,%03d-04 INFO  " +
+               "[org.ovirt.engine.core.bll.X] (default task-%d) [flow%d] " +
+               "Some ordinary message number %d about things %s\n")
+# a line with a date_time that does not match the engine template: it is
+# joined to the line before it as a multiline message
+MISMATCH_LINE = "2017-05-12 03:05:40,000-04 garbage ERROR line\n"
+# two overlapping time ranges (UTC)
+TIME_RANGES = ['2017-05-12T07:00:00,000', '2017-05-12T07:06:00,000',
+               '2017-05-12T07:04:00,000', '2017-05-12T07:10:00,000']
+re_tags = re.compile(r'^[0-9]+(;[0-9]+)*$')
+
+
+def write_engine_log(filename):
+    with open(filename, 'w') as f:
+        for idx in range(60):
+            # the messages without a reason go to _frequent
+            f.write(ENGINE_LINE % (idx // 6, idx % 6 * 10, idx, idx % 5,
+                                   idx, idx,
+                                   'done' if idx % 2 else 'WARN: slow'))
+            if idx == 33:
+                f.write(MISMATCH_LINE)
+
+
+class TimeRangeTagsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='test_time_ranges_')
+        self.logs = os.path.join(self.directory, 'logs') + os.sep
+        self.output = os.path.join(self.directory, 'output')
+        os.makedirs(self.logs)
+        write_engine_log(os.path.join(self.logs, 'engine.log'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def analyze(self, *args):
+        subprocess.run([sys.executable, 'analyze_logs.py', self.logs,
+                        '-d', self.output, '-o', 'result.csv',
+                        '--report_format', 'csv', '-t'] + TIME_RANGES +
+                       list(args), cwd=SRC, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        rows = []
+        for filename in ['result.csv', 'logs_frequent.csv']:
+            with open(os.path.join(self.output, filename)) as f:
+                rows += list(csv.DictReader(f))
+        return rows
+
+    def check_tags(self, rows):
+        self.assertNotEqual(rows, [])
+        for row in rows:
+            self.assertRegex(row['time_ranges'], re_tags)
+        tags = set([row['time_ranges'] for row in rows])
+        self.assertEqual(tags, set(['1', '1;2', '2']))
+        # the line before the line that does not match the template gives
+        # its fields to the multiline message, both are tagged alike
+        joined = [row['time_ranges'] for row in rows
+                  if row['line_num'].endswith('engine.log:34')]
+        self.assertNotEqual(joined, [])
+        self.assertEqual(set(joined), set(['1;2']))
+
+    def test_format_mismatch_line(self):
+        self.check_tags(self.analyze())
+
+    def test_format_mismatch_line_out_of_core(self):
+        self.check_tags(self.analyze('--out_of_core'))
+
+
+if __name__ == '__main__':
+    unittest.main()